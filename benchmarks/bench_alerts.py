@@ -0,0 +1,41 @@
+"""
+Measures the throughput of AlertEngine with the default rules, in readings per second, for a
+growing number of readings per patient: the cost of a reading should not grow with history.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_alerts --rows 100000 --patients 50 5000
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_bulk_insert import make_rows
+from src import alerts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--patients", type=int, nargs="+", default=[50, 5_000])
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{'patients':>10} {'readings/patient':>17} {'time':>9} {'readings/s':>12} {'alerts':>9}")
+    for patients in args.patients:
+        records = [{**row, "patient_id": position % patients} for position, row in enumerate(rows)]
+        sink = alerts.InMemorySink()
+        engine = alerts.AlertEngine(sink=sink)
+
+        start = time.perf_counter()
+        engine.process_batch(records)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{patients:>10,} {args.rows // patients:>17,} {elapsed:>8.3f}s "
+            f"{args.rows / elapsed:>12,.0f} {sink.emitted:>9,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
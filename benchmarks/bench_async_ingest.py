@@ -0,0 +1,91 @@
+"""
+Submits thousands of concurrent add_record coroutines through AsyncDatabaseManager and
+measures how long the event loop stalls, compared with calling the blocking
+DatabaseManager.add_record from a coroutine.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_async_ingest --rows 5000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import typing as t
+
+from benchmarks.bench_bulk_insert import VITALS_COLUMNS, make_rows
+from src.async_database import AsyncDatabaseManager
+from src.database import DatabaseManager
+
+TICK = 0.001
+
+
+async def heartbeat(stop: asyncio.Event, lags: t.List[float]) -> None:
+    """Sleeps TICK in a loop and records how late every wake-up is."""
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def ingest(
+    submit: t.Callable[[t.Dict], t.Awaitable[None]], rows: t.List[t.Dict], wave: int
+) -> t.Tuple[float, float, float]:
+    """Starts wave submissions per loop iteration, like a gateway receiving bursts of readings."""
+
+    stop = asyncio.Event()
+    lags: t.List[float] = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    tasks = []
+    for offset in range(0, len(rows), wave):
+        tasks.extend(asyncio.create_task(submit(row)) for row in rows[offset:offset + wave])
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await beat
+    lags.sort()
+    return elapsed, lags[int(len(lags) * 0.99)] if lags else elapsed, lags[-1] if lags else elapsed
+
+
+async def main_async(rows: t.List[t.Dict], wave: int, directory: str) -> None:
+    blocking_db = DatabaseManager(os.path.join(directory, "blocking.db"))
+    blocking_db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+
+    async def blocking(row: t.Dict) -> None:
+        blocking_db.add_record(table_name="vitals", data=row)
+
+    db = DatabaseManager(os.path.join(directory, "async.db"))
+    db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+    async_db = AsyncDatabaseManager(db)
+
+    async def non_blocking(row: t.Dict) -> None:
+        await async_db.add_record(table_name="vitals", data=row)
+
+    print(f"{'path':>22} {'rows/sec':>10} {'p99 loop stall':>16} {'max loop stall':>16}")
+    for name, submit in (("DatabaseManager", blocking), ("AsyncDatabaseManager", non_blocking)):
+        elapsed, p99, stall = await ingest(submit, rows, wave)
+        print(f"{name:>22} {len(rows) / elapsed:>10,.0f} {p99 * 1000:>14.1f}ms {stall * 1000:>14.1f}ms")
+
+    async_db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--wave", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(main_async(make_rows(args.rows), args.wave, directory))
+
+
+if __name__ == "__main__":
+    main()
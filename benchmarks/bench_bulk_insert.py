@@ -0,0 +1,114 @@
+"""
+Compares the insert throughput of DatabaseManager.add_record (one autocommit
+transaction per row) with DatabaseManager.add_records (executemany in batched
+transactions) on a database file, so the cost of every commit is included.
+The vitals table is created as the application creates it, with its indexes
+and the triggers of the rollups, latest_vitals and analytics tables, unless
+--bare is given.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_bulk_insert --rows 5000 --batch-size 500
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import typing as t
+
+from datetime import datetime, timedelta
+
+from benchmarks.suite import using_database
+from src import commands
+from src.database import DatabaseManager, DEFAULT_BATCH_SIZE
+
+VITALS_COLUMNS = {
+    'record_id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+    'patient_id': 'INTEGER NOT NULL',
+    'date': 'TEXT NOT NULL',
+    'heart_rate': 'INTEGER',
+    'systolic': 'INTEGER',
+    'diastolic': 'INTEGER',
+    'respiratory_rate': 'INTEGER',
+    'oxygen_saturation': 'REAL',
+    'temperature': 'REAL',
+    'news2': 'INTEGER'
+}
+
+
+def iter_rows(count: int) -> t.Iterator[t.Dict[str, t.Union[str, int, float]]]:
+    rng = random.Random(42)
+    start = datetime(2023, 1, 1)
+    for i in range(count):
+        yield {
+            "patient_id": rng.randint(1, 50),
+            "date": (start + timedelta(seconds=5 * i)).isoformat(),
+            "heart_rate": rng.randint(55, 110),
+            "systolic": rng.randint(100, 140),
+            "diastolic": rng.randint(60, 90),
+            "respiratory_rate": rng.randint(10, 24),
+            "oxygen_saturation": round(rng.uniform(91, 100), 1),
+            "temperature": round(rng.uniform(35.8, 38.5), 1),
+        }
+
+
+def make_rows(count: int) -> t.List[t.Dict[str, t.Union[str, int, float]]]:
+    return list(iter_rows(count))
+
+
+def fresh_database(directory: str, name: str) -> DatabaseManager:
+    db = DatabaseManager(os.path.join(directory, name))
+    db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+    return db
+
+
+def migrated_database(directory: str, name: str) -> DatabaseManager:
+    """Creates the vitals table with CreateVitalSignsTableCommand, as the application does."""
+
+    db = DatabaseManager(os.path.join(directory, name))
+    with using_database(db):
+        commands.CreateVitalSignsTableCommand().execute()
+    return db
+
+
+def bench_per_row(directory: str, rows: t.List[t.Dict], bare: bool = False) -> float:
+    db = (fresh_database if bare else migrated_database)(directory, "per_row.db")
+    start = time.perf_counter()
+    for row in rows:
+        db.add_record(table_name="vitals", data=row)
+    return time.perf_counter() - start
+
+
+def bench_bulk(directory: str, rows: t.List[t.Dict], batch_size: int, bare: bool = False) -> float:
+    db = (fresh_database if bare else migrated_database)(directory, "bulk.db")
+    start = time.perf_counter()
+    db.add_records(table_name="vitals", rows=rows, batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--bare", action="store_true", help="insert into the vitals table alone, without indexes or triggers"
+    )
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        per_row = bench_per_row(directory, rows, args.bare)
+        bulk = bench_bulk(directory, rows, args.batch_size, args.bare)
+
+    schema = "bare table" if args.bare else "migrated schema"
+    print(f"rows: {args.rows}, batch size: {args.batch_size}, {schema}")
+    print(f"add_record  : {args.rows / per_row:12,.0f} rows/sec ({per_row:.3f}s)")
+    print(f"add_records : {args.rows / bulk:12,.0f} rows/sec ({bulk:.3f}s)")
+    print(f"speed-up    : {per_row / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares building a vitals DataFrame from fetchall() tuples with building it from the typed
+NumPy arrays of DatabaseManager.fetch_columns: wall time and peak traced memory.
+
+Run from the repository root (needs numpy and pandas):
+
+    python -m benchmarks.bench_columnar --rows 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import typing as t
+
+import pandas as pd
+
+from benchmarks.bench_bulk_insert import VITALS_COLUMNS, iter_rows
+from src import columnar
+from src.database import DatabaseManager
+
+
+def tuple_path(db: DatabaseManager) -> pd.DataFrame:
+    data = db.select_record(table_name="vitals", order_by="date").fetchall()
+    return pd.DataFrame(data, columns=list(VITALS_COLUMNS))
+
+
+def columnar_path(db: DatabaseManager) -> pd.DataFrame:
+    return columnar.vitals_dataframe(db)
+
+
+def measure(build: t.Callable[[], pd.DataFrame]) -> t.Tuple[float, int, int]:
+    """Times a build, then repeats it under tracemalloc, whose hooks would skew the timing."""
+
+    start = time.perf_counter()
+    df = build()
+    elapsed = time.perf_counter() - start
+    size = int(df.memory_usage(deep=True).sum())
+    del df
+
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, "columnar.db"))
+        db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        db.create_index(index_name="idx_vitals_date", table_name="vitals", columns=("date",))
+        db.add_records(table_name="vitals", rows=iter_rows(args.rows), batch_size=10_000)
+
+        print(f"rows: {args.rows:,}")
+        print(f"{'path':>10} {'wall time':>10} {'peak memory':>13} {'DataFrame':>11}")
+        for name, build in (("tuples", tuple_path), ("columnar", columnar_path)):
+            elapsed, peak, size = measure(lambda: build(db))
+            print(f"{name:>10} {elapsed:>9.2f}s {peak / 2**20:>10.0f}MiB {size / 2**20:>8.0f}MiB")
+        del db
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures patient lookup throughput of one DatabaseManager shared by a growing number
+of threads, with and without a concurrent writer, on a WAL database file.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_concurrent_reads --rows 50000 --threads 1 2 4 8 --query aggregate
+"""
+
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+import typing as t
+
+from benchmarks.bench_bulk_insert import VITALS_COLUMNS, make_rows
+from src.database import DatabaseManager
+
+
+QUERIES: t.Dict[str, t.Callable[[DatabaseManager, int], t.Any]] = {
+    # Python builds a tuple per row while holding the GIL.
+    "lookup": lambda db, patient_id: db.select_record(
+        table_name="vitals", criteria={"patient_id": patient_id}, order_by="date"
+    ).fetchall(),
+    # SQLite does the work with the GIL released, so threads run in parallel.
+    "aggregate": lambda db, patient_id: db.execute(
+        "SELECT avg(heart_rate), max(temperature) FROM vitals WHERE patient_id = ?;", (patient_id,)
+    ).fetchall(),
+}
+
+
+def run_readers(
+    db: DatabaseManager, query: str, threads: int, duration: float, with_writer: bool
+) -> float:
+    stop = threading.Event()
+    counts: t.List[int] = []
+
+    def read(seed: int) -> None:
+        rng = random.Random(seed)
+        count = 0
+        while not stop.is_set():
+            QUERIES[query](db, rng.randint(1, 50))
+            count += 1
+        counts.append(count)
+
+    def write() -> None:
+        rows = itertools.cycle(make_rows(10_000))
+        while not stop.is_set():
+            db.add_record(table_name="vitals", data=next(rows))
+
+    workers = [threading.Thread(target=read, args=(seed,)) for seed in range(threads)]
+    if with_writer:
+        workers.append(threading.Thread(target=write))
+    for worker in workers:
+        worker.start()
+    time.sleep(duration)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    return sum(counts) / duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--query", choices=sorted(QUERIES), default="aggregate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = DatabaseManager(os.path.join(directory, "concurrency.db"))
+        db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        db.create_index(
+            index_name="idx_vitals_patient_date", table_name="vitals", columns=("patient_id", "date")
+        )
+        db.add_records(table_name="vitals", rows=make_rows(args.rows))
+
+        print(f"{'threads':>8} {'reads/sec':>12} {'reads/sec with writer':>24}")
+        for threads in args.threads:
+            alone = run_readers(db, args.query, threads, args.duration, with_writer=False)
+            with_writer = run_readers(db, args.query, threads, args.duration, with_writer=True)
+            print(f"{threads:>8} {alone:>12,.0f} {with_writer:>24,.0f}")
+        del db
+
+
+if __name__ == "__main__":
+    main()
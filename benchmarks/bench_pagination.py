@@ -0,0 +1,63 @@
+"""
+Compares fetchall() with DatabaseManager.iter_records for the full vitals listing
+ordered by date: time to the first row, total time and peak Python memory.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pagination --rows 10000 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import typing as t
+
+from benchmarks.bench_bulk_insert import VITALS_COLUMNS, make_rows
+from src.database import DatabaseManager, DEFAULT_BATCH_SIZE
+
+
+def measure(rows: t.Callable[[], t.Iterable[tuple]]) -> t.Tuple[float, float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_row = None
+    for _ in rows():
+        if first_row is None:
+            first_row = time.perf_counter() - start
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_row or total, total, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'path':>12} {'first row':>12} {'total':>10} {'peak memory':>14}")
+    for count in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            db = DatabaseManager(os.path.join(directory, "pagination.db"))
+            db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+            db.create_index(index_name="idx_vitals_date", table_name="vitals", columns=("date",))
+            db.add_records(table_name="vitals", rows=make_rows(count))
+
+            paths = {
+                "fetchall": lambda: db.select_record(table_name="vitals", order_by="date").fetchall(),
+                "iter_records": lambda: db.iter_records(
+                    table_name="vitals", order_by="date", batch_size=args.batch_size, key_column="record_id"
+                ),
+            }
+            for name, rows in paths.items():
+                first_row, total, peak = measure(rows)
+                print(
+                    f"{count:>10,} {name:>12} {first_row * 1000:>10.2f}ms {total:>9.3f}s {peak / 2**20:>11.1f}MiB"
+                )
+            del db
+
+
+if __name__ == "__main__":
+    main()
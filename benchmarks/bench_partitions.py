@@ -0,0 +1,78 @@
+"""
+Compares a plain vitals table with one partitioned by month: a one month range read of a
+patient, a one month range read of the whole ward, and removing the oldest month (DELETE
+against DROP TABLE of its partition), with the rows spread over a year.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_partitions --rows 500000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import typing as t
+
+from datetime import datetime, timedelta
+
+from benchmarks.bench_bulk_insert import VITALS_COLUMNS, iter_rows
+from src.database import DatabaseManager
+
+INDEXES = {"idx_vitals_patient_date": ("patient_id", "date"), "idx_vitals_date": ("date",)}
+
+
+def year_of_rows(count: int) -> t.Iterator[t.Dict[str, t.Union[str, int, float]]]:
+    start = datetime(2023, 1, 1)
+    spacing = 365 * 86400 / count
+    for position, row in enumerate(iter_rows(count)):
+        row["date"] = (start + timedelta(seconds=position * spacing)).isoformat()
+        yield row
+
+
+def timed(action: t.Callable[[], t.Any], repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        action()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        plain = DatabaseManager(os.path.join(directory, "plain.db"))
+        plain.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        for name, columns in INDEXES.items():
+            plain.create_index(index_name=name, table_name="vitals", columns=columns)
+        plain.add_records(table_name="vitals", rows=year_of_rows(args.rows), batch_size=10_000)
+
+        partitioned = DatabaseManager(os.path.join(directory, "partitioned.db"))
+        partitioned.create_partitioned_table(table_name="vitals", columns=VITALS_COLUMNS, indexes=INDEXES)
+        partitioned.add_records(table_name="vitals", rows=year_of_rows(args.rows), batch_size=10_000)
+
+        print(f"rows: {args.rows:,} over {len(partitioned.partition_months('vitals'))} monthly partitions")
+        print(f"{'operation':>22} {'plain':>10} {'partitioned':>12}")
+        for name, action in (
+            ("patient month", lambda db: db.select_record(
+                table_name="vitals", criteria={"patient_id": 7}, order_by="date",
+                since="2023-06-01", until="2023-07-01").fetchall()),
+            ("ward month", lambda db: db.select_record(
+                table_name="vitals", order_by="date", since="2023-06-01", until="2023-07-01").fetchall()),
+        ):
+            print(
+                f"{name:>22} {timed(lambda: action(plain), args.repeat) * 1000:>8.1f}ms "
+                f"{timed(lambda: action(partitioned), args.repeat) * 1000:>10.1f}ms"
+            )
+
+        delete = timed(lambda: plain.execute("DELETE FROM vitals WHERE date < '2023-02-01';"))
+        drop = timed(lambda: partitioned.drop_partition("vitals", "2023-01"))
+        print(f"{'remove oldest month':>22} {delete * 1000:>8.1f}ms {drop * 1000:>10.1f}ms")
+        del plain, partitioned
+
+
+if __name__ == "__main__":
+    main()
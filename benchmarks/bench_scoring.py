@@ -0,0 +1,57 @@
+"""
+Compares the NEWS2 scoring throughput of scoring.score_record (one record at a time, the
+path of AddRecordCommand) with scoring.score_arrays (NumPy over whole columns, the path of
+the back-scoring of the vitals table), in records scored per second. The backfill row
+includes reading the table into arrays and writing the scores back.
+
+Run from the repository root (needs numpy):
+
+    python -m benchmarks.bench_scoring --rows 1000000
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_bulk_insert import fresh_database, iter_rows, make_rows
+from src import scoring
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    records = make_rows(args.rows)
+    arrays = {
+        vital: np.array([record[vital] for record in records], dtype="float64")
+        for vital in scoring.SCORED_VITALS
+    }
+
+    start = time.perf_counter()
+    for record in records:
+        scoring.score_record(record)
+    per_row = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scoring.score_arrays(arrays)
+    batch = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = fresh_database(directory, "scoring.db")
+        db.add_records(table_name="vitals", rows=iter_rows(args.rows), batch_size=10_000)
+        start = time.perf_counter()
+        scoring.backfill_scores(db)
+        backfill = time.perf_counter() - start
+        del db
+
+    print(f"rows: {args.rows:,}")
+    print(f"{'path':>10} {'time':>9} {'records/s':>14}")
+    for name, elapsed in (("per row", per_row), ("batch", batch), ("backfill", backfill)):
+        print(f"{name:>10} {elapsed:>8.3f}s {args.rows / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Measures the throughput of streaming export and import of the vitals table, in rows per
+second, for every file format: export to a file, then import it into an empty table.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_transfer --rows 100000 --batch-size 1000
+"""
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.bench_bulk_insert import fresh_database, iter_rows
+from src import scoring, transfer
+from src.validation import coerce_vitals
+
+FILE_NAMES = ["vitals.csv", "vitals.ndjson", "vitals.csv.gz", "vitals.ndjson.gz"]
+
+
+def prepare(record: transfer.Record) -> transfer.Record:
+    record = coerce_vitals({column: value for column, value in record.items() if column not in ("record_id", "news2")})
+    record["news2"] = scoring.score_record(record).total
+    return record
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = fresh_database(directory, "source.db")
+        source.add_records(table_name="vitals", rows=iter_rows(args.rows))
+
+        print(f"{'file':<18} {'size':>10} {'export rows/s':>14} {'import rows/s':>14}")
+        for position, name in enumerate(FILE_NAMES):
+            path = os.path.join(directory, name)
+            exported = transfer.export_records(source, path, batch_size=args.batch_size)
+            target = fresh_database(directory, f"target{position}.db")
+            imported = transfer.import_records(target, path, prepare, batch_size=args.batch_size)
+            assert imported.rows == args.rows, imported
+
+            print(
+                f"{name:<18} {os.path.getsize(path) / 2 ** 20:>8.1f}MiB "
+                f"{exported.rows_per_second:>14,.0f} {imported.rows_per_second:>14,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+A seeded generator of synthetic vitals: N patients with M readings each, every patient drawn
+around a baseline of their own with reading-to-reading noise, a few of them deteriorating.
+The same seed always gives the same records, so benchmark runs on different commits read
+and write identical data. Records are yielded one at a time in the order of their dates, as
+bedside monitors would send them, so any number of them can be streamed into a database.
+
+    python -m benchmarks.datagen --patients 3 --readings 2
+"""
+
+import argparse
+import json
+import random
+import typing as t
+
+from datetime import datetime, timedelta
+
+START = datetime(2023, 1, 1)
+READING_INTERVAL = timedelta(minutes=15)
+
+# Share of the patients whose vitals worsen over their stay, and of the readings missing a vital.
+DETERIORATING_SHARE = 0.05
+MISSING_SHARE = 0.02
+
+# Vital -> (mean and spread of the patient baselines, spread of a reading around the baseline,
+# change over the stay of a deteriorating patient, physiological bounds, decimals).
+VITALS: t.Dict[str, t.Tuple[float, float, float, float, t.Tuple[float, float], int]] = {
+    "heart_rate": (78, 10, 5, 35, (30, 220), 0),
+    "systolic": (122, 14, 7, -30, (60, 240), 0),
+    "respiratory_rate": (16, 2.5, 1.5, 9, (6, 45), 0),
+    "oxygen_saturation": (97, 1.2, 0.8, -7, (70, 100), 1),
+    "temperature": (36.9, 0.3, 0.2, 1.6, (34, 42), 1),
+}
+
+Record = t.Dict[str, t.Union[str, int, float, None]]
+
+
+class Patient(t.NamedTuple):
+    patient_id: int
+    baselines: t.Dict[str, float]
+    deteriorating: bool
+    # Offset of the readings of the patient within a READING_INTERVAL, so patients do not report at once.
+    offset: timedelta
+
+
+def make_patients(count: int, rng: random.Random, first_id: int = 1) -> t.List[Patient]:
+    return [
+        Patient(
+            first_id + position,
+            {vital: rng.gauss(mean, spread) for vital, (mean, spread, *_) in VITALS.items()},
+            rng.random() < DETERIORATING_SHARE,
+            READING_INTERVAL * position / count,
+        )
+        for position in range(count)
+    ]
+
+
+def _reading(patient: Patient, progress: float, rng: random.Random) -> t.Dict[str, t.Union[int, float, None]]:
+    values: t.Dict[str, t.Union[int, float, None]] = {}
+    for vital, (_, _, noise, change, (low, high), decimals) in VITALS.items():
+        if rng.random() < MISSING_SHARE:
+            values[vital] = None
+            continue
+        value = patient.baselines[vital] + rng.gauss(0, noise)
+        if patient.deteriorating:
+            value += change * progress
+        value = min(high, max(low, value))
+        values[vital] = round(value, decimals) if decimals else int(round(value))
+
+    systolic = values["systolic"]
+    values["diastolic"] = None if systolic is None else int(round(systolic * 0.64 + rng.gauss(0, 5)))
+    return values
+
+
+def iter_vitals(
+    patients: int,
+    readings: int,
+    seed: int = 42,
+    start: datetime = START,
+    first_patient_id: int = 1
+) -> t.Iterator[Record]:
+    """Yields `readings` records for each of `patients` patients, ordered by date."""
+
+    rng = random.Random(seed)
+    cohort = make_patients(patients, rng, first_patient_id)
+    for reading in range(readings):
+        progress = reading / max(1, readings - 1)
+        timestamp = start + READING_INTERVAL * reading
+        for patient in cohort:
+            yield {
+                "patient_id": patient.patient_id,
+                "date": (timestamp + patient.offset).isoformat(timespec="seconds"),
+                **_reading(patient, progress, rng),
+            }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for record in iter_vitals(args.patients, args.readings, args.seed):
+        print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
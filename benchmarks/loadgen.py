@@ -0,0 +1,158 @@
+"""
+A load generator for the ingestion server: concurrent clients post batches of synthetic vitals
+for a while, then the sustained readings per second and the latencies of the acknowledgements,
+received once a batch is committed, are reported.
+
+Start the server, then run from the repository root:
+
+    python -m src.server --port 8765
+    python -m benchmarks.loadgen --clients 8 --batch-size 100 --duration 30
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import sys
+import threading
+import time
+import typing as t
+
+from benchmarks.datagen import iter_vitals
+from src.server import DEFAULT_HOST, DEFAULT_PORT, VITALS_PATH
+
+
+class LoadResult(t.NamedTuple):
+    clients: int
+    batch_size: int
+    seconds: float
+    batches: int
+    readings: int
+    rejected: int
+    failed_batches: int
+    readings_per_second: float
+    p50_ack_ms: float
+    p99_ack_ms: float
+    max_ack_ms: float
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def _percentile(ordered: t.Sequence[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def _batches(client: int, batch_size: int, seed: int) -> t.Iterator[bytes]:
+    """NDJSON batches of the readings of patients of this client only, endlessly and in date order."""
+
+    patients = max(1, batch_size // 10)
+    records = iter_vitals(patients, sys.maxsize, seed=seed + client, first_patient_id=1 + client * patients)
+    while True:
+        lines = [json.dumps(next(records)) for _ in range(batch_size)]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def run_load(
+    connect: t.Callable[[], http.client.HTTPConnection],
+    clients: int,
+    batch_size: int,
+    duration: float,
+    seed: int = 42
+) -> LoadResult:
+    """Runs clients threads each posting batch_size records per request for duration seconds."""
+
+    latencies: t.List[float] = []
+    totals = {"batches": 0, "readings": 0, "rejected": 0, "failed": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(number: int) -> None:
+        connection = connect()
+        own_latencies = []
+        batches = readings = rejected = failed = 0
+        for body in _batches(number, batch_size, seed):
+            if time.perf_counter() >= deadline:
+                break
+            start = time.perf_counter()
+            try:
+                connection.request("POST", VITALS_PATH, body, {"Content-Type": "application/x-ndjson"})
+                response = connection.getresponse()
+                content = json.loads(response.read())
+            except (OSError, http.client.HTTPException, ValueError):
+                connection.close()
+                connection = connect()
+                failed += 1
+                continue
+            own_latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                failed += 1
+                continue
+            batches += 1
+            readings += content["accepted"]
+            rejected += len(content["rejected"])
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            totals["batches"] += batches
+            totals["readings"] += readings
+            totals["rejected"] += rejected
+            totals["failed"] += failed
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return LoadResult(
+        clients, batch_size, seconds, totals["batches"], totals["readings"], totals["rejected"], totals["failed"],
+        totals["readings"] / seconds, _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.99) * 1000,
+        (latencies[-1] if latencies else 0.0) * 1000
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="path of the Unix socket of the server, instead of host and port")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100, help="readings per request")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send for")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="file to write the JSON results to")
+    args = parser.parse_args()
+
+    def connect() -> http.client.HTTPConnection:
+        if args.unix_socket:
+            return UnixHTTPConnection(args.unix_socket)
+        return http.client.HTTPConnection(args.host, args.port)
+
+    result = run_load(connect, args.clients, args.batch_size, args.duration, args.seed)
+    print(
+        f"{result.readings:,} readings in {result.batches:,} batches over {result.seconds:.1f}s: "
+        f"{result.readings_per_second:,.0f} readings/s, ack p50 {result.p50_ack_ms:.1f} ms, "
+        f"p99 {result.p99_ack_ms:.1f} ms, max {result.max_ack_ms:.1f} ms"
+    )
+    if result.rejected or result.failed_batches:
+        print(f"{result.rejected} readings rejected, {result.failed_batches} batches failed.")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result._asdict(), file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Measures the cold start of the command line interface and of the dashboard: every run is a new
+Python process in an empty directory, timed from its launch to its exit. It also checks that
+importing the commands neither opens the database nor loads the heavy libraries, and writes
+the results as a JSON baseline that a later run can be compared with, like benchmarks.suite.
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --compare startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+from benchmarks.suite import DEFAULT_TOLERANCE, compare, environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries only some pages or commands need, which importing src.commands must not load.
+HEAVY_MODULES = ("asyncio", "numpy", "pandas", "streamlit", "concurrent.futures")
+
+DATABASE_FILE = "patient_monitoring.db"
+
+# Scenario -> code run by the new process.
+SCENARIOS: t.Dict[str, str] = {
+    # The interpreter alone, what every other scenario pays on top of.
+    "python": "pass",
+    "import_commands": "import src.commands",
+    # What `python interface.py` does before showing the menu.
+    "cli_ready": "import interface; interface.c.CreateVitalSignsTableCommand().execute()",
+    "dashboard_home": (
+        "from streamlit.testing.v1 import AppTest; "
+        f"app = AppTest.from_file({os.path.join(ROOT, 'graph_app.py')!r}, default_timeout=60).run(); "
+        "assert not app.exception, app.exception"
+    ),
+}
+
+DEFAULT_RUNS = 10
+
+
+def _run(code: str, directory: str) -> float:
+    """Runs code in a new interpreter in directory and returns the seconds until it exited."""
+
+    environment = {**os.environ, "PYTHONPATH": ROOT}
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=directory, env=environment, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def measure(code: str, runs: int) -> t.Dict[str, float]:
+    # The first run compiles the bytecode of the modules, which later starts read back.
+    with tempfile.TemporaryDirectory() as directory:
+        _run(code, directory)
+    seconds = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as directory:
+            seconds.append(_run(code, directory))
+    seconds.sort()
+    median = statistics.median(seconds)
+    return {
+        "operations": runs,
+        "ops_per_second": 1 / median,
+        "p50_ms": median * 1000,
+        "p99_ms": seconds[min(len(seconds) - 1, int(0.99 * len(seconds)))] * 1000,
+    }
+
+
+def check_lazy_imports() -> t.List[str]:
+    """Returns what importing src.commands does eagerly that it should leave to the commands."""
+
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        output = subprocess.run(
+            [
+                sys.executable, "-c",
+                f"import json, sys, src.commands; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+            ],
+            cwd=directory, env={**os.environ, "PYTHONPATH": ROOT}, check=True, capture_output=True, text=True
+        ).stdout
+        if os.path.exists(os.path.join(directory, DATABASE_FILE)):
+            problems.append(f"importing src.commands created {DATABASE_FILE}")
+    loaded = json.loads(output)
+    if loaded:
+        problems.append(f"importing src.commands loaded {', '.join(loaded)}")
+    return problems
+
+
+def streamlit_installed() -> bool:
+    try:
+        subprocess.run([sys.executable, "-c", "import streamlit.testing.v1"], check=True, capture_output=True)
+    except subprocess.CalledProcessError:
+        return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="processes started per scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--output", help="file to write the JSON results to, printed when omitted")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help="slowdown reported as a regression, 0.2 for 20%%"
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenarios:
+        if name == "dashboard_home" and not streamlit_installed():
+            print("Skipping dashboard_home, streamlit is not installed.", file=sys.stderr)
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = measure(SCENARIOS[name], args.runs)
+    problems = check_lazy_imports()
+    current = {"meta": {**environment(), "runs": args.runs}, "scenarios": results, "eager_imports": problems}
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    else:
+        print(json.dumps(current, indent=2))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), current, args.tolerance)
+    for problem in problems:
+        print(f"Warning: {problem}.")
+    if problems:
+        regressions.append("imports")
+    if regressions:
+        sys.exit(f"Startup regressions in {', '.join(regressions)}.")
+
+
+if __name__ == "__main__":
+    main()
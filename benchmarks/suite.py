@@ -0,0 +1,307 @@
+"""
+Runs the benchmark scenarios of the main application paths through the commands on a database
+of synthetic vitals, and writes the results as a JSON baseline that a later run can be compared
+with. The database is generated once per size and seed and copied for every run, so write
+scenarios never change the data the next run starts from.
+
+Run from the repository root, from 10k rows (the default) up to 10M:
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --patients 1000 --readings 10000 --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from benchmarks.datagen import READING_INTERVAL, START, iter_vitals
+from src import commands, scoring
+from src.database import DatabaseManager
+
+LOAD_BATCH_SIZE = 10_000
+DEFAULT_TOLERANCE = 0.2
+
+Scenario = t.Callable[["Run"], t.Iterator[int]]
+
+
+class ScenarioResult(t.NamedTuple):
+    """The measurements of a scenario; an operation is one call of the command it measures."""
+
+    operations: int
+    rows: int
+    seconds: float
+    ops_per_second: float
+    rows_per_second: float
+    p50_ms: float
+    p99_ms: float
+
+
+class Run(t.NamedTuple):
+    patients: int
+    readings: int
+    seed: int
+    rng: random.Random
+
+    def patient_ids(self, count: int) -> t.List[int]:
+        return self.rng.sample(range(1, self.patients + 1), min(count, self.patients))
+
+    def new_records(self, count: int, first_patient_id: int) -> t.Iterator[t.Dict[str, t.Any]]:
+        """Records of new patients, dated after the generated ones."""
+
+        return iter_vitals(
+            max(1, count // 10), 10, seed=self.seed + 1,
+            start=START + READING_INTERVAL * self.readings, first_patient_id=first_patient_id
+        )
+
+
+@contextmanager
+def using_database(db: DatabaseManager) -> t.Iterator[None]:
+    """Points the commands at db for the duration of the block."""
+
+    previous = commands.db
+    commands.db = db
+    try:
+        yield
+    finally:
+        commands.db = previous
+        commands.alert_engine.forget()
+
+
+def scenario_single_add(run: Run) -> t.Iterator[int]:
+    for record in run.new_records(1_000, run.patients + 1):
+        commands.AddRecordCommand().execute(record)
+        yield 1
+
+
+def scenario_bulk_add(run: Run) -> t.Iterator[int]:
+    for batch in range(5):
+        records = list(run.new_records(10_000, run.patients + 10_000 * (batch + 1)))
+        commands.BulkAddRecordsCommand(batch_size=LOAD_BATCH_SIZE).execute(records)
+        yield len(records)
+
+
+def scenario_patient_lookup(run: Run) -> t.Iterator[int]:
+    for patient_id in run.patient_ids(200):
+        yield len(commands.GetPatientRecordsCommand().execute(patient_id))
+
+
+def scenario_full_list(run: Run) -> t.Iterator[int]:
+    """Pages through every record ordered by date, the way the listing of the dashboard does."""
+
+    after = None
+    while True:
+        page = commands.ListRecordsPageCommand(page_size=1_000, after=after).execute()
+        yield len(page.records)
+        if page.next_after is None:
+            return
+        after = page.next_after
+
+
+def scenario_dashboard_load(run: Run) -> t.Iterator[int]:
+    """The queries of a first visit of the listing and of a patient's page, with nothing cached."""
+
+    for patient_id in run.patient_ids(50):
+        rows = len(commands.ListRecordsPageCommand().execute().records)
+        rows += len(commands.GetPatientRecordsCommand().execute(patient_id))
+        rows += len(commands.GetPatientVitalsDownsampledCommand().execute(patient_id))
+        yield rows
+
+
+def scenario_ward_overview(run: Run) -> t.Iterator[int]:
+    for _ in range(50):
+        yield len(commands.GetLatestVitalsCommand().execute())
+
+
+def scenario_delete_by_patient(run: Run) -> t.Iterator[int]:
+    for patient_id in run.patient_ids(20):
+        commands.DeletePatientRecordsCommand().execute(patient_id)
+        yield run.readings
+
+
+# Read scenarios first, so they all see the generated database.
+SCENARIOS: t.Dict[str, Scenario] = {
+    "patient_lookup": scenario_patient_lookup,
+    "full_list": scenario_full_list,
+    "dashboard_load": scenario_dashboard_load,
+    "ward_overview": scenario_ward_overview,
+    "single_add": scenario_single_add,
+    "bulk_add": scenario_bulk_add,
+    "delete_by_patient": scenario_delete_by_patient,
+}
+
+
+def _percentile(ordered: t.Sequence[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def measure(scenario: Scenario, run: Run) -> ScenarioResult:
+    latencies = []
+    rows = 0
+    operations = iter(scenario(run))
+    start = time.perf_counter()
+    while True:
+        operation_start = time.perf_counter()
+        try:
+            rows += next(operations)
+        except StopIteration:
+            break
+        latencies.append(time.perf_counter() - operation_start)
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return ScenarioResult(
+        len(latencies), rows, seconds, len(latencies) / seconds, rows / seconds,
+        _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.99) * 1000
+    )
+
+
+def generate_database(path: str, patients: int, readings: int, seed: int) -> None:
+    """Creates the vitals table as the application does and streams the synthetic records into it."""
+
+    db = DatabaseManager(path)
+    with using_database(db):
+        commands.CreateVitalSignsTableCommand().execute()
+
+    def scored() -> t.Iterator[t.Dict[str, t.Any]]:
+        for record in iter_vitals(patients, readings, seed):
+            record["news2"] = scoring.score_record(record).total
+            yield record
+
+    db.add_records(table_name="vitals", rows=scored(), batch_size=LOAD_BATCH_SIZE)
+    db.pool.close()
+
+
+def run_suite(
+    patients: int,
+    readings: int,
+    seed: int,
+    scenarios: t.Sequence[str],
+    data_directory: str
+) -> t.Dict[str, t.Any]:
+    source = os.path.join(data_directory, f"vitals-{patients}x{readings}-seed{seed}.db")
+    if not os.path.exists(source):
+        print(f"Generating {patients * readings:,} records into {source}...", file=sys.stderr)
+        generate_database(f"{source}.tmp", patients, readings, seed)
+        os.replace(f"{source}.tmp", source)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        shutil.copyfile(source, path)
+        db = DatabaseManager(path)
+        db.profiler.enabled = False
+        with using_database(db):
+            # Brings a database generated on an older commit up to the current schema, as the app does on start.
+            commands.CreateVitalSignsTableCommand().execute()
+            for name in scenarios:
+                print(f"Running {name}...", file=sys.stderr)
+                # Seeded per scenario, so a scenario picks the same patients whichever ran before it.
+                run = Run(patients, readings, seed, random.Random(f"{seed}:{name}"))
+                results[name] = measure(SCENARIOS[name], run)._asdict()
+        db.pool.close()
+
+    return {"meta": metadata(patients, readings, seed), "scenarios": results}
+
+
+def environment() -> t.Dict[str, t.Any]:
+    """The commit and the versions a benchmark ran on."""
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def metadata(patients: int, readings: int, seed: int) -> t.Dict[str, t.Any]:
+    return {
+        **environment(),
+        "patients": patients,
+        "readings": readings,
+        "rows": patients * readings,
+        "seed": seed,
+    }
+
+
+def compare(baseline: t.Dict[str, t.Any], current: t.Dict[str, t.Any], tolerance: float) -> t.List[str]:
+    """Prints the change of every scenario against baseline and returns those slower by more than tolerance."""
+
+    for key in ("rows", "seed"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"Warning: the baseline has {key}={baseline['meta'].get(key)}, this run {current['meta'].get(key)}.")
+
+    regressions = []
+    print(f"{'scenario':<20} {'baseline ops/s':>15} {'ops/s':>12} {'change':>8} {'p99 ms':>10}")
+    for name, result in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            print(f"{name:<20} {'-':>15} {result['ops_per_second']:>12,.1f}")
+            continue
+        change = result["ops_per_second"] / before["ops_per_second"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<20} {before['ops_per_second']:>15,.1f} {result['ops_per_second']:>12,.1f} "
+            f"{change:>+7.1%} {result['p99_ms']:>10.2f}{flag}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--readings", type=int, default=100, help="readings per patient")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument(
+        "--data-directory", default=os.path.join(tempfile.gettempdir(), "vitals-benchmarks"),
+        help="where generated databases are kept between runs"
+    )
+    parser.add_argument("--output", help="file to write the JSON results to, printed when omitted")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help="slowdown in ops/s reported as a regression, 0.2 for 20%%"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.data_directory, exist_ok=True)
+    results = run_suite(args.patients, args.readings, args.seed, args.scenarios, args.data_directory)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        if regressions:
+            sys.exit(f"Regressions in {', '.join(regressions)}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,139 @@
 import streamlit as st
-import pandas as pd
 
 import typing as t
 
 import src.commands as c
 
-st.set_page_config(layout="wide")
+from src import profiling, scoring
+
+# pandas is imported by the pages that build tables, so the home page renders without loading it.
+if t.TYPE_CHECKING:
+    import pandas as pd
 
-data = c.ListRecordsCommand().execute()
+st.set_page_config(layout="wide")
 
-df = pd.DataFrame(data, columns=[
+COLUMNS = [
     "Id",
     "Patient id",
     "Date",
     "Heart rate (BPM)",
-    "Blood pressure (mmHg)",
+    "Systolic (mmHg)",
+    "Diastolic (mmHg)",
     "Respiratory rate (brpm)",
     "Oxygen saturation (%)",
     "Temperature (°C)",
-])
+    "NEWS2",
+]
+
+
+# The listings are read from a snapshot of the database at most this many seconds old, so the
+# queries of the dashboard never hold up the writes of the forms, the menu or the ingestion server.
+MAX_STALENESS = 5.0
+
+
+# The DataFrames are cached in c.query_cache under the version of the data they were built from.
+# Write commands bump c.versions, so a rerun only re-queries what a write could have changed:
+# a page of the listing after any write, a patient's records after a write to that patient.
+# Writes of other processes, like the ingestion server, only change c.data_version().
+# Listings read from the snapshot are also re-queried once it is refreshed with newer writes.
+def load_records_page(page_size: int, after: t.Optional[tuple]) -> t.Tuple["pd.DataFrame", t.Optional[tuple]]:
+    def load() -> t.Tuple["pd.DataFrame", t.Optional[tuple]]:
+        import pandas as pd
+
+        page = c.ListRecordsPageCommand(page_size=page_size, after=after, max_staleness=MAX_STALENESS).execute()
+        return pd.DataFrame(page.records, columns=COLUMNS), page.next_after
+
+    version = (c.versions.table(), c.snapshot_version(MAX_STALENESS))
+    return c.query_cache.get(("page", page_size, after), version, load)
+
+
+def load_patient_records_page(
+    patient_id: int,
+    page_size: int,
+    after: t.Optional[tuple],
+    since: t.Optional[str] = None,
+    until: t.Optional[str] = None
+) -> t.Tuple["pd.DataFrame", t.Optional[tuple]]:
+    def load() -> t.Tuple["pd.DataFrame", t.Optional[tuple]]:
+        import pandas as pd
+
+        page = c.GetPatientRecordsPageCommand(
+            page_size=page_size, after=after, since=since, until=until, max_staleness=MAX_STALENESS
+        ).execute(patient_id)
+        return pd.DataFrame(page.records, columns=COLUMNS), page.next_after
+
+    version = (c.versions.patient(patient_id), c.snapshot_version(MAX_STALENESS))
+    return c.query_cache.get(("patient", patient_id, page_size, after, since, until), version, load)
+
+
+# The columns of the vitals table from heart_rate, in the order of COLUMNS.
+VITAL_NAMES = ("heart_rate", "systolic", "diastolic", "respiratory_rate", "oxygen_saturation", "temperature")
+
+
+def load_ward_overview() -> "pd.DataFrame":
+    """Loads the latest record of every patient with its NEWS2 risk, one row read per patient."""
+
+    def load() -> "pd.DataFrame":
+        import pandas as pd
+
+        rows = []
+        for record in c.GetLatestVitalsCommand().execute():
+            score = scoring.score_record(dict(zip(VITAL_NAMES, record[3:])))
+            rows.append([*record, score.risk])
+        return pd.DataFrame(rows, columns=COLUMNS + ["Risk"])
+
+    return c.query_cache.get(("ward",), (c.versions.table(), c.data_version()), load)
+
+
+# Chart title and the label of the vital in COLUMNS, in the order of c.CHARTED_VITALS.
+CHARTS = [
+    ("Heart rate", "Heart rate (BPM)"),
+    ("Respiratory rate", "Respiratory rate (brpm)"),
+    ("Oxygen saturation", "Oxygen saturation (%)"),
+    ("Temperature", "Temperature (°C)"),
+]
+
+
+def load_patient_buckets(
+    patient_id: int, target_points: int, since: t.Optional[str] = None, until: t.Optional[str] = None
+) -> "pd.DataFrame":
+    """Loads the patient's vitals aggregated in SQLite to at most target_points min/mean/max points per chart."""
+
+    def load() -> "pd.DataFrame":
+        import pandas as pd
+
+        rows = c.GetPatientVitalsDownsampledCommand(
+            target_points=target_points, since=since, until=until
+        ).execute(patient_id)
+        columns = ["Date", "Readings"] + [
+            f"{label} {statistic}" for _, label in CHARTS for statistic in ("min", "mean", "max")
+        ]
+        return pd.DataFrame(rows, columns=columns)
+
+    return c.query_cache.get(
+        ("buckets", patient_id, target_points, since, until),
+        (c.versions.patient(patient_id), c.data_version()),
+        load
+    )
+
+
+def load_patient_anomalies(
+    patient_id: int, since: t.Optional[str] = None, until: t.Optional[str] = None
+) -> "pd.DataFrame":
+    """Loads the anomalies flagged when the patient's records were added, nothing is recomputed."""
+
+    def load() -> "pd.DataFrame":
+        import pandas as pd
+
+        anomalies = c.GetPatientAnomaliesCommand(since=since, until=until).execute(patient_id)
+        return pd.DataFrame(
+            [(anomaly.date, anomaly.vital, anomaly.value, anomaly.zscore) for anomaly in anomalies],
+            columns=["Date", "Vital", "Value", "Z-score"]
+        )
+
+    return c.query_cache.get(
+        ("anomalies", patient_id, since, until), (c.versions.patient(patient_id), c.data_version()), load
+    )
 
 
 # Display the selection menu
@@ -26,10 +141,12 @@ option = st.sidebar.selectbox(
     "Select an option",
     [
         "Home",
+        "Ward overview",
         "Add a record",
         "List all records",
         "Get records by patient",
         "Delete record",
+        "Diagnostics",
     ],
 )
 
@@ -41,6 +158,20 @@ if option == "Home":
     with st.container():
         st.image("https://www.med-technews.com/downloads/7659/download/shutterstock_1721879812.jpg?cb=d87507a69004cdfef060f21cc5232404", width=750)
 
+elif option == "Ward overview":
+    st.write("#### Ward overview")
+    st.caption("The latest vital signs of every patient, the highest NEWS2 scores first.")
+
+    ward = load_ward_overview()
+    if ward.empty:
+        st.write("No records yet.")
+    else:
+        risks = ward["Risk"].value_counts()
+        for column, risk in zip(st.columns(4), (scoring.HIGH, scoring.MEDIUM, scoring.LOW_MEDIUM, scoring.LOW)):
+            with column:
+                st.metric(f"{risk.capitalize()} risk", int(risks.get(risk, 0)))
+        st.dataframe(ward.sort_values(["NEWS2", "Patient id"], ascending=[False, True], na_position="last"))
+
 if option == "Add a record":
     st.write("##### Add a Record")
     
@@ -61,64 +192,159 @@ if option == "Add a record":
             "temperature": temperature,
         }
         
-        result = c.AddRecordCommand().execute(record_data)
-
-        st.success(result)
+        command = c.AddRecordCommand()
+        try:
+            result = command.execute(record_data)
+        except ValueError as error:
+            st.error(f"Invalid input: {error}")
+        else:
+            st.success(result)
+            for alert in command.alerts:
+                st.warning(f"Alert ({alert.rule}): {alert.message}")
 
 elif option == "List all records":
     st.write("#### All records")
 
-    styled_df = df.style
-    st.dataframe(styled_df)
+    # Keyset of the first row of every page seen so far, so "Previous" never re-reads the table.
+    if "list_pages" not in st.session_state:
+        st.session_state.list_pages = [None]
+    page_size = st.selectbox("Records per page", [50, 100, 500], index=1)
+
+    page_df, next_after = load_records_page(page_size, st.session_state.list_pages[-1])
+    st.dataframe(page_df.style)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(st.session_state.list_pages) > 1 and st.button("Previous page"):
+            st.session_state.list_pages.pop()
+            st.experimental_rerun()
+    with col2:
+        if next_after is not None and st.button("Next page"):
+            st.session_state.list_pages.append(next_after)
+            st.experimental_rerun()
 
 elif option == "Get records by patient":
     st.write("#### Records by patient")
 
     patient_id = st.text_input("Enter Patient ID:")
 
+    filter_by_date = st.checkbox("Only records in a date range")
+    if filter_by_date:
+        since = st.date_input("From")
+        until = st.date_input("To (exclusive)")
+
+    points_per_chart = st.slider("Points per chart", 50, 2000, c.DEFAULT_CHART_POINTS, step=50)
+
     if st.button("Get Records"):
-        records = c.GetPatientRecordsCommand().execute(int(patient_id))
-        if records:
-            df_by_patient = pd.DataFrame(records, columns=[
-                "Id",
-                "Patient id",
-                "Date",
-                "Heart rate (BPM)",
-                "Blood pressure (mmHg)",
-                "Respiratory rate (brpm)",
-                "Oxygen saturation (%)",
-                "Temperature (°C)"
-            ])
-
-            styled_df = df_by_patient.style
+        # Kept across the reruns of the page buttons, with the keyset each page seen starts after.
+        st.session_state.patient_query = (
+            int(patient_id),
+            since.isoformat() if filter_by_date else None,
+            until.isoformat() if filter_by_date else None,
+        )
+        st.session_state.patient_pages = [None]
 
-            with st.container():
-                st.dataframe(styled_df)
+    if "patient_query" in st.session_state:
+        query_patient_id, since_text, until_text = st.session_state.patient_query
+        # The charts are bounded by points_per_chart whatever the number of records, and tell whether there are any.
+        buckets = load_patient_buckets(query_patient_id, points_per_chart, since_text, until_text)
+        if not buckets.empty:
+            page_size = st.selectbox("Records per page", [50, 100, 500], index=1)
+            page_df, next_after = load_patient_records_page(
+                query_patient_id, page_size, st.session_state.patient_pages[-1], since_text, until_text
+            )
 
-            col1, col2, col3, col4 = st.columns(4)
+            with st.container():
+                st.dataframe(page_df.style)
 
+            col1, col2 = st.columns(2)
             with col1:
-                st.markdown("<p style='text-align: center;'>Heart rate</p>", unsafe_allow_html=True)
-                st.line_chart(styled_df, x="Date", y="Heart rate (BPM)", width=0, height=0, use_container_width=True)
+                if len(st.session_state.patient_pages) > 1 and st.button("Previous page"):
+                    st.session_state.patient_pages.pop()
+                    st.experimental_rerun()
             with col2:
-                st.markdown("<p style='text-align: center;'>Respiratory rate</p>", unsafe_allow_html=True)
-                st.line_chart(styled_df, x="Date", y="Respiratory rate (brpm)", width=0, height=0, use_container_width=True)
-            with col3:
-                st.markdown("<p style='text-align: center;'>Oxygen saturation</p>", unsafe_allow_html=True)
-                st.line_chart(styled_df, x="Date", y="Oxygen saturation (%)", width=0, height=0, use_container_width=True)
-            with col4:
-                st.markdown("<p style='text-align: center;'>Temperature</p>", unsafe_allow_html=True)
-                st.line_chart(styled_df, x="Date", y="Temperature (°C)", width=0, height=0, use_container_width=True)
+                if next_after is not None and st.button("Next page"):
+                    st.session_state.patient_pages.append(next_after)
+                    st.experimental_rerun()
+
+            import altair as alt
+
+            anomalies = load_patient_anomalies(query_patient_id, since_text, until_text)
+
+            for column, (title, label), vital in zip(st.columns(4), CHARTS, c.CHARTED_VITALS):
+                with column:
+                    st.markdown(f"<p style='text-align: center;'>{title}</p>", unsafe_allow_html=True)
+                    lines = alt.Chart(buckets).transform_fold(
+                        [f"{label} min", f"{label} mean", f"{label} max"], as_=["Statistic", label]
+                    ).mark_line().encode(x="Date:T", y=f"{label}:Q", color="Statistic:N")
+                    # The anomalies of the vital drawn over the lines, as stored when they were recorded.
+                    points = alt.Chart(anomalies[anomalies["Vital"] == vital]).mark_point(
+                        color="red", filled=True, size=60
+                    ).encode(x="Date:T", y="Value:Q", tooltip=["Date", "Value", "Z-score"])
+                    st.altair_chart(lines + points, use_container_width=True)
+
+            if not anomalies.empty:
+                st.write("##### Anomalies")
+                st.dataframe(anomalies)
 
         else:
             st.write("No records found for the specified patient.")
 
             
 elif option == "Delete record":
-    record_ids = list(sorted(df["Id"]))
-    id_ = st.selectbox("Select Record ID to delete:", record_ids)
+    id_ = st.number_input("Record ID to delete:", min_value=1, step=1)
 
     if st.button("Delete Record"):
         result = c.DeleteRecordCommand().execute(int(id_))
         st.write(result)
-        
\ No newline at end of file
+        
+
+
+elif option == "Diagnostics":
+    import pandas as pd
+
+    st.write("#### Query diagnostics")
+    st.caption("Statements run by this app since it started or since the statistics were last cleared.")
+
+    slow_ms = st.number_input(
+        "Log statements slower than (ms)", min_value=0, value=int(profiling.DEFAULT_SLOW_SECONDS * 1000), step=10
+    )
+    capture_plans = st.checkbox("Capture the query plan of every statement", value=True)
+    c.ConfigureProfilingCommand(
+        slow_seconds=slow_ms / 1000, explain_seconds=0 if capture_plans else None
+    ).execute()
+
+    stats = c.GetQueryStatsCommand().execute()
+    full_scans = [stat for stat in stats if stat.full_scan]
+    for stat in full_scans:
+        st.warning(f"Full table scan by {', '.join(stat.callers)}: `{stat.shape}`")
+
+    if stats:
+        st.dataframe(pd.DataFrame([
+            {
+                "statement": stat.shape,
+                "calls": stat.calls,
+                "total (ms)": stat.total_seconds * 1000,
+                "p50 (ms)": stat.p50_seconds * 1000,
+                "p99 (ms)": stat.p99_seconds * 1000,
+                "rows": stat.rows,
+                "full scan": stat.full_scan,
+                "plan": "; ".join(stat.plan or []),
+                "called by": ", ".join(stat.callers),
+            }
+            for stat in stats
+        ]))
+    else:
+        st.write("No statements recorded yet.")
+
+    st.write("##### Slow queries")
+    slow_queries = c.GetSlowQueriesCommand().execute()
+    if slow_queries:
+        st.dataframe(pd.DataFrame([
+            {**query._asdict(), "plan": "; ".join(query.plan or [])} for query in slow_queries
+        ]))
+    else:
+        st.write("No slow queries.")
+
+    if st.button("Clear statistics"):
+        st.write(c.ResetQueryStatsCommand().execute())
@@ -16,21 +16,54 @@ def loop():
             name="List records by patient ID",
             command=c.ListRecordsCommand(order_by="patient_id"),
         ),
+        "W": p.Option(
+            name="Ward overview, the latest records of every patient",
+            command=c.GetLatestVitalsCommand(),
+        ),
         "P": p.Option(
             name="Get all records of a patient",
             command=c.GetPatientRecordsCommand(),
             prep_call=p.get_patient_id
         ),
+        "N": p.Option(
+            name="Get the anomalies of a patient",
+            command=c.GetPatientAnomaliesCommand(),
+            prep_call=p.get_patient_id
+        ),
         "D": p.Option(
             name="Delete a single record",
             command=c.DeleteRecordCommand(),
             prep_call=p.get_record_id
         ),
+        "B": p.Option(
+            name="Delete several records",
+            command=c.DeleteRecordsCommand(),
+            prep_call=p.get_record_ids
+        ),
         "R": p.Option(
             name="Delete all records of a patient",
             command=c.DeletePatientRecordsCommand(),
             prep_call=p.get_patient_id
         ),
+        "M": p.Option(
+            name="Import records from a file",
+            command=c.ImportRecordsCommand(),
+            prep_call=p.get_file_path
+        ),
+        "E": p.Option(
+            name="Export all records to a file",
+            command=c.ExportRecordsCommand(),
+            prep_call=p.get_file_path
+        ),
+        "X": p.Option(
+            name="Archive records older than 90 days",
+            command=c.ArchiveRecordsCommand(),
+        ),
+        "H": p.Option(
+            name="Restore archived records",
+            command=c.RehydrateRecordsCommand(),
+            prep_call=p.get_date_range
+        ),
         "Q": p.Option(
             name="Quit",
             command=c.QuitCommand()
@@ -0,0 +1,199 @@
+""" A module for checking vitals readings against alert rules as they are recorded """
+
+import threading
+import typing as t
+
+from collections import deque
+from datetime import datetime
+
+Record = t.Mapping[str, t.Union[str, int, float, None]]
+
+DEFAULT_SINK_SIZE = 1_000
+
+
+class Alert(t.NamedTuple):
+    rule: str
+    patient_id: int
+    date: str
+    vital: str
+    value: float
+    message: str
+
+
+class AlertSink(t.Protocol):
+    """Where an AlertEngine sends its alerts, such as a pager gateway or a message queue."""
+
+    def emit(self, alert: Alert) -> None:
+        pass
+
+
+class InMemorySink:
+    """ A class that keeps the most recent alerts in process, the stand-in for a real sink.
+    Only the last max_alerts are kept, so it can run unattended."""
+
+    def __init__(self, max_alerts: int = DEFAULT_SINK_SIZE):
+        self._lock = threading.Lock()
+        self._alerts: "deque[Alert]" = deque(maxlen=max_alerts)
+        self.emitted = 0
+
+    def emit(self, alert: Alert) -> None:
+        with self._lock:
+            self._alerts.append(alert)
+            self.emitted += 1
+
+    def alerts(self, patient_id: t.Optional[int] = None) -> t.List[Alert]:
+        """Returns the kept alerts, oldest first, of one patient or of all of them."""
+
+        with self._lock:
+            return [alert for alert in self._alerts if patient_id is None or alert.patient_id == patient_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._alerts.clear()
+
+
+class ThresholdRule:
+    """A rule raising an alert for every reading of a vital below low or above high."""
+
+    def __init__(self, name: str, vital: str, low: t.Optional[float] = None, high: t.Optional[float] = None):
+        if low is None and high is None:
+            raise ValueError("A threshold rule needs a low or a high bound.")
+        self.name = name
+        self.vital = vital
+        self.low = low
+        self.high = high
+
+    def breached(self, value: float) -> bool:
+        return (self.low is not None and value < self.low) or (self.high is not None and value > self.high)
+
+    def new_state(self) -> None:
+        return None
+
+    def evaluate(self, state: None, value: float, date: str) -> t.Optional[str]:
+        if not self.breached(value):
+            return None
+        bound = f"below {self.low}" if self.low is not None and value < self.low else f"above {self.high}"
+        return f"{self.vital} {value} is {bound}."
+
+
+class RateOfChangeRule:
+    """ A rule raising an alert when a vital moved by more than max_change within window_seconds.
+    The readings of the window are kept in a ring buffer of at most max_readings per patient,
+    and the new reading is compared with the oldest one still in the window."""
+
+    def __init__(self, name: str, vital: str, max_change: float, window_seconds: float, max_readings: int = 32):
+        self.name = name
+        self.vital = vital
+        self.max_change = max_change
+        self.window_seconds = window_seconds
+        self.max_readings = max_readings
+
+    def new_state(self) -> "deque[t.Tuple[float, float]]":
+        return deque(maxlen=self.max_readings)
+
+    def evaluate(self, state: "deque[t.Tuple[float, float]]", value: float, date: str) -> t.Optional[str]:
+        now = datetime.fromisoformat(date).timestamp()
+        # Each reading is appended and popped once, so the loop is amortised O(1).
+        while state and state[0][0] < now - self.window_seconds:
+            state.popleft()
+        message = None
+        if state and abs(value - state[0][1]) > self.max_change:
+            message = (
+                f"{self.vital} changed from {state[0][1]} to {value} "
+                f"within {self.window_seconds / 60:g} minutes."
+            )
+        state.append((now, value))
+        return message
+
+
+class ConsecutiveBreachRule:
+    """ A rule raising an alert when at least n of the last m readings breach a threshold rule.
+    A ring buffer of the last m outcomes and a running count of breaches are kept per patient."""
+
+    def __init__(self, name: str, threshold: ThresholdRule, n: int, m: int):
+        if not 0 < n <= m:
+            raise ValueError("n must be between 1 and m.")
+        self.name = name
+        self.vital = threshold.vital
+        self.threshold = threshold
+        self.n = n
+        self.m = m
+
+    def new_state(self) -> t.List[t.Any]:
+        return [deque(maxlen=self.m), 0]
+
+    def evaluate(self, state: t.List[t.Any], value: float, date: str) -> t.Optional[str]:
+        outcomes, breaches = state
+        if len(outcomes) == self.m:
+            breaches -= outcomes[0]
+        breached = self.threshold.breached(value)
+        outcomes.append(breached)
+        state[1] = breaches = breaches + breached
+        if not breached or breaches < self.n:
+            return None
+        return f"{self.vital} breached {self.threshold.name} in {breaches} of the last {len(outcomes)} readings."
+
+
+Rule = t.Union[ThresholdRule, RateOfChangeRule, ConsecutiveBreachRule]
+
+# Thresholds at the edges of the NEWS2 bands scoring 3, a fast heart rate swing and sustained low saturation.
+DEFAULT_RULES: t.List[Rule] = [
+    ThresholdRule("heart_rate", "heart_rate", low=41, high=130),
+    ThresholdRule("respiratory_rate", "respiratory_rate", low=9, high=24),
+    ThresholdRule("oxygen_saturation", "oxygen_saturation", low=92),
+    ThresholdRule("systolic", "systolic", low=91, high=219),
+    ThresholdRule("temperature", "temperature", low=35.1),
+    RateOfChangeRule("heart_rate_change", "heart_rate", max_change=30, window_seconds=600),
+    ConsecutiveBreachRule(
+        "oxygen_saturation_sustained", ThresholdRule("spo2_below_94", "oxygen_saturation", low=94), n=3, m=5
+    ),
+]
+
+
+class AlertEngine:
+    """ A class that evaluates rules on every reading as it is recorded and sends alerts to a sink.
+    Rules only look at the per patient state kept in memory, never at the table, so a reading costs
+    the same however many records a patient has. Readings are evaluated in the order they arrive."""
+
+    def __init__(self, rules: t.Sequence[Rule] = DEFAULT_RULES, sink: t.Optional[AlertSink] = None):
+        self.rules = list(rules)
+        self.sink: AlertSink = sink if sink is not None else InMemorySink()
+        self._lock = threading.Lock()
+        self._states: t.Dict[int, t.List[t.Any]] = {}
+
+    def process(self, record: Record) -> t.List[Alert]:
+        """Evaluates every rule on a coerced record, emits the alerts and returns them."""
+
+        patient_id = t.cast(int, record["patient_id"])
+        date = t.cast(str, record["date"])
+        alerts = []
+        with self._lock:
+            states = self._states.get(patient_id)
+            if states is None:
+                states = self._states[patient_id] = [rule.new_state() for rule in self.rules]
+            for rule, state in zip(self.rules, states):
+                value = record.get(rule.vital)
+                if value is None:
+                    continue
+                message = rule.evaluate(state, t.cast(float, value), date)
+                if message is not None:
+                    alerts.append(Alert(rule.name, patient_id, date, rule.vital, t.cast(float, value), message))
+
+        for alert in alerts:
+            self.sink.emit(alert)
+        return alerts
+
+    def process_batch(self, records: t.Iterable[Record]) -> t.List[Alert]:
+        alerts = []
+        for record in records:
+            alerts.extend(self.process(record))
+        return alerts
+
+    def forget(self, patient_id: t.Optional[int] = None) -> None:
+        """Drops the state of a patient, or of every patient, after their records were deleted."""
+
+        with self._lock:
+            if patient_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(patient_id, None)
@@ -0,0 +1,313 @@
+""" A module for the per patient trends and anomalies of the vitals of the vitals table """
+
+import math
+import typing as t
+
+from src import rollups
+from src.database import DatabaseManager
+
+if t.TYPE_CHECKING:
+    import numpy as np
+
+ANALYSED_VITALS = rollups.ROLLUP_VITALS
+
+# Weight of the newest reading in the exponentially weighted moving average.
+EWMA_ALPHA = 0.3
+# A reading is an anomaly when it is this many standard deviations away from the mean of the
+# readings of its patient before it, once there are at least MIN_READINGS of them.
+ZSCORE_THRESHOLD = 3.0
+MIN_READINGS = 10
+
+
+class VitalTrend(t.NamedTuple):
+    readings: int
+    mean: t.Optional[float]
+    stddev: t.Optional[float]
+    ewma: t.Optional[float]
+
+
+class Anomaly(t.NamedTuple):
+    record_id: int
+    patient_id: int
+    date: str
+    vital: str
+    value: float
+    zscore: float
+
+
+def analytics_table(table_name: str) -> str:
+    return f"{table_name}_analytics"
+
+
+def anomalies_table(table_name: str) -> str:
+    return f"{table_name}_anomalies"
+
+
+def _state_columns() -> t.Dict[str, str]:
+    columns = {"patient_id": "INTEGER PRIMARY KEY"}
+    for vital in ANALYSED_VITALS:
+        columns[f"{vital}_count"] = "INTEGER NOT NULL"
+        columns[f"{vital}_mean"] = "REAL"
+        columns[f"{vital}_m2"] = "REAL"
+        columns[f"{vital}_ewma"] = "REAL"
+    return columns
+
+
+ANOMALY_COLUMNS: t.Dict[str, str] = {
+    "record_id": "INTEGER NOT NULL",
+    "patient_id": "INTEGER NOT NULL",
+    "date": "TEXT NOT NULL",
+    "vital": "TEXT NOT NULL",
+    "value": "REAL NOT NULL",
+    "zscore": "REAL NOT NULL",
+    "PRIMARY KEY": "(record_id, vital)",
+}
+
+
+def _flag_anomalies(table_name: str) -> str:
+    """
+    Stores the vitals of the NEW row that are anomalies, with their z-score against the running
+    mean and sample standard deviation of the patient before the row, so it runs before the update.
+    """
+
+    state = analytics_table(table_name)
+    readings = " UNION ALL ".join(
+        f"SELECT '{vital}' AS vital, NEW.{vital} AS value, "
+        f"(NEW.{vital} - {vital}_mean) / sqrt({vital}_m2 / ({vital}_count - 1)) AS zscore "
+        f"FROM {state} WHERE patient_id = NEW.patient_id AND {vital}_count >= {MIN_READINGS} AND {vital}_m2 > 0"
+        for vital in ANALYSED_VITALS
+    )
+    return (
+        f"INSERT INTO {anomalies_table(table_name)} (record_id, patient_id, date, vital, value, zscore) "
+        f"SELECT NEW.record_id, NEW.patient_id, NEW.date, vital, value, zscore FROM ({readings}) "
+        f"WHERE abs(zscore) >= {ZSCORE_THRESHOLD}; "
+    )
+
+
+def _update_state(table_name: str) -> str:
+    """Adds the NEW row to the state of its patient: Welford's update of the mean and M2, and the EWMA."""
+
+    columns = ["patient_id"]
+    values = ["NEW.patient_id"]
+    updates = []
+    for vital in ANALYSED_VITALS:
+        new, count, mean, m2, ewma = f"NEW.{vital}", f"{vital}_count", f"{vital}_mean", f"{vital}_m2", f"{vital}_ewma"
+        columns += [count, mean, m2, ewma]
+        values += [f"{new} IS NOT NULL", new, f"CASE WHEN {new} IS NULL THEN NULL ELSE 0.0 END", new]
+        skip = f"WHEN {new} IS NULL THEN"
+        first = f"WHEN {count} = 0 THEN"
+        # The SET expressions all read the state before the update.
+        updates += [
+            f"{count} = {count} + ({new} IS NOT NULL)",
+            f"{mean} = CASE {skip} {mean} {first} {new} ELSE {mean} + ({new} - {mean}) / ({count} + 1) END",
+            f"{m2} = CASE {skip} {m2} {first} 0.0 "
+            f"ELSE {m2} + ({new} - {mean}) * ({new} - {mean}) * {count} / ({count} + 1) END",
+            f"{ewma} = CASE {skip} {ewma} {first} {new} ELSE {ewma} + {EWMA_ALPHA} * ({new} - {ewma}) END",
+        ]
+    return (
+        f"INSERT INTO {analytics_table(table_name)} ({', '.join(columns)}) VALUES ({', '.join(values)}) "
+        f"ON CONFLICT (patient_id) DO UPDATE SET {', '.join(updates)}; "
+    )
+
+
+def _insert_trigger(table_name: str) -> str:
+    """The trigger flagging and adding every new row of table_name, in O(1) whatever the history of its patient."""
+
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {analytics_table(table_name)}_insert AFTER INSERT ON {table_name} "
+        f"WHEN NOT EXISTS (SELECT 1 FROM {rollups.pause_table(table_name)}) BEGIN "
+        f"{_flag_anomalies(table_name)}"
+        f"{_update_state(table_name)}"
+        f"END;"
+    )
+
+
+def _delete_trigger(table_name: str) -> str:
+    """
+    The trigger dropping the anomalies of every deleted row, the state keeps the readings it has seen.
+    Rows archived under rollups.paused keep their anomalies, since they are not flagged again when restored.
+    """
+
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {anomalies_table(table_name)}_delete AFTER DELETE ON {table_name} "
+        f"WHEN NOT EXISTS (SELECT 1 FROM {rollups.pause_table(table_name)}) BEGIN "
+        f"DELETE FROM {anomalies_table(table_name)} WHERE record_id = OLD.record_id; "
+        f"END;"
+    )
+
+
+def _group_sums(values: "np.ndarray", starts: "np.ndarray", group: "np.ndarray") -> "np.ndarray":
+    """The running sums of values restarted at every start, one group after the other."""
+
+    import numpy as np
+
+    sums = np.cumsum(values)
+    before = np.concatenate(([0.0], sums[starts[1:] - 1]))
+    return sums - before[group]
+
+
+def _backfill(db: DatabaseManager, table_name: str) -> int:
+    """
+    Computes the state of every patient and the anomalies of the rows of table_name with NumPy,
+    over all the rows of a vital at once, in record id order like the insert trigger sees them.
+    The mean and M2 come from running sums of the readings shifted by the first one of their
+    patient, and the EWMA from the weights of the readings in it. Returns the number of anomalies.
+    """
+
+    import numpy as np
+
+    arrays = db.fetch_columns(
+        table_name=table_name,
+        columns={
+            "record_id": "int64", "patient_id": "int64", "date": "object",
+            **{vital: "float64" for vital in ANALYSED_VITALS}
+        },
+        order_by="patient_id, record_id"
+    )
+    patients = np.unique(arrays["patient_id"])
+    states: t.Dict[str, t.List[t.Any]] = {"patient_id": patients.tolist()}
+    anomalies: t.List[t.Dict[str, t.Any]] = []
+
+    for vital in ANALYSED_VITALS:
+        present = np.flatnonzero(~np.isnan(arrays[vital]))
+        if not present.size:
+            states[f"{vital}_count"] = [0] * patients.size
+            for statistic in ("mean", "m2", "ewma"):
+                states[f"{vital}_{statistic}"] = [None] * patients.size
+            continue
+        values = arrays[vital][present]
+        owners = arrays["patient_id"][present]
+        starts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1])))
+        counts = np.diff(np.append(starts, values.size))
+        group = np.repeat(np.arange(starts.size), counts)
+        # Readings of the patient before each one.
+        position = np.arange(values.size) - starts[group]
+
+        shifted = values - values[starts][group]
+        sums = _group_sums(shifted, starts, group)
+        squares = _group_sums(shifted * shifted, starts, group)
+        sums_before = sums - shifted
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_before = sums_before / position
+            m2_before = squares - shifted * shifted - sums_before * mean_before
+            zscores = (shifted - mean_before) / np.sqrt(m2_before / (position - 1))
+        flagged = (position >= MIN_READINGS) & (m2_before > 0) & (np.abs(zscores) >= ZSCORE_THRESHOLD)
+        for row, zscore in zip(present[flagged].tolist(), zscores[flagged].tolist()):
+            anomalies.append({
+                "record_id": int(arrays["record_id"][row]),
+                "patient_id": int(arrays["patient_id"][row]),
+                "date": arrays["date"][row],
+                "vital": vital,
+                "value": float(arrays[vital][row]),
+                "zscore": zscore,
+            })
+
+        ends = starts + counts - 1
+        weights = EWMA_ALPHA * (1 - EWMA_ALPHA) ** (counts[group] - 1 - position)
+        weights[starts] = (1 - EWMA_ALPHA) ** (counts - 1)
+        # Patients without a reading of the vital keep a count of 0 and NULL statistics.
+        slots = np.searchsorted(patients, owners[starts])
+        count = np.zeros(patients.size, dtype=np.int64)
+        count[slots] = counts
+        columns = {
+            "mean": values[starts] + sums[ends] / counts,
+            "m2": np.maximum(squares[ends] - sums[ends] * sums[ends] / counts, 0.0),
+            "ewma": np.bincount(group, weights=weights * values, minlength=starts.size),
+        }
+        states[f"{vital}_count"] = count.tolist()
+        for statistic, column in columns.items():
+            filled = np.full(patients.size, np.nan)
+            filled[slots] = column
+            states[f"{vital}_{statistic}"] = [None if math.isnan(value) else value for value in filled.tolist()]
+
+    names = list(states)
+    db.add_records(
+        table_name=analytics_table(table_name),
+        rows=(dict(zip(names, row)) for row in zip(*states.values()))
+    )
+    db.add_records(table_name=anomalies_table(table_name), rows=anomalies)
+    return len(anomalies)
+
+
+def drop_triggers(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """Drops the triggers of the analytics of table_name, so create_analytics recreates them."""
+
+    db.execute(f"DROP TRIGGER IF EXISTS {analytics_table(table_name)}_insert;")
+    db.execute(f"DROP TRIGGER IF EXISTS {anomalies_table(table_name)}_delete;")
+
+
+def create_analytics(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """
+    Creates the table holding the running statistics of every vital of every patient of
+    table_name (count, mean and M2 by Welford's algorithm, and an EWMA), the table of the
+    anomalies found in its rows, and the triggers that keep both up to date on every insert,
+    whichever command or path writes the rows. Like the rollups, the statistics keep the rows
+    archived or deleted since, and the anomalies the rows archived, and a table created for rows
+    that already exist is backfilled.
+    """
+
+    with db.transaction():
+        db.create_table(table_name=rollups.pause_table(table_name), columns={"paused": "INTEGER"})
+        existed = db.table_exists(analytics_table(table_name))
+        db.create_table(table_name=analytics_table(table_name), columns=_state_columns())
+        db.create_table(table_name=anomalies_table(table_name), columns=ANOMALY_COLUMNS)
+        db.create_index(
+            index_name=f"idx_{anomalies_table(table_name)}_patient_date",
+            table_name=anomalies_table(table_name),
+            columns=("patient_id", "date")
+        )
+        db.execute(_insert_trigger(table_name))
+        db.execute(_delete_trigger(table_name))
+        if not existed:
+            _backfill(db, table_name)
+
+
+def rebuild_analytics(db: DatabaseManager, table_name: str = "vitals") -> int:
+    """
+    Recomputes the statistics and anomalies of table_name from its rows with the vectorised
+    backfill, for repairs after manual edits or a restore. Returns the number of anomalies.
+    """
+
+    with db.transaction():
+        db.execute(f"DELETE FROM {analytics_table(table_name)};")
+        db.execute(f"DELETE FROM {anomalies_table(table_name)};")
+        return _backfill(db, table_name)
+
+
+def forget(db: DatabaseManager, patient_id: int, table_name: str = "vitals") -> None:
+    """Drops the statistics of a patient, after all their records were deleted."""
+
+    db.execute(f"DELETE FROM {analytics_table(table_name)} WHERE patient_id = ?;", (patient_id,))
+
+
+def select_trends(db: DatabaseManager, patient_id: int, table_name: str = "vitals") -> t.Dict[str, VitalTrend]:
+    """Returns the running statistics of every vital of a patient, read from one row."""
+
+    row = db.select_record(
+        table_name=analytics_table(table_name), criteria={"patient_id": patient_id}
+    ).fetchone()
+    trends = {}
+    for position, vital in enumerate(ANALYSED_VITALS):
+        readings, mean, m2, ewma = row[1 + 4 * position:5 + 4 * position] if row else (0, None, None, None)
+        stddev = math.sqrt(m2 / (readings - 1)) if readings > 1 and m2 is not None else None
+        trends[vital] = VitalTrend(readings, mean, stddev, ewma)
+    return trends
+
+
+def select_anomalies(
+    db: DatabaseManager,
+    patient_id: int,
+    since: t.Optional[str] = None,
+    until: t.Optional[str] = None,
+    table_name: str = "vitals"
+) -> t.List[Anomaly]:
+    """Returns the stored anomalies of a patient ordered by date, through the (patient_id, date) index."""
+
+    rows = db.select_record(
+        table_name=anomalies_table(table_name),
+        criteria={"patient_id": patient_id},
+        order_by="date",
+        since=since,
+        until=until
+    ).fetchall()
+    return [Anomaly(*row) for row in rows]
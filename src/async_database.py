@@ -0,0 +1,90 @@
+""" A module for using the persistence layer from asyncio code """
+
+import sqlite3
+import threading
+import typing as t
+
+from functools import partial
+
+from src.database import DatabaseManager, DEFAULT_BATCH_SIZE
+
+if t.TYPE_CHECKING:
+    from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_READER_THREADS = 4
+
+T = t.TypeVar("T")
+
+
+class AsyncDatabaseManager:
+    """ A class that exposes a DatabaseManager to coroutines.
+    Every SQLite call runs on executor threads instead of the event loop: writes on one
+    dedicated writer thread, in submission order, and reads on a small pool of reader threads
+    that each keep their own connection. Awaiting a call never blocks the loop."""
+
+    def __init__(self, db: DatabaseManager, reader_threads: int = DEFAULT_READER_THREADS):
+        """Wraps db, the executors are created on first use, so only async callers pay for importing them."""
+
+        self.db = db
+        self.reader_threads = reader_threads
+        self._executors_lock = threading.Lock()
+        self._writer: t.Optional["ThreadPoolExecutor"] = None
+        self._readers: t.Optional["ThreadPoolExecutor"] = None
+
+    def _executors(self) -> t.Tuple["ThreadPoolExecutor", "ThreadPoolExecutor"]:
+        with self._executors_lock:
+            if self._writer is None or self._readers is None:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+                self._readers = ThreadPoolExecutor(max_workers=self.reader_threads, thread_name_prefix="db-reader")
+            return self._writer, self._readers
+
+    async def _run(
+        self, executor: "ThreadPoolExecutor", function: t.Callable[..., T], *args: t.Any, **kwargs: t.Any
+    ) -> T:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(function, *args, **kwargs))
+
+    async def run_write(self, function: t.Callable[..., T], *args: t.Any, **kwargs: t.Any) -> T:
+        """Runs a blocking function that writes to the database on the writer thread."""
+
+        return await self._run(self._executors()[0], function, *args, **kwargs)
+
+    async def run_read(self, function: t.Callable[..., T], *args: t.Any, **kwargs: t.Any) -> T:
+        """Runs a blocking function that only reads from the database on a reader thread."""
+
+        return await self._run(self._executors()[1], function, *args, **kwargs)
+
+    async def add_record(self, table_name: str, data: t.Dict[str, t.Union[str, int, float]]) -> None:
+        await self.run_write(self.db.add_record, table_name=table_name, data=data)
+
+    async def add_records(
+        self,
+        table_name: str,
+        rows: t.Iterable[t.Dict[str, t.Union[str, int, float]]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> int:
+        return await self.run_write(self.db.add_records, table_name=table_name, rows=rows, batch_size=batch_size)
+
+    async def delete_record(self, table_name: str, criteria: t.Dict[str, t.Union[str, int, float]]) -> None:
+        await self.run_write(self.db.delete_record, table_name=table_name, criteria=criteria)
+
+    async def select_record(self, table_name: str, **kwargs: t.Any) -> t.List[tuple]:
+        """Same arguments as DatabaseManager.select_record, returns the fetched rows instead of a cursor."""
+
+        def fetch() -> t.List[tuple]:
+            cursor: sqlite3.Cursor = self.db.select_record(table_name=table_name, **kwargs)
+            return cursor.fetchall()
+
+        return await self.run_read(fetch)
+
+    def close(self) -> None:
+        """Waits for the submitted calls to finish and stops the executor threads."""
+
+        with self._executors_lock:
+            if self._writer is not None and self._readers is not None:
+                self._writer.shutdown(wait=True)
+                self._readers.shutdown(wait=True)
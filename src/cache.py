@@ -0,0 +1,85 @@
+""" A module for caching query results until the data behind them changes """
+
+import threading
+import typing as t
+
+from collections import OrderedDict
+
+DEFAULT_CACHE_ENTRIES = 256
+
+T = t.TypeVar("T")
+
+
+class TableVersions:
+    """ A class that counts the writes to a table, in total and per patient.
+    Write commands bump the counter of the patient they touched, so cached results
+    keyed on a patient's version stay valid while other patients are written to."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = 0
+        self._all_patients = 0
+        # Keyed on str(patient_id), since the forms hand in patient ids as text.
+        self._patients: t.Dict[str, int] = {}
+
+    def bump(self, patient_id: t.Optional[t.Union[int, str]] = None) -> None:
+        """Records a write, to one patient's records or, with no patient, to any of them."""
+
+        with self._lock:
+            self._table += 1
+            if patient_id is None:
+                self._all_patients += 1
+            else:
+                key = str(patient_id)
+                self._patients[key] = self._patients.get(key, 0) + 1
+
+    def table(self) -> int:
+        """Returns a version that changes on every write to the table."""
+
+        return self._table
+
+    def patient(self, patient_id: t.Union[int, str]) -> t.Tuple[int, int]:
+        """Returns a version that changes on every write that can touch the patient's records."""
+
+        with self._lock:
+            return self._patients.get(str(patient_id), 0), self._all_patients
+
+
+class QueryCache:
+    """ A class that memoises query results by key together with the version they were loaded at.
+    A lookup with a newer version reloads and replaces the entry, and the least recently
+    used entries are evicted beyond max_entries."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[t.Hashable, t.Tuple[t.Hashable, t.Any]]" = OrderedDict()
+
+    def get(self, key: t.Hashable, version: t.Hashable, load: t.Callable[[], T]) -> T:
+        """
+        Returns the result cached under key at version, calling load when there is none.
+        Read the version before calling, so a write during load leaves the entry stale, not wrong.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+
+        result = load()
+
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,62 @@
+""" A module for reading the vitals table into NumPy arrays and pandas DataFrames """
+
+import typing as t
+
+from src.database import DatabaseManager, EPOCH_MS
+
+if t.TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# Compact dtypes of the vitals columns: float32 holds every vital with NaN for a missing reading.
+VITALS_DTYPES: t.Dict[str, str] = {
+    "record_id": "int32",
+    "patient_id": "int32",
+    "date": EPOCH_MS,
+    "heart_rate": "float32",
+    "systolic": "float32",
+    "diastolic": "float32",
+    "respiratory_rate": "float32",
+    "oxygen_saturation": "float32",
+    "temperature": "float32",
+    "news2": "float32",
+}
+
+
+def vitals_columns(
+    db: DatabaseManager,
+    criteria: t.Dict[str, t.Union[str, int, float]] = {},
+    since: t.Optional[str] = None,
+    until: t.Optional[str] = None,
+    columns: t.Optional[t.Sequence[str]] = None,
+    table_name: str = "vitals"
+) -> t.Dict[str, "np.ndarray"]:
+    """Returns the vitals matching criteria, ordered by date, as one typed array per column."""
+
+    selected = columns or tuple(VITALS_DTYPES)
+    return db.fetch_columns(
+        table_name=table_name,
+        columns={column: VITALS_DTYPES[column] for column in selected},
+        criteria=criteria,
+        order_by="date",
+        since=since,
+        until=until
+    )
+
+
+def vitals_dataframe(
+    db: DatabaseManager,
+    criteria: t.Dict[str, t.Union[str, int, float]] = {},
+    since: t.Optional[str] = None,
+    until: t.Optional[str] = None,
+    columns: t.Optional[t.Sequence[str]] = None,
+    table_name: str = "vitals"
+) -> "pd.DataFrame":
+    """Builds a DataFrame straight from the typed arrays, with the date as datetime64[ms]."""
+
+    import pandas as pd
+
+    arrays = vitals_columns(db, criteria, since, until, columns, table_name)
+    if "date" in arrays:
+        arrays["date"] = arrays["date"].astype("datetime64[ms]")
+    return pd.DataFrame(arrays, copy=False)
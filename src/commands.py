@@ -1,12 +1,118 @@
+import math
 import sys
 
 import typing as t
 
 from datetime import datetime
+from itertools import islice
 
-from src.database import DatabaseManager
+from src import alerts, analytics, ingest, latest, migrations, profiling, replica, retention, rollups, scoring, transfer
+from src.async_database import AsyncDatabaseManager
+from src.cache import QueryCache, TableVersions
+from src.database import DatabaseManager, DEFAULT_BATCH_SIZE, DEFAULT_DELETE_CHUNK_SIZE
+from src.validation import InvalidRecordError, coerce_vitals
 
 db = DatabaseManager("patient_monitoring.db")
+async_db = AsyncDatabaseManager(db)
+
+# Bumped by every write command, so cached reads of the vitals table know when they are stale.
+versions = TableVersions()
+query_cache = QueryCache()
+
+# Evaluates the alert rules on every record the add commands write.
+alert_engine = alerts.AlertEngine()
+
+# The copy of db the read commands given a max_staleness read from, see reader(), and the
+# period of the thread refreshing it, None to only refresh it with refresh_snapshot().
+_replica: t.Optional[replica.Replica] = None
+snapshot_refresh_seconds: t.Optional[float] = replica.DEFAULT_REFRESH_SECONDS
+
+# (patient_id, date) serves patient lookups and per-patient time ranges already sorted by date,
+# (date) serves the full listing ordered by date and ward-wide time ranges.
+VITALS_INDEXES: t.Dict[str, t.Tuple[str, ...]] = {
+    "idx_vitals_patient_date": ("patient_id", "date"),
+    "idx_vitals_date": ("date",),
+}
+
+DEFAULT_PAGE_SIZE = 100
+
+ARCHIVE_DIRECTORY = "archive"
+
+DEFAULT_CHART_POINTS = 500
+CHARTED_VITALS = ("heart_rate", "respiratory_rate", "oxygen_saturation", "temperature")
+
+
+class RecordsPage(t.NamedTuple):
+    """One page of vitals records and the keyset to pass as after to fetch the next one."""
+
+    records: t.List[tuple]
+    next_after: t.Optional[tuple]
+
+
+def _records_page(records: t.List[tuple], page_size: int, keyset_positions: t.Sequence[int]) -> RecordsPage:
+    if len(records) < page_size:
+        return RecordsPage(records, None)
+    return RecordsPage(records, tuple(records[-1][position] for position in keyset_positions))
+
+
+def records_written(records: t.Iterable[ingest.Record]) -> None:
+    """Bumps the versions of the patients of written records, pass it as on_flush to write-behind buffers."""
+
+    # Written records went through coerce_vitals, which makes every patient id an int.
+    for patient_id in {t.cast(int, record["patient_id"]) for record in records}:
+        versions.bump(patient_id)
+
+
+def prepare_record(data: ingest.Record) -> ingest.Record:
+    """Dates a new record with the current time when it has no date, coerces it and scores it."""
+
+    if not data.get("date"):
+        data["date"] = datetime.utcnow().isoformat()
+    record = coerce_vitals(data)
+    record["news2"] = scoring.score_record(record).total
+    return record
+
+
+def data_version() -> int:
+    """
+    Returns a version of the database that changes with every commit, including those of other
+    processes such as the ingestion server, which do not bump versions. Caches of the dashboard
+    combine both.
+    """
+
+    return db.pool.data_version()
+
+
+def _snapshots() -> replica.Replica:
+    global _replica
+    if _replica is None or _replica.source is not db:
+        if _replica is not None:
+            _replica.close()
+        _replica = replica.Replica(db, refresh_seconds=snapshot_refresh_seconds)
+    return _replica
+
+
+def reader(max_staleness: t.Optional[float] = None) -> DatabaseManager:
+    """
+    Returns the database to read from: db itself, or when the caller tolerates data up to
+    max_staleness seconds old, the latest snapshot of it, whose queries never hold up the writes,
+    if it is recent enough. Snapshots are taken in the background, never by the caller.
+    """
+
+    return db if max_staleness is None else _snapshots().database(max_staleness)
+
+
+def snapshot_version(max_staleness: float) -> replica.SnapshotVersion:
+    """Returns a version of what reader(max_staleness) reads, for caches of results read from it."""
+
+    return _snapshots().version(max_staleness)
+
+
+def refresh_snapshot() -> int:
+    """Takes a new snapshot now if db changed since the last one, and returns its generation."""
+
+    return _snapshots().refresh()
+
 
 class Command(t.Protocol):
     def execute(self):
@@ -14,6 +120,8 @@ class Command(t.Protocol):
 
 class CreateVitalSignsTableCommand:
     def execute(self):
+        retention.enable_incremental_vacuum(db)
+        migrations.migrate(db, table_name="vitals")
         db.create_table(
             table_name="vitals",
             columns={
@@ -21,70 +129,546 @@ class CreateVitalSignsTableCommand:
                 'patient_id': 'INTEGER NOT NULL',
                 'date': 'TEXT NOT NULL',
                 'heart_rate': 'INTEGER',
-                'blood_pressure': 'TEXT',
+                'systolic': 'INTEGER',
+                'diastolic': 'INTEGER',
                 'respiratory_rate': 'INTEGER',
                 'oxygen_saturation': 'REAL',
-                'temperature': 'REAL'
+                'temperature': 'REAL',
+                'news2': 'INTEGER'
             }
         )
+        for index_name, columns in VITALS_INDEXES.items():
+            db.create_index(index_name=index_name, table_name="vitals", columns=columns)
+        rollups.create_rollups(db, table_name="vitals")
+        latest.create_latest(db, table_name="vitals")
+        analytics.create_analytics(db, table_name="vitals")
 
 class AddRecordCommand:
-    """ A command class the adds a vitals record for a patient"""
+    """ A command class the adds a vitals record for a patient.
+    When given a write-behind buffer the record is queued and written in a group commit.
+    The alerts the record raised are kept in alerts after execute."""
+
+    def __init__(self, buffer: t.Optional[ingest.WriteBehindBuffer] = None):
+        self.buffer = buffer
+        self.alerts: t.List[alerts.Alert] = []
 
-    def execute(self, data: t.Dict[str, t.Union[str, int, float]]) -> str:
+    def execute(self, data: ingest.Record) -> str:
         "The actual execution of the command."
 
-        date = datetime.utcnow().isoformat()
-        data.setdefault("date", date)
-        patient_id = data["patient_id"]
+        data = prepare_record(data)
+        patient_id = t.cast(int, data["patient_id"])
 
-        db.add_record(table_name="vitals", data=data)
+        if self.buffer is not None:
+            self.buffer.add(data)
+        else:
+            db.add_record(table_name="vitals", data=data)
+        self.alerts = alert_engine.process(data)
+
+        if self.buffer is not None and self.buffer.durability == ingest.BOUNDED_LOSS:
+            return f"Vital signs queued for patient {patient_id}."
+        versions.bump(patient_id)
 
         return f"Vital signs successfully recorded for patient {patient_id}."
 
+    async def execute_async(self, data: ingest.Record) -> str:
+        "Runs the command on the database writer thread without blocking the event loop."
+
+        return await async_db.run_write(self.execute, data)
+
+
+class BulkAddRecordsCommand:
+    """ A command class that adds many vitals records in batched transactions.
+    The alerts of a batch are evaluated once it is committed, and kept in alerts after execute."""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.alerts: t.List[alerts.Alert] = []
+
+    def execute(self, data: t.Iterable[ingest.Record]) -> str:
+        "The actual execution of the command."
+
+        patient_ids: t.Set[int] = set()
+        self.alerts = []
+
+        def with_dates() -> t.Iterator[ingest.Record]:
+            for record in data:
+                if not record.get("date"):
+                    record["date"] = datetime.utcnow().isoformat()
+                record = coerce_vitals(record, complete=True)
+                record["news2"] = scoring.score_record(record).total
+                patient_ids.add(t.cast(int, record["patient_id"]))
+                yield record
+
+        records = with_dates()
+        count = 0
+        try:
+            batch = list(islice(records, self.batch_size))
+            while batch:
+                count += db.add_records(table_name="vitals", rows=batch, batch_size=self.batch_size)
+                # A batch that failed to commit raises no alerts for readings that were not recorded.
+                self.alerts.extend(alert_engine.process_batch(batch))
+                batch = list(islice(records, self.batch_size))
+        finally:
+            # Earlier batches are committed even when a later one fails.
+            for patient_id in patient_ids:
+                versions.bump(patient_id)
+
+        return f"{count} vital signs records successfully recorded."
+
 
 class ListRecordsCommand:
-    """A command class that lists vitals records based on specific criteria."""
+    """ A command class that lists vitals records based on specific criteria.
+    Given a max_staleness in seconds, they are read from a snapshot at most that old."""
 
-    def __init__(self, order_by: str = "date"):
+    def __init__(self, order_by: str = "date", max_staleness: t.Optional[float] = None):
         self.order_by = order_by
+        self.max_staleness = max_staleness
 
     def execute(self) -> t.List[str]:
         "The actual execution of the command."
 
-        cursor = db.select_record(
+        cursor = reader(self.max_staleness).select_record(
             table_name="vitals",
             order_by=self.order_by
         )
         results = cursor.fetchall()
         return results
 
+    async def execute_async(self) -> t.List[str]:
+        "Runs the command on a database reader thread without blocking the event loop."
+
+        return await async_db.run_read(self.execute)
+
+class ListRecordsPageCommand:
+    """ A command class that returns one page of vitals records using keyset pagination.
+    Given a max_staleness in seconds, it is read from a snapshot at most that old."""
+
+    def __init__(
+        self,
+        order_by: str = "date",
+        page_size: int = DEFAULT_PAGE_SIZE,
+        after: t.Optional[tuple] = None,
+        max_staleness: t.Optional[float] = None
+    ):
+        self.order_by = order_by
+        self.page_size = page_size
+        self.after = after
+        self.max_staleness = max_staleness
+
+    def execute(self) -> RecordsPage:
+        "The actual execution of the command."
+
+        cursor = reader(self.max_staleness).select_record(
+            table_name="vitals",
+            order_by=self.order_by,
+            limit=self.page_size,
+            after=self.after,
+            key_column="record_id"
+        )
+        positions = db.keyset_positions(cursor, self.order_by, "record_id")
+        return _records_page(cursor.fetchall(), self.page_size, positions)
+
+
 class GetPatientRecordsCommand:
-    """A command class that will return all the records of a specific patient."""
+    """ A command class that will return all the records of a specific patient.
+    Given a max_staleness in seconds, they are read from a snapshot at most that old."""
+
+    def __init__(self, max_staleness: t.Optional[float] = None):
+        self.max_staleness = max_staleness
 
     def execute (self, data: int) -> t.Optional[tuple]:
-        result = db.select_record(table_name="vitals", criteria={"patient_id": data}).fetchall()
+        result = reader(self.max_staleness).select_record(
+            table_name="vitals", criteria={"patient_id": data}
+        ).fetchall()
         return result
 
+    async def execute_async(self, data: int) -> t.Optional[tuple]:
+        "Runs the command on a database reader thread without blocking the event loop."
+
+        return await async_db.run_read(self.execute, data)
+
+
+class GetPatientRecordsPageCommand:
+    """ A command class that returns one page of a patient's records ordered by date, optionally
+    from since (inclusive) until (exclusive). Given a max_staleness in seconds, it is read from a
+    snapshot at most that old."""
+
+    def __init__(
+        self,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        after: t.Optional[tuple] = None,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        max_staleness: t.Optional[float] = None
+    ):
+        self.page_size = page_size
+        self.after = after
+        self.since = since
+        self.until = until
+        self.max_staleness = max_staleness
+
+    def execute(self, data: int) -> RecordsPage:
+        "The actual execution of the command."
+
+        cursor = reader(self.max_staleness).select_record(
+            table_name="vitals",
+            criteria={"patient_id": data},
+            order_by="date",
+            since=self.since,
+            until=self.until,
+            limit=self.page_size,
+            after=self.after,
+            key_column="record_id"
+        )
+        positions = db.keyset_positions(cursor, "date", "record_id")
+        return _records_page(cursor.fetchall(), self.page_size, positions)
+
+
+class GetPatientRecordsInRangeCommand:
+    """ A command class that returns the records of a patient between two dates, ordered by date.
+    Given a max_staleness in seconds, they are read from a snapshot at most that old."""
+
+    def __init__(
+        self,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        max_staleness: t.Optional[float] = None
+    ):
+        self.since = since
+        self.until = until
+        self.max_staleness = max_staleness
+
+    def execute(self, data: int) -> t.List[tuple]:
+        "The actual execution of the command."
+
+        cursor = reader(self.max_staleness).select_record(
+            table_name="vitals",
+            criteria={"patient_id": data},
+            order_by="date",
+            since=self.since,
+            until=self.until
+        )
+        return cursor.fetchall()
+
+
+def bucket_seconds_for(first: str, last: str, target_points: int) -> int:
+    """Returns the smallest whole-second bucket that splits the time range into at most target_points buckets."""
+
+    seconds = (datetime.fromisoformat(last) - datetime.fromisoformat(first)).total_seconds()
+    # Buckets are aligned to the epoch, so the range can straddle one bucket more than it spans.
+    return max(1, math.ceil((seconds + 1) / max(1, target_points - 1)))
+
+
+class GetPatientVitalsDownsampledCommand:
+    """ A command class that returns a patient's vitals aggregated into at most target_points time buckets.
+    Each row holds the bucket start, the number of readings, then the min, mean and max of every charted vital."""
+
+    def __init__(
+        self,
+        target_points: int = DEFAULT_CHART_POINTS,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None
+    ):
+        self.target_points = target_points
+        self.since = since
+        self.until = until
+
+    def execute(self, data: int) -> t.List[tuple]:
+        "The actual execution of the command."
+
+        first, last = db.select_bounds(table_name="vitals", criteria={"patient_id": data})
+        if first is None:
+            return []
+        first = max(first, self.since) if self.since else first
+        last = min(last, self.until) if self.until else last
+        if first > last:
+            return []
+
+        cursor = db.select_buckets(
+            table_name="vitals",
+            columns=CHARTED_VITALS,
+            bucket_seconds=bucket_seconds_for(first, last, self.target_points),
+            criteria={"patient_id": data},
+            since=self.since,
+            until=self.until
+        )
+        return cursor.fetchall()
+
+
+class GetPatientAggregatesCommand:
+    """ A command class that returns a patient's per minute, hour or day vitals aggregates.
+    They are read from the rollup tables, so the cost depends on the number of buckets, not of records."""
+
+    def __init__(
+        self,
+        granularity: str = "hour",
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None
+    ):
+        self.granularity = granularity
+        self.since = since
+        self.until = until
+
+    def execute(self, data: int) -> t.List[rollups.BucketAggregate]:
+        "The actual execution of the command."
+
+        return rollups.select_aggregates(
+            db,
+            patient_id=data,
+            granularity=self.granularity,
+            since=self.since,
+            until=self.until,
+            table_name="vitals"
+        )
+
+
+class GetLatestVitalsCommand:
+    """ A command class that returns the latest record of every patient, ordered by patient id.
+    It is read from the latest_vitals table, so the cost depends on the number of patients, not of records."""
+
+    def execute(self) -> t.List[tuple]:
+        "The actual execution of the command."
+
+        return latest.select_latest(db, table_name="vitals")
+
+
+class GetPatientTrendsCommand:
+    """ A command class that returns the running mean, standard deviation and EWMA of every vital of a patient.
+    They are kept up to date by a trigger on every insert, so reading them costs one row."""
+
+    def execute(self, data: int) -> t.Dict[str, analytics.VitalTrend]:
+        "The actual execution of the command."
+
+        return analytics.select_trends(db, patient_id=data, table_name="vitals")
+
+
+class GetPatientAnomaliesCommand:
+    """ A command class that returns the readings of a patient flagged as anomalies when they were recorded,
+    ordered by date, optionally from since (inclusive) until (exclusive)."""
+
+    def __init__(self, since: t.Optional[str] = None, until: t.Optional[str] = None):
+        self.since = since
+        self.until = until
+
+    def execute(self, data: int) -> t.List[analytics.Anomaly]:
+        "The actual execution of the command."
+
+        return analytics.select_anomalies(db, patient_id=data, since=self.since, until=self.until, table_name="vitals")
+
+
+class RebuildAnalyticsCommand:
+    """A command class that recomputes the trends and anomalies of every patient from the vitals table."""
+
+    def execute(self) -> str:
+        "The actual execution of the command."
+
+        count = analytics.rebuild_analytics(db, table_name="vitals")
+        versions.bump()
+        return f"Trends rebuilt, {count} anomalies found."
+
 
 class DeleteRecordCommand:
         """A command class that deletes a single record from the SQL table"""
         
         def execute(self, data: int) -> str:
-            db.delete_record(table_name="vitals", criteria={"record_id": data})
+            for row in rollups.delete_records(db, table_name="vitals", keys=[data]):
+                versions.bump(row[0])
             return f"Record {data} deleted."
 
 
+class DeleteRecordsCommand:
+    """ A command class that deletes many records by their ids in one call, in batched transactions.
+    The rollups are updated once per batch and the cached reads of the patients are invalidated."""
+
+    def __init__(self, batch_size: int = DEFAULT_DELETE_CHUNK_SIZE):
+        self.batch_size = batch_size
+
+    def execute(self, data: t.Iterable[int]) -> str:
+        "The actual execution of the command."
+
+        deleted = rollups.delete_records(db, table_name="vitals", keys=data, batch_size=self.batch_size)
+        for patient_id in {row[0] for row in deleted}:
+            versions.bump(patient_id)
+        return f"{len(deleted)} records deleted."
+
+
 class DeletePatientRecordsCommand:
-        """A command class that deletes a record from the SQL table"""
-        
+        """ A command class that deletes all the records of a patient, in chunks of chunk_size
+        records, so the writes of other patients are not blocked until the last one is gone."""
+
+        def __init__(self, chunk_size: int = DEFAULT_DELETE_CHUNK_SIZE):
+            self.chunk_size = chunk_size
+
         def execute(self, data: int) -> str:
-            db.delete_record(table_name="vitals", criteria={"patient_id": data})
+            try:
+                rollups.delete_in_chunks(
+                    db, table_name="vitals", criteria={"patient_id": data}, chunk_size=self.chunk_size
+                )
+            finally:
+                # Also after a failure, the chunks deleted before it are committed.
+                versions.bump(data)
+                alert_engine.forget(data)
+            analytics.forget(db, data, table_name="vitals")
             return f"All records deleted for patient {data}."
 
 
+def prepare_imported_record(record: t.Dict[str, t.Any]) -> ingest.Record:
+    """Coerces and scores a record read from a file, the ids and scores of exports are recomputed."""
+
+    record = {column: value for column, value in record.items() if column not in ("record_id", "news2")}
+    if not record.get("date"):
+        raise InvalidRecordError("Imported records need a date.")
+    record = coerce_vitals(record, complete=True)
+    record["news2"] = scoring.score_record(record).total
+    return record
+
+
+class ImportRecordsCommand:
+    """ A command class that streams the vitals records of a CSV or NDJSON file into the table.
+    Invalid records are skipped and reported, and an import that failed resumes where it stopped."""
+
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, resume: bool = True):
+        self.batch_size = batch_size
+        self.resume = resume
+
+    def execute(self, data: str) -> str:
+        "The actual execution of the command."
+
+        try:
+            result = transfer.import_records(
+                db, data, prepare_imported_record, table_name="vitals",
+                batch_size=self.batch_size, resume=self.resume
+            )
+        finally:
+            versions.bump()
+
+        message = (
+            f"{result.rows} records imported from {data}{' (resumed)' if result.resumed else ''} "
+            f"in {result.seconds:.2f}s, {result.rows_per_second:,.0f} rows/s."
+        )
+        if result.skipped:
+            message += f" {result.skipped} invalid records skipped: " + "; ".join(result.errors)
+        return message
+
+
+class ExportRecordsCommand:
+    """A command class that streams the vitals records, optionally of one patient or dates, to a CSV or NDJSON file."""
+
+    def __init__(
+        self,
+        patient_id: t.Optional[int] = None,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None
+    ):
+        self.patient_id = patient_id
+        self.since = since
+        self.until = until
+
+    def execute(self, data: str) -> str:
+        "The actual execution of the command."
+
+        result = transfer.export_records(
+            db,
+            data,
+            table_name="vitals",
+            criteria={"patient_id": self.patient_id} if self.patient_id is not None else {},
+            since=self.since,
+            until=self.until
+        )
+        return f"{result.rows} records exported to {data} in {result.seconds:.2f}s, {result.rows_per_second:,.0f} rows/s."
+
+
+class ArchiveRecordsCommand:
+    """ A command class that moves the records older than retain_days into compressed archive files.
+    The per patient aggregates keep covering the archived records."""
+
+    def __init__(self, retain_days: int = retention.DEFAULT_RETAIN_DAYS):
+        self.retain_days = retain_days
+
+    def execute(self) -> str:
+        "The actual execution of the command."
+
+        policy = retention.RetentionPolicy(db, ARCHIVE_DIRECTORY, retain_days=self.retain_days, table_name="vitals")
+        result = policy.run()
+        if result.rows_archived:
+            versions.bump()
+        return (
+            f"{result.rows_archived} records older than {self.retain_days} days archived "
+            f"in {len(result.files)} files, {result.pages_vacuumed} pages freed."
+        )
+
+
+class RehydrateRecordsCommand:
+    """A command class that restores the archived records between two dates into the vitals table."""
+
+    def execute(self, data: t.Tuple[str, str]) -> str:
+        "The actual execution of the command."
+
+        since, until = data
+        policy = retention.RetentionPolicy(db, ARCHIVE_DIRECTORY, table_name="vitals")
+        restored = policy.rehydrate(since, until)
+        if restored:
+            versions.bump()
+        return f"{restored} archived records restored."
+
+
+class GetQueryStatsCommand:
+    """ A command class that returns, per statement shape, the calls, latencies, rows and query plan
+    of the statements run since the start or the last reset, the most time consuming first."""
+
+    def __init__(self, full_scans_only: bool = False):
+        self.full_scans_only = full_scans_only
+
+    def execute(self) -> t.List[profiling.QueryStats]:
+        "The actual execution of the command."
+
+        stats = db.profiler.stats()
+        if self.full_scans_only:
+            return [stat for stat in stats if stat.full_scan]
+        return stats
+
+
+class GetSlowQueriesCommand:
+    """A command class that returns the slow query log, most recent first."""
+
+    def execute(self) -> t.List[profiling.SlowQuery]:
+        "The actual execution of the command."
+
+        return db.profiler.slow_queries()
+
+
+class ConfigureProfilingCommand:
+    """ A command class that sets the duration from which statements are logged as slow and from
+    which their query plan is captured, None to turn either off."""
+
+    def __init__(
+        self,
+        slow_seconds: t.Optional[float] = profiling.DEFAULT_SLOW_SECONDS,
+        explain_seconds: t.Optional[float] = None
+    ):
+        self.slow_seconds = slow_seconds
+        self.explain_seconds = explain_seconds
+
+    def execute(self) -> None:
+        "The actual execution of the command."
+
+        db.profiler.slow_seconds = self.slow_seconds
+        db.profiler.explain_seconds = self.explain_seconds
+
+
+class ResetQueryStatsCommand:
+    """A command class that clears the query statistics and the slow query log."""
+
+    def execute(self) -> str:
+        "The actual execution of the command."
+
+        db.profiler.reset()
+        return "Query statistics cleared."
+
+
 class QuitCommand:
     """A command class that will exit the application."""
 
     def execute(self):
+        ingest.close_all()
         sys.exit()
@@ -1,10 +1,85 @@
 """ A module for the persistence layer """
 
+import json
 import sqlite3
+import time
 import typing as t
 
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 from textwrap import dedent
 
+from src import partitions, profiling
+from src.pool import ConnectionPool
+
+if t.TYPE_CHECKING:
+    import numpy as np
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FETCH_BATCH_SIZE = 65_536
+DEFAULT_DELETE_CHUNK_SIZE = 1_000
+
+# fetch_columns dtype of ISO 8601 text dates read as int64 milliseconds since the epoch.
+EPOCH_MS = "epoch_ms"
+
+# Same size as the sqlite3 prepared statement cache, so every SQL text kept here
+# also stays compiled in the connection.
+STATEMENT_CACHE_SIZE = 128
+
+
+class StatementCacheInfo(t.NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class StatementCache:
+    """A least recently used cache of SQL texts keyed on the shape of the statement."""
+
+    def __init__(self, maxsize: int = STATEMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._statements: "OrderedDict[t.Hashable, str]" = OrderedDict()
+
+    def get(self, key: t.Hashable, build: t.Callable[[], str]) -> str:
+        """Returns the statement cached under key, building and caching it on a miss."""
+
+        statement = self._statements.get(key)
+        if statement is not None:
+            self.hits += 1
+            self._statements.move_to_end(key)
+            return statement
+
+        self.misses += 1
+        statement = build()
+        self._statements[key] = statement
+        if len(self._statements) > self.maxsize:
+            self._statements.popitem(last=False)
+        return statement
+
+    def info(self) -> StatementCacheInfo:
+        return StatementCacheInfo(self.hits, self.misses, self.maxsize, len(self._statements))
+
+    def clear(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._statements.clear()
+
+
+def _explain(pool: ConnectionPool, statement: str) -> t.List[str]:
+    try:
+        rows = pool.reader().execute(
+            f"EXPLAIN QUERY PLAN {statement}", [None] * statement.count("?")
+        ).fetchall()
+    except sqlite3.Error as error:
+        return [f"No plan: {error}"]
+    return [row[3] for row in rows]
+
+
 class DatabaseManager:
     """ A class that provides an interface for managing a SQLite database. 
     The class has methods for connecting to the database, creating tables, 
@@ -12,22 +87,95 @@ class DatabaseManager:
     the database and fetching results."""
 
     def __init__(self, db_name: str):
-        """Initializes the connection with the the SQLite database."""
+        """Initializes the connection pool of the SQLite database, which connects on the first statement."""
 
-        self.conn = sqlite3.connect(db_name, check_same_thread=False, isolation_level=None)
+        self.pool = ConnectionPool(
+            db_name,
+            isolation_level=None,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        self.statement_cache = StatementCache(STATEMENT_CACHE_SIZE)
+        # Bound to the pool rather than to self, so the manager is freed, and closed, once unreferenced.
+        self.profiler = profiling.QueryProfiler(explain=partial(_explain, self.pool))
+        # Table name -> PartitionSpec, or None for the tables that are not partitioned.
+        self._partition_specs: t.Dict[str, t.Optional[partitions.PartitionSpec]] = {}
+        # Table name -> (schema version, months of its partitions at that version).
+        self._partition_months: t.Dict[str, t.Tuple[int, t.List[str]]] = {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.pool.writer_connection
 
     def __del__(self):
-        """Closes the connection when the database is no longer in use."""
+        """Closes the connections when the database is no longer in use."""
         
-        self.conn.close()
+        self.pool.close()
+
+    @staticmethod
+    def _is_read(statement: str) -> bool:
+        return statement.lstrip().upper().startswith(("SELECT", "EXPLAIN"))
+
+    @contextmanager
+    def transaction(self) -> t.Iterator[sqlite3.Connection]:
+        """
+        Waits for the writer connection and runs the block inside one explicit transaction,
+        committed when the block succeeds and rolled back when it raises. Writes executed
+        through the manager by the same thread inside the block join the transaction; reads
+        only see committed data, so read the transaction's own writes through the yielded connection.
+        """
+
+        with self.pool.writer() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
 
     def _execute(self, statement: str, values: t.Optional[t.Tuple] = None) -> sqlite3.Cursor:
-        """Takes an SQL statement and optionally values for placeholders and executes it with SQLite"""
+        """
+        Takes an SQL statement and optionally values for placeholders and executes it with SQLite.
+        Reads run on the connection of the calling thread, writes wait for the single writer.
+        Every call is measured by the profiler, see profiling.QueryProfiler.
+        """
 
         try:
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute(statement, values or [])
+            if self._is_read(statement) and not self.pool.in_memory:
+                return self._run(self.pool.reader(), statement, values)
+
+            with self.pool.writer() as conn:
+                if conn.in_transaction:
+                    return self._run(conn, statement, values)
+                with conn:
+                    return self._run(conn, statement, values)
+
+        except (sqlite3.IntegrityError, sqlite3.OperationalError):
+            print(
+                f"Something went wrong with the following transaction:\n {statement}"
+                )
+            raise
+
+    def _run(self, conn: sqlite3.Connection, statement: str, values: t.Optional[t.Tuple]) -> sqlite3.Cursor:
+        if not self.profiler.enabled:
+            return conn.cursor().execute(statement, values or [])
+        return conn.cursor(profiling.ProfiledCursor).profile(self.profiler, statement, values)
+
+    def _executemany(
+        self, statement: str, values: t.Iterable[t.Tuple]
+    ) -> sqlite3.Cursor:
+        """Executes the same SQL statement for every tuple of values inside one explicit transaction"""
+
+        try:
+            with self.transaction() as conn:
+                start = time.perf_counter()
+                cursor = conn.cursor().executemany(statement, values)
+                if self.profiler.enabled:
+                    self.profiler.record(statement, time.perf_counter() - start, max(cursor.rowcount, 0))
                 return cursor
 
         except (sqlite3.IntegrityError, sqlite3.OperationalError):
@@ -35,7 +183,32 @@ class DatabaseManager:
                 f"Something went wrong with the following transaction:\n {statement}"
                 )
             raise
-    
+
+    def explain(self, statement: str) -> t.List[str]:
+        """
+        Returns the details of the query plan of a statement, bound to NULLs since SQLite
+        plans a statement before its values are known. The plan is read on the connection
+        of the calling thread, so it lacks the tables of a transaction still in progress.
+        """
+
+        return _explain(self.pool, statement)
+
+    def execute(self, statement: str, values: t.Optional[t.Tuple] = None) -> sqlite3.Cursor:
+        """
+        Executes a statement the other methods do not build, such as triggers or aggregates,
+        with the same routing of reads and writes. Returns the result cursor.
+        """
+
+        return self._execute(statement, values)
+
+    def table_exists(self, table_name: str) -> bool:
+        """Returns whether a table (or view) of that name exists."""
+
+        cursor = self._execute(
+            "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?;", (table_name,)
+        )
+        return cursor.fetchone() is not None
+
     def create_table(self, table_name: str, columns: t.Dict[str, str]) -> None:
         """
         Takes in a table name and the columns names as parameters (names as keys and types as values) 
@@ -57,6 +230,17 @@ class DatabaseManager:
 
         self._execute(statement)
 
+    def create_index(self, index_name: str, table_name: str, columns: t.Sequence[str]) -> None:
+        """
+        Takes in an index name, a table name and the indexed columns (in order) 
+        and executes the CREATE INDEX statement for SQLite.
+        """
+
+        columns_in_statement = ", ".join(columns)
+        statement = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns_in_statement});"
+
+        self._execute(statement)
+
     def drop_table(self, table_name: str) -> None:
         """
         Takes in a table name to delete using the DROP TABLE statement for SQLite
@@ -65,17 +249,179 @@ class DatabaseManager:
         statement = f"DROP TABLE {table_name};"
         self._execute(statement)
 
+    def create_partitioned_table(
+        self,
+        table_name: str,
+        columns: t.Dict[str, str],
+        range_column: str = "date",
+        indexes: t.Mapping[str, t.Sequence[str]] = {}
+    ) -> None:
+        """
+        Creates a table split into one table per month of the ISO dates in range_column, named
+        like vitals_p202301 and created on the first insert of the month, each with the given
+        indexes. table_name becomes a view over the partitions, and the add, update, delete and
+        select methods route to the partitions. A range of range_column only reads the partitions
+        of its months, and dropping a month is a DROP TABLE. An INTEGER PRIMARY KEY column gets
+        keys unique across partitions. Partitions have no rowid column, pass key_column instead.
+        """
 
-    def add_record(self, table_name:str, data: t.Dict[str, t.Union[str, int, float]]) -> None:
+        if self.table_exists(table_name):
+            raise ValueError(f"{table_name} already exists.")
+        key_column = partitions.key_column_of(columns)
+        with self.transaction():
+            self.create_table(table_name=partitions.CATALOG_TABLE, columns=partitions.CATALOG_COLUMNS)
+            self._execute(
+                f"INSERT INTO {partitions.CATALOG_TABLE} "
+                f"(table_name, range_column, key_column, columns, indexes, next_key) VALUES (?, ?, ?, ?, ?, 1);",
+                (table_name, range_column, key_column, json.dumps(columns),
+                 json.dumps({name: list(index) for name, index in indexes.items()}))
+            )
+            spec = partitions.PartitionSpec(
+                table_name, range_column, key_column, dict(columns),
+                {name: tuple(index) for name, index in indexes.items()}
+            )
+            self._create_partition_view(spec, [])
+        self._partition_specs[table_name] = spec
+
+    def _partition_spec(self, table_name: str) -> t.Optional[partitions.PartitionSpec]:
+        """Returns how table_name is partitioned, None when it is a plain table."""
+
+        if table_name not in self._partition_specs:
+            spec = None
+            # Straight on the connection, this runs once per table name ahead of its first statement.
+            conn = self.pool.reader()
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?;", (partitions.CATALOG_TABLE,)
+            ).fetchone():
+                row = conn.execute(
+                    f"SELECT range_column, key_column, columns, indexes FROM {partitions.CATALOG_TABLE} "
+                    f"WHERE table_name = ?;",
+                    (table_name,)
+                ).fetchone()
+                if row is not None:
+                    indexes = {name: tuple(index) for name, index in json.loads(row[3]).items()}
+                    spec = partitions.PartitionSpec(table_name, row[0], row[1], json.loads(row[2]), indexes)
+            self._partition_specs[table_name] = spec
+        return self._partition_specs[table_name]
+
+    def partition_months(self, table_name: str) -> t.List[str]:
+        """Returns the YYYY-MM months of the partitions of a partitioned table, oldest first."""
+
+        version = self._execute("SELECT schema_version FROM pragma_schema_version;").fetchone()[0]
+        cached = self._partition_months.get(table_name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        months = self._list_partitions(self.pool.reader(), table_name)
+        self._partition_months[table_name] = (version, months)
+        return months
+
+    @staticmethod
+    def _list_partitions(conn: sqlite3.Connection, table_name: str) -> t.List[str]:
+        names = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name;",
+            (partitions.partition_pattern(table_name),)
+        ).fetchall()
+        return [partitions.month_of_partition(name) for name, in names]
+
+    def _create_partition_view(self, spec: partitions.PartitionSpec, months: t.Sequence[str]) -> None:
+        self._execute(f"DROP VIEW IF EXISTS {spec.table_name};")
+        self._execute(f"CREATE VIEW {spec.table_name} AS {partitions.union_of(spec, months)};")
+
+    def _ensure_partition(self, spec: partitions.PartitionSpec, month: str) -> str:
+        """Creates the partition of a month with its indexes if it is missing, joining the transaction."""
+
+        name = partitions.partition_name(spec.table_name, month)
+        with self.transaction() as conn:
+            # Read on the writer, which sees the partitions created earlier in the transaction.
+            months = self._list_partitions(conn, spec.table_name)
+            if month in months:
+                return name
+
+            self.create_table(table_name=name, columns=partitions.partition_columns(spec, month))
+            for index_name, columns in spec.indexes.items():
+                self.create_index(
+                    index_name=partitions.partition_name(index_name, month), table_name=name, columns=columns
+                )
+            self._create_partition_view(spec, sorted(months + [month]))
+        return name
+
+    def drop_partition(self, table_name: str, month: str) -> None:
+        """Drops the partition of a YYYY-MM month with all its rows."""
+
+        spec = self._partition_spec(table_name)
+        if spec is None:
+            raise ValueError(f"{table_name} is not partitioned.")
+        with self.transaction() as conn:
+            months = self._list_partitions(conn, table_name)
+            if month in months:
+                self.drop_table(partitions.partition_name(table_name, month))
+                self._create_partition_view(spec, [other for other in months if other != month])
+
+    def drop_partitions_before(self, table_name: str, before: str) -> t.List[str]:
+        """Drops every partition whose month ends before the date before, returns their months."""
+
+        dropped = [
+            month for month in self.partition_months(table_name) if partitions.next_month(month) <= before
+        ]
+        for month in dropped:
+            self.drop_partition(table_name, month)
+        return dropped
+
+    def _targets(self, table_name: str, criteria: t.Mapping[str, t.Any] = {}) -> t.List[str]:
+        """
+        Returns the tables a write to table_name applies to: the table itself, or the partitions
+        of a partitioned table, only the one of its month for an equality on the range column.
+        """
 
-        """Taken in a table name and creates an INSERT data INTO statement and a data dictionary 
-        (the keys being columns and the values being data points)"""
+        spec = self._partition_spec(table_name)
+        if spec is None:
+            return [table_name]
+        months = self.partition_months(table_name)
+        if spec.range_column in criteria:
+            month = partitions.month_of(criteria[spec.range_column])
+            months = [month] if month in months else []
+        return [partitions.partition_name(table_name, month) for month in months]
+
+    def _source(
+        self,
+        table_name: str,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        range_column: str = "date",
+        criteria: t.Mapping[str, t.Any] = {}
+    ) -> str:
+        """
+        Returns what a SELECT on table_name reads FROM: the table itself, or for a partitioned
+        table only the partitions of the months a range (or an equality) on its range column
+        can match, aliased to table_name.
+        """
 
-        column_names = ", ".join(data.keys())
-        placeholders = ", ".join(["?"] * len(data.keys()))
-        column_values = tuple(data.values())
+        spec = self._partition_spec(table_name)
+        if spec is None:
+            return table_name
 
-        statement = dedent(
+        all_months = self.partition_months(table_name)
+        months = all_months
+        if range_column == spec.range_column:
+            months = partitions.overlapping(months, since, until)
+        if spec.range_column in criteria:
+            month = partitions.month_of(criteria[spec.range_column])
+            months = [month] if month in months else []
+        if months and months == all_months:
+            return table_name
+        if len(months) == 1:
+            return f"{partitions.partition_name(table_name, months[0])} AS {table_name}"
+        return f"({partitions.union_of(spec, months)}) AS {table_name}"
+
+
+    def _insert_statement(self, table_name: str, columns: t.Sequence[str]) -> str:
+        """Builds the INSERT INTO statement for the given table and column names"""
+
+        column_names = ", ".join(columns)
+        placeholders = ", ".join(["?"] * len(columns))
+
+        return dedent(
             f"""
             INSERT INTO
                 {table_name} (
@@ -86,59 +432,571 @@ class DatabaseManager:
             """
         )
 
+    def add_record(self, table_name:str, data: t.Dict[str, t.Union[str, int, float, None]]) -> None:
+
+        """Taken in a table name and creates an INSERT data INTO statement and a data dictionary 
+        (the keys being columns and the values being data points)"""
+
+        if self._partition_spec(table_name) is not None:
+            self.add_records(table_name=table_name, rows=[data])
+            return
+
+        columns = tuple(data.keys())
+        statement = self.statement_cache.get(
+            ("insert", table_name, columns), lambda: self._insert_statement(table_name, columns)
+        )
+        column_values = tuple(data.values())
+
         self._execute(statement, column_values)
 
+    def add_records(
+        self,
+        table_name: str,
+        rows: t.Iterable[t.Dict[str, t.Union[str, int, float, None]]],
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> int:
+        """
+        Inserts many rows with a single prepared INSERT statement. The rows are written with
+        executemany in batches of batch_size, each batch being one transaction, so a batch costs
+        one commit instead of one commit per row. Every row must have the same columns.
+        Returns the number of inserted rows.
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        rows = iter(rows)
+        first_batch = list(islice(rows, batch_size))
+        if not first_batch:
+            return 0
+
+        columns = tuple(first_batch[0].keys())
+        statement = self.statement_cache.get(
+            ("insert", table_name, columns), lambda: self._insert_statement(table_name, columns)
+        )
+
+        def values_of(batch: t.List[t.Dict[str, t.Union[str, int, float, None]]]) -> t.Iterator[t.Tuple]:
+            for row in batch:
+                if row.keys() != set(columns):
+                    raise ValueError(
+                        f"All rows must have the columns {columns}, got {tuple(row.keys())}."
+                    )
+                yield tuple(row[column] for column in columns)
+
+        spec = self._partition_spec(table_name)
+        inserted = 0
+        batch = first_batch
+        while batch:
+            if spec is None:
+                self._executemany(statement, values_of(batch))
+            else:
+                self._add_partitioned_batch(spec, columns, list(values_of(batch)))
+            inserted += len(batch)
+            batch = list(islice(rows, batch_size))
+
+        return inserted
+
+    def _add_partitioned_batch(
+        self, spec: partitions.PartitionSpec, columns: t.Tuple[str, ...], values: t.List[t.Tuple]
+    ) -> None:
+        """Inserts one batch into the partitions of the months of its rows, in one transaction."""
+
+        if spec.range_column not in columns:
+            raise ValueError(f"Rows of {spec.table_name} need a {spec.range_column} value.")
+        position = columns.index(spec.range_column)
+
+        with self.transaction() as conn:
+            if spec.key_column is not None and spec.key_column not in columns:
+                # Reserve a block of keys shared by all partitions.
+                end = conn.execute(
+                    f"UPDATE {partitions.CATALOG_TABLE} SET next_key = next_key + ? "
+                    f"WHERE table_name = ? RETURNING next_key;",
+                    (len(values), spec.table_name)
+                ).fetchone()[0]
+                columns = columns + (spec.key_column,)
+                values = [row + (key,) for row, key in zip(values, range(end - len(values), end))]
+
+            months: t.Dict[str, t.List[t.Tuple]] = {}
+            for row in values:
+                months.setdefault(partitions.month_of(row[position]), []).append(row)
+            for month, month_values in months.items():
+                name = self._ensure_partition(spec, month)
+                statement = self.statement_cache.get(
+                    ("insert", name, columns), lambda: self._insert_statement(name, columns)
+                )
+                self._executemany(statement, month_values)
+
+    def update_records(
+        self,
+        table_name: str,
+        columns: t.Sequence[str],
+        rows: t.Iterable[t.Tuple],
+        key_column: str = "record_id",
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> int:
+        """
+        Sets columns of many rows with a single prepared UPDATE statement, in batched
+        transactions like add_records. Every row holds the new values of columns followed by
+        the key_column value of the row to update. Returns the number of rows given.
+        """
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        columns = tuple(columns)
+
+        def statement_for(target: str) -> str:
+            return self.statement_cache.get(
+                ("update", target, columns, key_column),
+                lambda: f"UPDATE {target} SET {', '.join(f'{column} = ?' for column in columns)} "
+                        f"WHERE {key_column} = ?;"
+            )
+
+        # The month of a key is unknown, so every partition looks it up in its primary key.
+        statements = [statement_for(target) for target in self._targets(table_name)]
+
+        rows = iter(rows)
+        updated = 0
+        batch = list(islice(rows, batch_size))
+        while batch:
+            with self.transaction():
+                for statement in statements:
+                    self._executemany(statement, batch)
+            updated += len(batch)
+            batch = list(islice(rows, batch_size))
+
+        return updated
+
     def delete_record(self, table_name: str, criteria: t.Dict[str, t.Union[str, int, float]]) -> None:
         """Taken in a table name and creates a DELETE FROM statement and a criteria)"""
 
-        placeholders = [f"{column} = ?" for column in criteria.keys()]
-        delete_criteria = " AND ".join(placeholders)
+        columns = tuple(criteria.keys())
         delete_criteria_values = tuple(criteria.values())
 
-        statement = dedent(
-            f"""
-                DELETE FROM 
-                    {table_name} 
-                WHERE 
-                    {delete_criteria};
-            """
-        )
+        def build(target: str) -> str:
+            placeholders = [f"{column} = ?" for column in columns]
+            delete_criteria = " AND ".join(placeholders)
+
+            return dedent(
+                f"""
+                    DELETE FROM 
+                        {target} 
+                    WHERE 
+                        {delete_criteria};
+                """
+            )
+
+        targets = self._targets(table_name, criteria)
+        if targets == [table_name]:
+            statement = self.statement_cache.get(("delete", table_name, columns), lambda: build(table_name))
+            self._execute(statement, delete_criteria_values)
+            return
+
+        with self.transaction():
+            for target in targets:
+                statement = self.statement_cache.get(("delete", target, columns), lambda: build(target))
+                self._execute(statement, delete_criteria_values)
+
+    def delete_chunk(
+        self,
+        table_name: str,
+        criteria: t.Dict[str, t.Union[str, int, float]],
+        limit: int,
+        returning: t.Sequence[str] = ()
+    ) -> t.List[tuple]:
+        """
+        Deletes at most limit rows matching criteria. The rows are picked by rowid through the
+        index of the criteria columns, so the delete is bounded and never scans the table.
+        Returns the returning columns of every deleted row, or its rowid when none are given.
+        """
+
+        if limit < 1:
+            raise ValueError("limit must be a positive integer.")
+
+        columns = tuple(criteria.keys())
+        returned = tuple(returning) or ("rowid",)
+        where = " AND ".join(f"{column} = ?" for column in columns)
+
+        deleted: t.List[tuple] = []
+        for target in self._targets(table_name, criteria):
+            statement = self.statement_cache.get(
+                ("delete_chunk", target, columns, returned),
+                lambda: f"DELETE FROM {target} WHERE rowid IN "
+                        f"(SELECT rowid FROM {target}{f' WHERE {where}' if where else ''} LIMIT ?) "
+                        f"RETURNING {', '.join(returned)};"
+            )
+            deleted.extend(self._execute(statement, tuple(criteria.values()) + (limit - len(deleted),)).fetchall())
+            if len(deleted) == limit:
+                break
+        return deleted
+
+    def delete_in_chunks(
+        self,
+        table_name: str,
+        criteria: t.Dict[str, t.Union[str, int, float]],
+        chunk_size: int = DEFAULT_DELETE_CHUNK_SIZE,
+        pause_seconds: float = 0.0
+    ) -> int:
+        """
+        Deletes the rows matching criteria with delete_chunk, chunk_size at a time, each chunk
+        in its own short transaction, so the write lock is released between chunks for other
+        writers, such as the ingestion of other patients. pause_seconds are slept between chunks.
+        Returns the number of rows deleted.
+        """
+
+        deleted = 0
+        while True:
+            count = len(self.delete_chunk(table_name, criteria, chunk_size))
+            deleted += count
+            if count < chunk_size:
+                return deleted
+            time.sleep(pause_seconds)
+
+    def delete_records(
+        self,
+        table_name: str,
+        keys: t.Iterable[t.Union[str, int, float]],
+        key_column: str = "record_id",
+        returning: t.Sequence[str] = (),
+        batch_size: int = DEFAULT_DELETE_CHUNK_SIZE
+    ) -> t.List[tuple]:
+        """
+        Deletes the rows of many keys, batch_size keys per transaction. The keys of a batch are
+        bound as a single JSON array, so one prepared statement serves batches of every length and
+        each key is looked up in the index of key_column. Returns the returning columns of every
+        deleted row, or its key_column when none are given, so callers learn which rows existed.
+        """
 
-        self._execute(statement, delete_criteria_values)
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        columns = tuple(returning) or (key_column,)
+        statements = [
+            self.statement_cache.get(
+                ("delete_keys", target, key_column, columns),
+                lambda: f"DELETE FROM {target} WHERE {key_column} IN (SELECT value FROM json_each(?)) "
+                        f"RETURNING {', '.join(columns)};"
+            )
+            for target in self._targets(table_name)
+        ]
+
+        keys = iter(keys)
+        deleted: t.List[tuple] = []
+        batch = list(islice(keys, batch_size))
+        while batch:
+            with self.transaction():
+                for statement in statements:
+                    deleted.extend(self._execute(statement, (json.dumps(batch),)).fetchall())
+            batch = list(islice(keys, batch_size))
+        return deleted
 
     def select_record(
         self, 
         table_name: str, 
         criteria: t.Dict[str, t.Union[str, int, float]] = {}, 
         order_by: t.Optional[str] = None,
-        ordered_desc: bool = False
+        ordered_desc: bool = False,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        range_column: str = "date",
+        limit: t.Optional[int] = None,
+        after: t.Optional[t.Sequence[t.Union[str, int, float]]] = None,
+        key_column: str = "rowid"
     ) -> sqlite3.Cursor:
         """
         Executes a SELECT statement on the specified table with optional criteria and ordering.
+        since (inclusive) and until (exclusive) bound range_column, so a query on an indexed
+        column (for example patient_id and date) is answered with an index range scan.
+
+        Passing limit or after switches to keyset pagination: rows are ordered by
+        (order_by, key_column), or by key_column alone, and after holds the keyset values of
+        the last row of the previous page. Each page is then an index seek instead of an OFFSET scan.
         Returns the result cursor.
         """
 
+        table_name = self._source(table_name, since, until, range_column, criteria)
+        columns = tuple(criteria.keys())
+        keyset = (order_by, key_column) if order_by and order_by != key_column else (key_column,)
+        if after is not None and len(after) != len(keyset):
+            raise ValueError(f"after must hold one value for each of {keyset}.")
+
         select_criteria_values = tuple(criteria.values())
+        if since is not None:
+            select_criteria_values += (since,)
+        if until is not None:
+            select_criteria_values += (until,)
+        if after is not None:
+            select_criteria_values += tuple(after)
+        if limit is not None:
+            select_criteria_values += (limit,)
+
+        key = (
+            "select", table_name, columns, order_by, ordered_desc,
+            since is not None, until is not None, range_column,
+            limit is not None, after is not None, key_column
+        )
+        statement = self.statement_cache.get(
+            key,
+            lambda: self._select_statement(
+                table_name, columns, order_by, ordered_desc, since is not None,
+                until is not None, range_column, limit is not None, after is not None, keyset
+            )
+        )
 
-        statement = f"SELECT * FROM {table_name}"
-        if criteria:
-            placeholders = [f"{column} = ?" for column in criteria.keys()]
-            select_criteria = " AND ".join(placeholders)
-            statement = statement  + f" WHERE {select_criteria}"
+        return self._execute(statement, select_criteria_values)
 
-        if order_by:
+    def _select_statement(
+        self,
+        table_name: str,
+        columns: t.Sequence[str],
+        order_by: t.Optional[str],
+        ordered_desc: bool,
+        has_since: bool,
+        has_until: bool,
+        range_column: str,
+        has_limit: bool,
+        has_after: bool,
+        keyset: t.Sequence[str]
+    ) -> str:
+        """Builds the SELECT statement for select_record, placeholders in the order of its values"""
+
+        placeholders = self._conditions(columns, has_since, has_until, range_column)
+        if has_after:
+            comparison = "<" if ordered_desc else ">"
+            if len(keyset) == 1:
+                placeholders.append(f"{keyset[0]} {comparison} ?")
+            else:
+                placeholders.append(f"({', '.join(keyset)}) {comparison} (?, ?)")
+
+        statement = f"SELECT * FROM {table_name}" + self._where(placeholders)
+
+        if has_limit or has_after:
+            direction = " DESC" if ordered_desc else ""
+            statement = statement + " ORDER BY " + ", ".join(f"{column}{direction}" for column in keyset)
+        elif order_by:
             statement = statement + f" ORDER BY {order_by}"
             if ordered_desc:
                 statement = statement + f" DESC"
 
-        statement = statement + ";"
-
-        return self._execute(statement, select_criteria_values)
+        if has_limit:
+            statement = statement + " LIMIT ?"
+
+        return statement + ";"
+
+    @staticmethod
+    def _conditions(
+        columns: t.Sequence[str],
+        has_since: bool,
+        has_until: bool,
+        range_column: str
+    ) -> t.List[str]:
+        """Builds the WHERE conditions for equality criteria and range bounds, in the order of their values"""
+
+        placeholders = [f"{column} = ?" for column in columns]
+        if has_since:
+            placeholders.append(f"{range_column} >= ?")
+        if has_until:
+            placeholders.append(f"{range_column} < ?")
+        return placeholders
+
+    @staticmethod
+    def _where(placeholders: t.Sequence[str]) -> str:
+        return f" WHERE {' AND '.join(placeholders)}" if placeholders else ""
+
+    def select_bounds(
+        self,
+        table_name: str,
+        criteria: t.Dict[str, t.Union[str, int, float]] = {},
+        range_column: str = "date"
+    ) -> t.Tuple[t.Any, t.Any]:
+        """
+        Returns the smallest and largest value of range_column among the rows matching criteria,
+        (None, None) when there are none. With an index on (criteria columns, range_column)
+        both ends are read straight from the index.
+        """
 
+        table_name = self._source(table_name, range_column=range_column, criteria=criteria)
+        columns = tuple(criteria.keys())
+        statement = self.statement_cache.get(
+            ("bounds", table_name, columns, range_column),
+            lambda: f"SELECT min({range_column}), max({range_column}) FROM {table_name}"
+                    + self._where(self._conditions(columns, False, False, range_column)) + ";"
+        )
+        return self._execute(statement, tuple(criteria.values())).fetchone()
+
+    def select_buckets(
+        self,
+        table_name: str,
+        columns: t.Sequence[str],
+        bucket_seconds: int,
+        criteria: t.Dict[str, t.Union[str, int, float]] = {},
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        range_column: str = "date"
+    ) -> sqlite3.Cursor:
+        """
+        Aggregates the rows matching criteria into buckets of bucket_seconds of the ISO dates in
+        range_column, inside SQLite. Every result row holds the bucket start (ISO date), the number
+        of rows in the bucket, then the min, mean and max of each column. Buckets are ordered by time.
+        """
 
+        if bucket_seconds < 1:
+            raise ValueError("bucket_seconds must be a positive integer.")
+
+        table_name = self._source(table_name, since, until, range_column, criteria)
+        criteria_columns = tuple(criteria.keys())
+        columns = tuple(columns)
+
+        def build() -> str:
+            aggregates = ", ".join(
+                f"min({column}), avg({column}), max({column})" for column in columns
+            )
+            return (
+                f"SELECT datetime(CAST(strftime('%s', {range_column}) AS INTEGER) / ? * ?, 'unixepoch') AS bucket, "
+                f"count(*), {aggregates} FROM {table_name}"
+                + self._where(
+                    self._conditions(criteria_columns, since is not None, until is not None, range_column)
+                )
+                + " GROUP BY bucket ORDER BY bucket;"
+            )
 
+        statement = self.statement_cache.get(
+            ("buckets", table_name, columns, criteria_columns, since is not None, until is not None, range_column),
+            build
+        )
+        values = (bucket_seconds, bucket_seconds) + tuple(criteria.values())
+        if since is not None:
+            values += (since,)
+        if until is not None:
+            values += (until,)
+        return self._execute(statement, values)
+
+    def fetch_columns(
+        self,
+        table_name: str,
+        columns: t.Mapping[str, str],
+        criteria: t.Dict[str, t.Union[str, int, float]] = {},
+        order_by: t.Optional[str] = None,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        range_column: str = "date",
+        batch_size: int = DEFAULT_FETCH_BATCH_SIZE
+    ) -> t.Dict[str, "np.ndarray"]:
+        """
+        Reads columns of the rows matching criteria into one typed NumPy array per column.
+        columns maps each column to a NumPy dtype (NULLs become NaN in float columns), or to
+        EPOCH_MS for ISO 8601 dates, converted by SQLite into int64 milliseconds since the epoch.
+        The arrays are allocated once from a count of the rows and filled from the cursor batch
+        by batch, so only batch_size rows exist as Python objects at any time.
+        """
 
+        import numpy as np
+
+        table_name = self._source(table_name, since, until, range_column, criteria)
+        names = tuple(columns)
+        criteria_columns = tuple(criteria.keys())
+        values = tuple(criteria.values())
+        if since is not None:
+            values += (since,)
+        if until is not None:
+            values += (until,)
+        where = self._where(
+            self._conditions(criteria_columns, since is not None, until is not None, range_column)
+        )
 
+        def expression(column: str) -> str:
+            if columns[column] != EPOCH_MS:
+                return column
+            # julianday() parses a date several times faster than strftime('%s') and '%f'.
+            return f"CAST(round((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
 
+        count_statement = self.statement_cache.get(
+            ("count", table_name, criteria_columns, since is not None, until is not None, range_column),
+            lambda: f"SELECT count(*) FROM {table_name}{where};"
+        )
+        select_statement = self.statement_cache.get(
+            ("columns", table_name, tuple(columns.items()), criteria_columns,
+             since is not None, until is not None, range_column, order_by),
+            lambda: f"SELECT {', '.join(expression(column) for column in names)} FROM {table_name}{where}"
+                    + (f" ORDER BY {order_by}" if order_by else "") + ";"
+        )
 
+        dtypes = [np.dtype("int64") if columns[column] == EPOCH_MS else np.dtype(columns[column]) for column in names]
+        capacity = self._execute(count_statement, values).fetchone()[0]
+        arrays = [np.empty(capacity, dtype=dtype) for dtype in dtypes]
+
+        cursor = self._execute(select_statement, values)
+        filled = 0
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            end = filled + len(batch)
+            if end > capacity:
+                # Rows committed between the count and the select.
+                capacity = max(end, capacity * 2)
+                arrays = [np.resize(array, capacity) for array in arrays]
+            for array, dtype, column_values in zip(arrays, dtypes, zip(*batch)):
+                array[filled:end] = np.array(column_values, dtype=dtype)
+            filled = end
+
+        return {column: array[:filled] for column, array in zip(names, arrays)}
+
+    def iter_records(
+        self,
+        table_name: str,
+        criteria: t.Dict[str, t.Union[str, int, float]] = {},
+        order_by: t.Optional[str] = None,
+        ordered_desc: bool = False,
+        since: t.Optional[str] = None,
+        until: t.Optional[str] = None,
+        range_column: str = "date",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        key_column: str = "rowid"
+    ) -> t.Iterator[tuple]:
+        """
+        Yields the rows of a SELECT one at a time while fetching them in pages of batch_size
+        with keyset pagination, so memory stays bounded by one page however large the table is.
+        The rows must contain key_column (and order_by) for the next page to be located.
+        """
 
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive integer.")
+
+        after: t.Optional[t.Tuple] = None
+        positions: t.Optional[t.List[int]] = None
+        while True:
+            cursor = self.select_record(
+                table_name=table_name,
+                criteria=criteria,
+                order_by=order_by,
+                ordered_desc=ordered_desc,
+                since=since,
+                until=until,
+                range_column=range_column,
+                limit=batch_size,
+                after=after,
+                key_column=key_column
+            )
+            page = cursor.fetchall()
+            if positions is None:
+                positions = self.keyset_positions(cursor, order_by, key_column)
+
+            yield from page
+
+            if len(page) < batch_size:
+                return
+            after = tuple(page[-1][position] for position in positions)
+
+    @staticmethod
+    def keyset_positions(
+        cursor: sqlite3.Cursor, order_by: t.Optional[str], key_column: str
+    ) -> t.List[int]:
+        """Returns the positions of the keyset columns in the rows returned by cursor"""
+
+        names = [description[0] for description in cursor.description]
+        keyset = [order_by, key_column] if order_by and order_by != key_column else [key_column]
+        missing = [column for column in keyset if column not in names]
+        if missing:
+            raise ValueError(f"The selected rows do not contain the keyset columns {missing}.")
+        return [names.index(column) for column in keyset]
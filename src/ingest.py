@@ -0,0 +1,239 @@
+""" A module for buffering vitals records in memory and writing them in group commits """
+
+import atexit
+import contextlib
+import threading
+import time
+import typing as t
+import weakref
+
+from src.database import DatabaseManager
+
+SYNC = "sync"
+BOUNDED_LOSS = "bounded"
+
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_DELAY_MS = 200
+DEFAULT_MAX_PENDING = 10_000
+
+Record = t.Dict[str, t.Union[str, int, float, None]]
+
+
+class BufferMetrics(t.NamedTuple):
+    queue_depth: int
+    flushes: int
+    rows_committed: int
+    rows_failed: int
+    last_rows_per_commit: int
+    mean_rows_per_commit: float
+    last_flush_seconds: float
+    max_flush_seconds: float
+
+
+class _Batch:
+    """The records collected between two flushes and the outcome of writing them."""
+
+    def __init__(self):
+        self.records: t.List[Record] = []
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.error: t.Optional[BaseException] = None
+
+
+class WriteBehindBuffer:
+    """ A class that collects records in memory and writes them to a table as one transaction
+    once max_rows records are waiting or the oldest one has waited max_delay_ms.
+
+    With SYNC durability, add() returns once the transaction holding the record has committed
+    and been synced to disk (synchronous=FULL), so concurrent callers share one commit and one
+    sync (group commit) and nothing acknowledged can be lost, even to a power loss.
+    With BOUNDED_LOSS durability, add() returns immediately and at most max_pending
+    acknowledged records are lost if the process dies; add() waits while the buffer is full.
+    Buffers are flushed on close(), which runs at interpreter exit, including after sys.exit()."""
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        table_name: str = "vitals",
+        max_rows: int = DEFAULT_MAX_ROWS,
+        max_delay_ms: float = DEFAULT_MAX_DELAY_MS,
+        durability: str = SYNC,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        on_flush: t.Optional[t.Callable[[t.List[Record]], None]] = None
+    ):
+        """Starts the background thread that flushes the buffer.
+        on_flush is called with the records of every committed flush."""
+
+        if durability not in (SYNC, BOUNDED_LOSS):
+            raise ValueError(f"durability must be {SYNC!r} or {BOUNDED_LOSS!r}.")
+        if max_rows < 1 or max_pending < max_rows:
+            raise ValueError("max_rows must be positive and max_pending at least max_rows.")
+
+        self.db = db
+        self.table_name = table_name
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.durability = durability
+        self.max_pending = max_pending
+        self.on_flush = on_flush
+
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._batch = _Batch()
+        self._closed = False
+
+        self._flushes = 0
+        self._rows_committed = 0
+        self._rows_failed = 0
+        self._last_rows_per_commit = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        _open_buffers.add(self)
+
+    def add(self, record: Record) -> None:
+        """Queues a record, waiting for its commit when the durability is SYNC."""
+
+        self.add_many([record])
+
+    def add_many(self, records: t.Iterable[Record]) -> None:
+        """
+        Queues records in order, waiting when the durability is SYNC until every batch holding
+        one of them has committed. They go into one batch unless more than max_pending records
+        are waiting; the error of a failed batch is raised once the others are written.
+        """
+
+        batches: t.List[_Batch] = []
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The write-behind buffer is closed.")
+            for record in records:
+                while len(self._batch.records) >= self.max_pending:
+                    self._condition.wait()
+                batch = self._batch
+                batch.records.append(record)
+                if len(batch.records) == 1:
+                    batch.created = time.monotonic()
+                    self._condition.notify_all()
+                elif len(batch.records) >= self.max_rows:
+                    self._condition.notify_all()
+                if not batches or batches[-1] is not batch:
+                    batches.append(batch)
+
+        if self.durability == SYNC:
+            for batch in batches:
+                batch.done.wait()
+            for batch in batches:
+                if batch.error is not None:
+                    raise batch.error
+
+    def flush(self) -> None:
+        """Writes every queued record now, in the calling thread."""
+
+        with self._condition:
+            batch = self._take_batch()
+        self._write(batch)
+
+    def close(self) -> None:
+        """Stops the background thread and writes the records that are still queued."""
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.flush()
+        _open_buffers.discard(self)
+
+    def metrics(self) -> BufferMetrics:
+        with self._condition:
+            queue_depth = len(self._batch.records)
+        return BufferMetrics(
+            queue_depth=queue_depth,
+            flushes=self._flushes,
+            rows_committed=self._rows_committed,
+            rows_failed=self._rows_failed,
+            last_rows_per_commit=self._last_rows_per_commit,
+            mean_rows_per_commit=self._rows_committed / self._flushes if self._flushes else 0.0,
+            last_flush_seconds=self._last_flush_seconds,
+            max_flush_seconds=self._max_flush_seconds,
+        )
+
+    def _take_batch(self) -> _Batch:
+        """Swaps in an empty batch, the caller must hold the condition."""
+
+        batch = self._batch
+        self._batch = _Batch()
+        self._condition.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed:
+                    waiting = len(self._batch.records)
+                    if waiting >= self.max_rows:
+                        break
+                    if waiting:
+                        remaining = self._batch.created + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                batch = self._take_batch()
+            self._write(batch)
+
+    def _write(self, batch: _Batch) -> None:
+        """Writes a batch as one transaction, grouping the records that share the same columns."""
+
+        with self._flush_lock:
+            if not batch.records:
+                batch.done.set()
+                return
+
+            groups: t.Dict[t.Tuple[str, ...], t.List[Record]] = {}
+            for record in batch.records:
+                groups.setdefault(tuple(record.keys()), []).append(record)
+
+            start = time.perf_counter()
+            # Acknowledged SYNC records must survive a power loss, not only a crash of the process.
+            synced = self.db.pool.synced() if self.durability == SYNC else contextlib.nullcontext()
+            try:
+                with synced, self.db.transaction():
+                    for records in groups.values():
+                        self.db.add_records(
+                            table_name=self.table_name, rows=records, batch_size=len(records)
+                        )
+            except Exception as error:
+                batch.error = error
+                self._rows_failed += len(batch.records)
+                if self.durability != SYNC:
+                    print(f"Could not write {len(batch.records)} buffered records: {error}")
+            else:
+                elapsed = time.perf_counter() - start
+                self._flushes += 1
+                self._rows_committed += len(batch.records)
+                self._last_rows_per_commit = len(batch.records)
+                self._last_flush_seconds = elapsed
+                self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+                if self.on_flush is not None:
+                    self.on_flush(batch.records)
+            finally:
+                batch.done.set()
+
+
+_open_buffers: "weakref.WeakSet[WriteBehindBuffer]" = weakref.WeakSet()
+
+
+@atexit.register
+def close_all() -> None:
+    """Flushes and closes every open write-behind buffer."""
+
+    for buffer in list(_open_buffers):
+        buffer.close()
@@ -0,0 +1,130 @@
+""" A module for the table holding the latest record of every patient of the vitals table """
+
+import typing as t
+
+from src.database import DatabaseManager
+
+
+def latest_table(table_name: str) -> str:
+    return f"latest_{table_name}"
+
+
+def _columns(db: DatabaseManager, table_name: str) -> t.Dict[str, str]:
+    """The columns of table_name, keyed on patient_id instead of on the record id."""
+
+    columns = {}
+    for _, name, declared_type, *_ in db.execute(f"PRAGMA table_info({table_name});").fetchall():
+        if name == "patient_id":
+            columns[name] = "INTEGER PRIMARY KEY"
+        elif name == "record_id":
+            columns[name] = "INTEGER NOT NULL"
+        else:
+            columns[name] = declared_type
+    return columns
+
+
+def _refresh(table_name: str, columns: t.Sequence[str], patient_id: str) -> str:
+    """Replaces the latest record of a patient by the newest one left in table_name, through the (patient_id, date) index."""
+
+    latest = latest_table(table_name)
+    names = ", ".join(columns)
+    return (
+        f"DELETE FROM {latest} WHERE patient_id = {patient_id}; "
+        f"INSERT INTO {latest} ({names}) SELECT {names} FROM {table_name} WHERE patient_id = {patient_id} "
+        f"ORDER BY date DESC, record_id DESC LIMIT 1; "
+    )
+
+
+def _insert_trigger(table_name: str, columns: t.Sequence[str]) -> str:
+    """The trigger upserting every new row of table_name that is newer than its patient's latest one."""
+
+    latest = latest_table(table_name)
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {latest}_insert AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {latest} ({', '.join(columns)}) VALUES ({', '.join(f'NEW.{column}' for column in columns)}) "
+        f"ON CONFLICT (patient_id) DO UPDATE SET "
+        f"{', '.join(f'{column} = excluded.{column}' for column in columns if column != 'patient_id')} "
+        f"WHERE (excluded.date, excluded.record_id) > ({latest}.date, {latest}.record_id); "
+        f"END;"
+    )
+
+
+def _delete_trigger(table_name: str, columns: t.Sequence[str]) -> str:
+    """The trigger looking up the new latest record of a patient when their latest one is deleted."""
+
+    latest = latest_table(table_name)
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {latest}_delete AFTER DELETE ON {table_name} "
+        f"WHEN OLD.record_id = (SELECT record_id FROM {latest} WHERE patient_id = OLD.patient_id) BEGIN "
+        f"{_refresh(table_name, columns, 'OLD.patient_id')}"
+        f"END;"
+    )
+
+
+def _update_trigger(table_name: str, columns: t.Sequence[str]) -> str:
+    """
+    The trigger refreshing the latest records of the patients of an updated row, when the row
+    was the latest of its patient or is now at least as new as the latest of its new patient.
+    """
+
+    latest = latest_table(table_name)
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {latest}_update AFTER UPDATE ON {table_name} "
+        f"WHEN OLD.record_id = (SELECT record_id FROM {latest} WHERE patient_id = OLD.patient_id) "
+        f"OR coalesce((NEW.date, NEW.record_id) >= "
+        f"(SELECT date, record_id FROM {latest} WHERE patient_id = NEW.patient_id), 1) BEGIN "
+        f"{_refresh(table_name, columns, 'OLD.patient_id')}"
+        f"{_refresh(table_name, columns, 'NEW.patient_id')}"
+        f"END;"
+    )
+
+
+def _backfill(table_name: str, columns: t.Sequence[str]) -> str:
+    """Fills the latest table from table_name with one index seek per patient."""
+
+    names = ", ".join(columns)
+    return (
+        f"INSERT INTO {latest_table(table_name)} ({names}) SELECT {names} FROM {table_name} "
+        f"WHERE record_id IN (SELECT (SELECT record_id FROM {table_name} AS newest "
+        f"WHERE newest.patient_id = patients.patient_id ORDER BY date DESC, record_id DESC LIMIT 1) "
+        f"FROM (SELECT DISTINCT patient_id FROM {table_name}) AS patients);"
+    )
+
+
+def create_latest(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """
+    Creates the table holding the newest record (by date, then record id) of every patient of
+    table_name, with the same columns, and the triggers that keep it up to date on every
+    insert, update and delete of table_name, whichever command or path writes the rows.
+    Unlike the rollups it follows archiving: a patient whose records were all archived is
+    left out. A latest table created for a table that already holds rows is backfilled from it.
+    """
+
+    columns = _columns(db, table_name)
+    names = list(columns)
+    with db.transaction():
+        existed = db.table_exists(latest_table(table_name))
+        db.create_table(table_name=latest_table(table_name), columns=columns)
+        db.execute(_insert_trigger(table_name, names))
+        db.execute(_delete_trigger(table_name, names))
+        db.execute(_update_trigger(table_name, names))
+        if not existed:
+            db.execute(_backfill(table_name, names))
+
+
+def rebuild_latest(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """Recomputes the latest table of table_name from scratch, for repairs after manual edits."""
+
+    names = list(_columns(db, table_name))
+    with db.transaction():
+        db.execute(f"DELETE FROM {latest_table(table_name)};")
+        db.execute(_backfill(table_name, names))
+
+
+def select_latest(db: DatabaseManager, table_name: str = "vitals") -> t.List[tuple]:
+    """
+    Returns the latest record of every patient, ordered by patient id, in the column order of
+    table_name. It reads one row per patient, whatever the number of records behind it.
+    """
+
+    return db.select_record(table_name=latest_table(table_name), order_by="patient_id").fetchall()
@@ -0,0 +1,108 @@
+""" A module for upgrading the schema of existing vitals databases """
+
+import typing as t
+
+from src import analytics, rollups, scoring
+from src.database import DatabaseManager
+
+Migration = t.Callable[[DatabaseManager, str], None]
+
+
+def _typed_blood_pressure(db: DatabaseManager, table_name: str) -> None:
+    """
+    Version 1: splits the free text blood_pressure column into systolic and diastolic INTEGER
+    columns, and nulls values stored with the wrong type in the numeric columns. The table is
+    rebuilt (the documented SQLite way of changing columns) so the column order matches new
+    databases; its indexes and triggers go with the old table and the rollups are recomputed.
+    """
+
+    blood_pressure = "replace(blood_pressure, ' ', '')"
+    is_reading = f"({blood_pressure} GLOB '[0-9]*/[0-9]*' AND {blood_pressure} NOT GLOB '*[^0-9/]*')"
+
+    def number(column: str) -> str:
+        return f"CASE WHEN typeof({column}) IN ('integer', 'real') THEN {column} END"
+
+    db.create_table(
+        table_name=f"{table_name}_migrating",
+        columns={
+            'record_id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+            'patient_id': 'INTEGER NOT NULL',
+            'date': 'TEXT NOT NULL',
+            'heart_rate': 'INTEGER',
+            'systolic': 'INTEGER',
+            'diastolic': 'INTEGER',
+            'respiratory_rate': 'INTEGER',
+            'oxygen_saturation': 'REAL',
+            'temperature': 'REAL'
+        }
+    )
+    db.execute(
+        f"INSERT INTO {table_name}_migrating "
+        f"(record_id, patient_id, date, heart_rate, systolic, diastolic, respiratory_rate, oxygen_saturation, temperature) "
+        f"SELECT record_id, patient_id, date, {number('heart_rate')}, "
+        f"CASE WHEN {is_reading} THEN CAST(substr({blood_pressure}, 1, instr({blood_pressure}, '/') - 1) AS INTEGER) END, "
+        f"CASE WHEN {is_reading} THEN CAST(substr({blood_pressure}, instr({blood_pressure}, '/') + 1) AS INTEGER) END, "
+        f"{number('respiratory_rate')}, {number('oxygen_saturation')}, {number('temperature')} "
+        f"FROM {table_name};"
+    )
+    db.drop_table(table_name)
+    db.execute(f"ALTER TABLE {table_name}_migrating RENAME TO {table_name};")
+    for granularity in rollups.GRANULARITIES:
+        db.execute(f"DROP TABLE IF EXISTS {rollups.rollup_table(table_name, granularity)};")
+
+
+def _news2_scores(db: DatabaseManager, table_name: str) -> None:
+    """Version 2: adds the news2 column holding the early warning score of every record, and scores the existing ones."""
+
+    db.execute(f"ALTER TABLE {table_name} ADD COLUMN news2 INTEGER;")
+    scoring.backfill_scores(db, table_name)
+
+
+def _pausable_rollups(db: DatabaseManager, table_name: str) -> None:
+    """Version 3: recreates the rollup triggers so that retention can pause them while it moves rows."""
+
+    if any(db.table_exists(rollups.rollup_table(table_name, granularity)) for granularity in rollups.GRANULARITIES):
+        rollups.drop_triggers(db, table_name)
+        rollups.create_rollups(db, table_name)
+
+
+def _pausable_anomalies(db: DatabaseManager, table_name: str) -> None:
+    """Version 4: recreates the analytics triggers so that archiving rows keeps their anomalies."""
+
+    if db.table_exists(analytics.anomalies_table(table_name)):
+        analytics.drop_triggers(db, table_name)
+        analytics.create_analytics(db, table_name)
+
+
+# The schema version of a database is the number of migrations applied to it.
+MIGRATIONS: t.List[Migration] = [
+    _typed_blood_pressure,
+    _news2_scores,
+    _pausable_rollups,
+    _pausable_anomalies,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db: DatabaseManager) -> int:
+    return db.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(db: DatabaseManager, table_name: str = "vitals") -> int:
+    """
+    Applies the migrations a database is missing, each in its own transaction, and returns the
+    resulting schema version. A database without the table is new: it is created with the latest
+    schema afterwards, so it is only stamped with the latest version.
+    """
+
+    if not db.table_exists(table_name):
+        db.execute(f"PRAGMA user_version = {LATEST_VERSION};")
+        return LATEST_VERSION
+
+    version = schema_version(db)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with db.transaction():
+            migration(db, table_name)
+            db.execute(f"PRAGMA user_version = {number};")
+    return max(version, LATEST_VERSION)
@@ -0,0 +1,99 @@
+""" A module for naming, creating and pruning the monthly partitions of a partitioned table """
+
+import re
+import typing as t
+
+# The table recording the partitioned tables of a database, their columns and their next key.
+CATALOG_TABLE = "partitioned_tables"
+
+CATALOG_COLUMNS = {
+    "table_name": "TEXT PRIMARY KEY",
+    "range_column": "TEXT NOT NULL",
+    "key_column": "TEXT",
+    "columns": "TEXT NOT NULL",
+    "indexes": "TEXT NOT NULL",
+    "next_key": "INTEGER NOT NULL",
+}
+
+_MONTH = re.compile(r"\d{4}-\d{2}")
+
+
+class PartitionSpec(t.NamedTuple):
+    table_name: str
+    range_column: str
+    key_column: t.Optional[str]
+    columns: t.Dict[str, str]
+    indexes: t.Dict[str, t.Tuple[str, ...]]
+
+
+def month_of(value: t.Any) -> str:
+    """Returns the YYYY-MM month of an ISO 8601 date, the partition a row with that date goes to."""
+
+    month = str(value)[:7]
+    if not _MONTH.fullmatch(month):
+        raise ValueError(f"Partitioned rows need an ISO 8601 date, got {value!r}.")
+    return month
+
+
+def next_month(month: str) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def partition_name(table_name: str, month: str) -> str:
+    return f"{table_name}_p{month.replace('-', '')}"
+
+
+def partition_pattern(table_name: str) -> str:
+    """The GLOB pattern matching the names of the partitions of a table."""
+
+    return f"{table_name}_p[0-9][0-9][0-9][0-9][0-9][0-9]"
+
+
+def month_of_partition(name: str) -> str:
+    return f"{name[-6:-2]}-{name[-2:]}"
+
+
+def key_column_of(columns: t.Mapping[str, str]) -> t.Optional[str]:
+    """Returns the column declared as the INTEGER PRIMARY KEY, None when there is none."""
+
+    for column, declaration in columns.items():
+        if column.upper() != "PRIMARY KEY" and "PRIMARY KEY" in declaration.upper():
+            return column
+    return None
+
+
+def partition_columns(spec: PartitionSpec, month: str) -> t.Dict[str, str]:
+    """
+    Returns the columns of the partition of a month. Keys are allocated across partitions,
+    so AUTOINCREMENT is dropped, and a CHECK constraint rejects rows of other months.
+    """
+
+    columns = {
+        column: re.sub(r"\s+AUTOINCREMENT", "", declaration, flags=re.IGNORECASE)
+        for column, declaration in spec.columns.items()
+    }
+    columns["CHECK"] = (
+        f"({spec.range_column} >= '{month}' AND {spec.range_column} < '{next_month(month)}')"
+    )
+    return columns
+
+
+def overlapping(months: t.Sequence[str], since: t.Optional[str], until: t.Optional[str]) -> t.List[str]:
+    """Returns the months that can hold dates from since (inclusive) to until (exclusive)."""
+
+    return [
+        month for month in months
+        if (since is None or since < next_month(month)) and (until is None or until > f"{month}-01")
+    ]
+
+
+def union_of(spec: PartitionSpec, months: t.Sequence[str]) -> str:
+    """The SELECT reading the rows of the partitions of months, one empty row set when there are none."""
+
+    if not months:
+        names = [column for column in spec.columns if column.upper() != "PRIMARY KEY"]
+        return f"SELECT {', '.join(f'NULL AS {column}' for column in names)} WHERE 0"
+    return " UNION ALL ".join(
+        f"SELECT * FROM {partition_name(spec.table_name, month)}" for month in months
+    )
@@ -0,0 +1,156 @@
+""" A module for sharing one SQLite database between threads """
+
+import sqlite3
+import threading
+import typing as t
+import weakref
+
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """ A class that hands out SQLite connections to threads.
+    Every thread reads through its own connection, so cursors of different threads never
+    interleave, and all writes go through one writer connection that threads queue for.
+    File databases are switched to WAL journal mode so readers never block the writer
+    and the writer never blocks readers. An in-memory database only exists inside its
+    connection, so it is served by the writer connection alone.
+    No connection is opened, and no file created, before the first one is asked for."""
+
+    def __init__(self, db_name: str, **connect_kwargs: t.Any):
+        self.db_name = db_name
+        self.connect_kwargs = connect_kwargs
+        self.in_memory = db_name == ":memory:" or db_name == ""
+        self.write_lock = threading.RLock()
+        self._writer_connection: t.Optional[sqlite3.Connection] = None
+
+        self._local = threading.local()
+        self._readers_lock = threading.Lock()
+        self._readers: t.List[t.Tuple["weakref.ref[threading.Thread]", sqlite3.Connection]] = []
+        self._closed = False
+        self._version_lock = threading.Lock()
+        self._version_connection: t.Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_name, check_same_thread=False, **self.connect_kwargs)
+
+    @property
+    def opened(self) -> bool:
+        return self._writer_connection is not None
+
+    @property
+    def writer_connection(self) -> sqlite3.Connection:
+        """The writer connection, opened on first use, with WAL mode enabled for file databases."""
+
+        if self._writer_connection is None:
+            with self.write_lock:
+                if self._writer_connection is None:
+                    if self._closed:
+                        raise sqlite3.ProgrammingError("Cannot operate on a closed connection pool.")
+                    connection = self._connect()
+                    if not self.in_memory:
+                        connection.execute("PRAGMA journal_mode=WAL;")
+                        connection.execute("PRAGMA synchronous=NORMAL;")
+                    self._writer_connection = connection
+        return self._writer_connection
+
+    @contextmanager
+    def writer(self) -> t.Iterator[sqlite3.Connection]:
+        """Waits for the turn of the calling thread and yields the writer connection."""
+
+        with self.write_lock:
+            yield self.writer_connection
+
+    @contextmanager
+    def synced(self) -> t.Iterator[sqlite3.Connection]:
+        """
+        Like writer, with the connection switched to synchronous=FULL for the block. In WAL mode
+        NORMAL only syncs at checkpoints, so a power loss can roll back the latest commits; with
+        FULL every commit of the block is synced before it returns. A transaction already open
+        keeps the level it started with, as SQLite cannot change it inside one.
+        """
+
+        with self.write_lock:
+            connection = self.writer_connection
+            if self.in_memory or connection.in_transaction:
+                yield connection
+                return
+            connection.execute("PRAGMA synchronous=FULL;")
+            try:
+                yield connection
+            finally:
+                connection.execute("PRAGMA synchronous=NORMAL;")
+
+    def reader(self) -> sqlite3.Connection:
+        """Returns the read connection of the calling thread, opening it on first use."""
+
+        if self.in_memory:
+            return self.writer_connection
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # The writer connection switches the file to WAL mode before any reader opens it.
+            self.writer_connection
+            connection = self._connect()
+            self._local.connection = connection
+            with self._readers_lock:
+                self._close_dead_readers()
+                self._readers.append((weakref.ref(threading.current_thread()), connection))
+        return connection
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens a connection to the file outside of the pool, for work such as backups. The caller closes it."""
+
+        if self.in_memory:
+            raise ValueError("An in-memory database can only be reached through the writer connection.")
+        # The writer connection switches the file to WAL mode before the connection opens it.
+        self.writer_connection
+        return self._connect()
+
+    def data_version(self) -> int:
+        """
+        Returns a number that changes after every commit to the database, by any connection of any
+        process, for caches of query results. It is read on a connection that never writes, whose
+        PRAGMA data_version changes with the commits of every other connection.
+        """
+
+        if self.in_memory:
+            # Only the writer connection can change an in-memory database.
+            return self.writer_connection.total_changes
+        with self._version_lock:
+            if self._version_connection is None:
+                self._version_connection = self.connect()
+            return self._version_connection.execute("PRAGMA data_version;").fetchone()[0]
+
+    def _close_dead_readers(self) -> None:
+        """Closes the connections of threads that have finished, e.g. old Streamlit script runs."""
+
+        alive = []
+        for thread_ref, connection in self._readers:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                alive.append((thread_ref, connection))
+            else:
+                connection.close()
+        self._readers = alive
+
+    @property
+    def reader_count(self) -> int:
+        with self._readers_lock:
+            return len(self._readers)
+
+    def close(self) -> None:
+        """Closes the writer connection and every read connection."""
+
+        if self._closed:
+            return
+        self._closed = True
+        with self._readers_lock:
+            for _, connection in self._readers:
+                connection.close()
+            self._readers = []
+        with self._version_lock:
+            if self._version_connection is not None:
+                self._version_connection.close()
+        if self._writer_connection is not None:
+            self._writer_connection.close()
@@ -14,7 +14,10 @@ class Option:
 
     def choose(self):
         data = self.prep_call() if self.prep_call else None
-        result = self.command.execute(data) if data else self.command.execute()
+        try:
+            result = self.command.execute(data) if data else self.command.execute()
+        except ValueError as error:
+            result = f"Invalid input: {error}"
         print(result)
 
     def __str__(self):
@@ -59,10 +62,23 @@ def get_record_id() -> int:
     result = int(get_user_input("Enter a record ID")) # type: ignore
     return result
 
+def get_record_ids() -> t.List[int]:
+    result = get_user_input("Enter record IDs separated by commas")
+    return [int(record_id) for record_id in result.split(",") if record_id.strip()] # type: ignore
+
 def get_patient_id() -> int:
     result = int(get_user_input("Enter a patient ID")) # type: ignore
     return result
 
+def get_file_path() -> str:
+    result = get_user_input("File path (.csv, .ndjson or .jsonl, optionally .gz)")
+    return result # type: ignore
+
+def get_date_range() -> t.Tuple[str, str]:
+    since = get_user_input("From date (YYYY-MM-DD)")
+    until = get_user_input("Until date, excluded (YYYY-MM-DD)")
+    return since, until # type: ignore
+
 
 def clear_screen():
     clear_command = "cls" if os.name == "nt" else "clear"
@@ -0,0 +1,295 @@
+""" A module for measuring the statements a DatabaseManager executes """
+
+import contextlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import typing as t
+
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from types import FrameType
+
+DEFAULT_SAMPLE_SIZE = 1_024
+DEFAULT_SLOW_SECONDS = 0.1
+DEFAULT_SLOW_LOG_SIZE = 200
+
+# Statements whose query plan EXPLAIN QUERY PLAN can describe.
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Frames of these files are skipped when looking for the code that ran a statement.
+_INTERNAL_FILES = frozenset(
+    [os.path.join(os.path.dirname(__file__), name) for name in ("database.py", "profiling.py")]
+    + [contextlib.__file__]
+)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)\S+( AS \S+)?$")
+
+
+class QueryStats(t.NamedTuple):
+    """The measurements of one statement shape; rows are those returned, or changed by writes."""
+
+    shape: str
+    calls: int
+    total_seconds: float
+    p50_seconds: float
+    p99_seconds: float
+    rows: int
+    plan: t.Optional[t.List[str]]
+    full_scan: bool
+    callers: t.List[str]
+
+
+class SlowQuery(t.NamedTuple):
+    shape: str
+    seconds: float
+    rows: int
+    caller: str
+    plan: t.Optional[t.List[str]]
+    at: str
+
+
+@lru_cache(maxsize=1_024)
+def shape_of(statement: str) -> str:
+    """
+    Returns the shape of a statement: its text with literals replaced by placeholders, lists of
+    placeholders collapsed and whitespace normalised, so statements differing only by their
+    values or the length of an IN list are measured together.
+    """
+
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+def is_full_scan(plan: t.Sequence[str]) -> bool:
+    """Returns whether a query plan reads a whole table without an index."""
+
+    return any(_FULL_SCAN.match(detail) for detail in plan)
+
+
+def caller_of() -> str:
+    """
+    Returns the command that is running the current statement, such as AddRecordCommand.execute,
+    or the first function outside the persistence layer when no command is.
+    """
+
+    frame: t.Optional[FrameType] = sys._getframe(1)
+    first = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename not in _INTERNAL_FILES:
+            name = getattr(code, "co_qualname", code.co_name)
+            if ".execute" in name and "Command" in name:
+                return name
+            if first is None:
+                first = f"{os.path.basename(code.co_filename)}:{name}"
+        frame = frame.f_back
+    return first or "unknown"
+
+
+class _Measurements:
+    """The running totals and latest latencies of one statement shape."""
+
+    def __init__(self, sample_size: int):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.samples: "deque[float]" = deque(maxlen=sample_size)
+        self.plan: t.Optional[t.List[str]] = None
+        self.callers: t.Set[str] = set()
+
+
+def _percentile(ordered: t.Sequence[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class QueryProfiler:
+    """ A class that records, per statement shape, the number of calls, their latency and the rows
+    they returned. Percentiles are taken over the last sample_size calls of each shape.
+    Calls slower than slow_seconds are kept in a slow query log of the last slow_log_size, and
+    the query plan of a shape is captured with explain the first time a call of it takes at least
+    explain_seconds (0 captures every shape, None none). The code that ran a shape is looked up
+    only when it is first seen and when it is slow, to keep the cost of a call to two clock reads."""
+
+    def __init__(
+        self,
+        explain: t.Optional[t.Callable[[str], t.List[str]]] = None,
+        slow_seconds: t.Optional[float] = DEFAULT_SLOW_SECONDS,
+        explain_seconds: t.Optional[float] = None,
+        sample_size: int = DEFAULT_SAMPLE_SIZE,
+        slow_log_size: int = DEFAULT_SLOW_LOG_SIZE
+    ):
+        self.enabled = True
+        self.explain = explain
+        self.slow_seconds = slow_seconds
+        self.explain_seconds = explain_seconds
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._shapes: t.Dict[str, _Measurements] = {}
+        self._slow: "deque[SlowQuery]" = deque(maxlen=slow_log_size)
+
+    def record(self, statement: str, seconds: float, rows: int) -> None:
+        """Adds one call of statement that took seconds and returned (or changed) rows."""
+
+        shape = shape_of(statement)
+        with self._lock:
+            measurements = self._shapes.get(shape)
+            if measurements is not None:
+                measurements.calls += 1
+                measurements.seconds += seconds
+                measurements.rows += rows
+                measurements.samples.append(seconds)
+                if (self.slow_seconds is None or seconds < self.slow_seconds) and (
+                    measurements.plan is not None or self.explain_seconds is None or seconds < self.explain_seconds
+                ):
+                    return
+        self._record_rare(statement, shape, seconds, rows, measurements)
+
+    def _record_rare(
+        self, statement: str, shape: str, seconds: float, rows: int, measurements: t.Optional[_Measurements]
+    ) -> None:
+        """Records the first call of a shape, or a call that is slow or needs a query plan."""
+
+        if measurements is None:
+            with self._lock:
+                measurements = self._shapes.setdefault(shape, _Measurements(self.sample_size))
+                measurements.calls += 1
+                measurements.seconds += seconds
+                measurements.rows += rows
+                measurements.samples.append(seconds)
+
+        caller = caller_of()
+        plan = measurements.plan
+        if (
+            plan is None and self.explain is not None and self.explain_seconds is not None
+            and seconds >= self.explain_seconds and shape.upper().startswith(EXPLAINABLE)
+        ):
+            plan = self.explain(statement)
+
+        with self._lock:
+            if plan is not None:
+                measurements.plan = plan
+            measurements.callers.add(caller)
+            if self.slow_seconds is not None and seconds >= self.slow_seconds:
+                self._slow.append(
+                    SlowQuery(shape, seconds, rows, caller, plan, datetime.now().isoformat(timespec="seconds"))
+                )
+
+    def stats(self) -> t.List[QueryStats]:
+        """Returns the measurements of every shape, the ones taking the most time in total first."""
+
+        with self._lock:
+            snapshot = [
+                (shape, m.calls, m.seconds, sorted(m.samples), m.rows, m.plan, sorted(m.callers))
+                for shape, m in self._shapes.items()
+            ]
+        stats = [
+            QueryStats(
+                shape, calls, seconds, _percentile(samples, 0.5), _percentile(samples, 0.99),
+                rows, plan, plan is not None and is_full_scan(plan), callers
+            )
+            for shape, calls, seconds, samples, rows, plan, callers in snapshot
+        ]
+        return sorted(stats, key=lambda stat: stat.total_seconds, reverse=True)
+
+    def slow_queries(self) -> t.List[SlowQuery]:
+        """Returns the slow query log, most recent first."""
+
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """ A cursor that times its statement and the fetching of its rows, and counts them.
+    SQLite produces rows as they are fetched, so a query is reported to the profiler once its
+    rows are exhausted, or when the cursor is closed or released before; other statements are
+    reported as soon as they ran."""
+
+    __slots__ = ("_profiler", "_statement", "_seconds", "_rows")
+
+    def profile(
+        self, profiler: QueryProfiler, statement: str, values: t.Optional[t.Tuple] = None
+    ) -> "ProfiledCursor":
+        """Executes statement and starts measuring it."""
+
+        self._profiler = None
+        start = time.perf_counter()
+        self.execute(statement, values or [])
+        self._seconds = time.perf_counter() - start
+        self._rows = 0
+        self._statement = statement
+        self._profiler = profiler
+        if self.description is None:
+            self._report()
+        return self
+
+    def fetchone(self) -> t.Any:
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._seconds += time.perf_counter() - start
+        if row is None:
+            self._report()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size: t.Optional[int] = None) -> t.List[t.Any]:
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._seconds += time.perf_counter() - start
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._report()
+        return rows
+
+    def fetchall(self) -> t.List[t.Any]:
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._seconds += time.perf_counter() - start
+        self._rows += len(rows)
+        self._report()
+        return rows
+
+    def __next__(self) -> t.Any:
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._seconds += time.perf_counter() - start
+            self._report()
+            raise
+        self._seconds += time.perf_counter() - start
+        self._rows += 1
+        return row
+
+    def _report(self) -> None:
+        profiler = getattr(self, "_profiler", None)
+        if profiler is not None:
+            self._profiler = None
+            rows = self._rows if self.description is not None else max(self.rowcount, 0)
+            profiler.record(self._statement, self._seconds, rows)
+
+    def close(self) -> None:
+        self._report()
+        super().close()
+
+    def __del__(self) -> None:
+        self._report()
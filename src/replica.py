@@ -0,0 +1,202 @@
+""" A module for reading from a snapshot of the database instead of the database being written """
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import typing as t
+import weakref
+
+from src.database import DatabaseManager
+from src.pool import ConnectionPool
+
+DEFAULT_MAX_STALENESS = 5.0
+# Seconds between two checks of the background thread, half the default staleness so a copy
+# taken in less than that is always fresh enough.
+DEFAULT_REFRESH_SECONDS = DEFAULT_MAX_STALENESS / 2
+
+# The version of what a reader reads: the generation of the copy, with None, or the generation
+# and the data version of the database when it reads the database itself.
+SnapshotVersion = t.Tuple[int, t.Optional[int]]
+
+
+class ReplicaStats(t.NamedTuple):
+    generation: int
+    refreshes: int
+    age_seconds: float
+    last_copy_seconds: float
+
+
+def _discard_copy(pool: ConnectionPool) -> None:
+    """Closes the connections of a copy nobody reads any more and deletes its files."""
+
+    pool.close()
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(pool.db_name + suffix)
+        except OSError:
+            pass
+
+
+def _refresh_periodically(replica_ref: "weakref.ref[Replica]", stop: threading.Event, seconds: float) -> None:
+    """Refreshes the replica every few seconds until it is closed or garbage collected."""
+
+    while True:
+        replica = replica_ref()
+        if replica is None:
+            return
+        try:
+            replica.refresh()
+        except (sqlite3.Error, OSError) as error:
+            # Readers fall back to the database until a copy is fresh enough again.
+            print(f"Could not refresh the snapshot: {error}")
+        del replica
+        if stop.wait(seconds):
+            return
+
+
+class Replica:
+    """ A class that serves reads from a copy of a database, taken with the SQLite backup API.
+    The copy is read from a connection of its own in one short read transaction, so the writer
+    never waits for it, and queries on the copy, however long, hold no snapshot of the database's
+    WAL, which would keep checkpoints from resetting it. A copy is kept as long as the database
+    did not change.
+    A background thread takes the copies every refresh_seconds, so readers never wait for one:
+    they get the latest finished copy, or the database itself while there is none recent enough
+    for the staleness they tolerate. Without refresh_seconds copies are only taken by refresh().
+    Copies are written to temporary files rather than kept in memory, so they cost the disk space
+    of the database, and of two databases while a new copy is taken, but in memory only the page
+    caches of their connections. A copy is deleted once it is replaced and no longer referenced."""
+
+    def __init__(self, source: DatabaseManager, refresh_seconds: t.Optional[float] = DEFAULT_REFRESH_SECONDS):
+        """Copies nothing and starts no thread until the first read."""
+
+        if refresh_seconds is not None and refresh_seconds <= 0:
+            raise ValueError("refresh_seconds must be a positive number of seconds.")
+
+        self.source = source
+        self.refresh_seconds = refresh_seconds
+        # _lock guards the copy readers get, _refresh_lock is held for the whole of a refresh.
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._copy: t.Optional[DatabaseManager] = None
+        self._connection: t.Optional[sqlite3.Connection] = None
+        self._data_version: t.Optional[int] = None
+        self._checked_at = 0.0
+        self._last_copy_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+        self.generation = 0
+        self.refreshes = 0
+
+    def _start(self) -> None:
+        if self.refresh_seconds is None or self._thread is not None or self._stop.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=_refresh_periodically,
+                    args=(weakref.ref(self), self._stop, self.refresh_seconds),
+                    name="replica-refresh",
+                    daemon=True
+                )
+                weakref.finalize(self, self._stop.set)
+                self._thread.start()
+
+    def _source_changed(self) -> bool:
+        if self.source.pool.in_memory:
+            return True
+        if self._connection is None:
+            self._connection = self.source.pool.connect()
+        # Changes whenever another connection commits to the file.
+        data_version = self._connection.execute("PRAGMA data_version;").fetchone()[0]
+        changed = data_version != self._data_version
+        self._data_version = data_version
+        return changed
+
+    def _take_copy(self) -> DatabaseManager:
+        descriptor, path = tempfile.mkstemp(prefix="replica-", suffix=".db")
+        os.close(descriptor)
+
+        destination = sqlite3.connect(path)
+        try:
+            # The copy is thrown away on a crash, so nothing is synced to disk.
+            destination.execute("PRAGMA synchronous=OFF;")
+            if self.source.pool.in_memory:
+                # Only reachable through the writer connection, which waits for the copy.
+                with self.source.pool.writer() as connection:
+                    connection.backup(destination)
+            else:
+                t.cast(sqlite3.Connection, self._connection).backup(destination)
+        finally:
+            destination.close()
+
+        copy = DatabaseManager(path)
+        weakref.finalize(copy, _discard_copy, copy.pool)
+        return copy
+
+    def refresh(self) -> int:
+        """
+        Takes a new copy when the database changed since the last one, and returns the generation
+        of the copy, which changes with every new one. Readers keep the previous copy meanwhile.
+        """
+
+        with self._refresh_lock:
+            if self._stop.is_set():
+                return self.generation
+            checked_at = time.monotonic()
+            if self._source_changed() or self._copy is None:
+                start = time.perf_counter()
+                copy = self._take_copy()
+                with self._lock:
+                    # Readers still holding the previous copy keep reading it, it is deleted once released.
+                    self._copy = copy
+                    self._last_copy_seconds = time.perf_counter() - start
+                    self.generation += 1
+                    self.refreshes += 1
+            with self._lock:
+                self._checked_at = checked_at
+            return self.generation
+
+    def _fresh_copy(self, max_staleness: float) -> t.Optional[DatabaseManager]:
+        if max_staleness < 0:
+            raise ValueError("max_staleness must be 0 or a positive number of seconds.")
+
+        self._start()
+        with self._lock:
+            if self._copy is not None and time.monotonic() - self._checked_at <= max_staleness:
+                return self._copy
+            return None
+
+    def database(self, max_staleness: float = DEFAULT_MAX_STALENESS) -> DatabaseManager:
+        """
+        Returns the latest copy of the database if it is at most max_staleness seconds old, else
+        the database itself. Never waits for a copy. Read from it only.
+        """
+
+        copy = self._fresh_copy(max_staleness)
+        return copy if copy is not None else self.source
+
+    def version(self, max_staleness: float = DEFAULT_MAX_STALENESS) -> SnapshotVersion:
+        """Returns a version of what database(max_staleness) reads, for caches of results read from it."""
+
+        if self._fresh_copy(max_staleness) is not None:
+            return self.generation, None
+        return self.generation, self.source.pool.data_version()
+
+    def stats(self) -> ReplicaStats:
+        with self._lock:
+            age = time.monotonic() - self._checked_at if self._copy is not None else 0.0
+            return ReplicaStats(self.generation, self.refreshes, age, self._last_copy_seconds)
+
+    def close(self) -> None:
+        """Stops the background thread, closes the connection to the database and drops the copy."""
+
+        self._stop.set()
+        with self._refresh_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            with self._lock:
+                self._copy = None
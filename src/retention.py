@@ -0,0 +1,213 @@
+""" A module for moving old vitals out of the database into compressed archive files and back """
+
+import gzip
+import json
+import os
+import time
+import typing as t
+
+from datetime import datetime, timedelta
+
+from src import rollups
+from src.database import DatabaseManager
+
+DEFAULT_RETAIN_DAYS = 90
+DEFAULT_CHUNK_SIZE = 1_000
+DEFAULT_VACUUM_PAGES = 10_000
+
+ARCHIVE_SUFFIX = ".ndjson.gz"
+
+# PRAGMA auto_vacuum value of INCREMENTAL.
+INCREMENTAL = 2
+
+Row = t.Dict[str, t.Union[str, int, float, None]]
+
+
+def _dated_in(row: Row, since: str, until: str) -> bool:
+    """Tells whether the row is dated from since (inclusive) to until (exclusive)."""
+
+    date = row["date"]
+    return date is not None and since <= str(date) < until
+
+
+class ArchiveResult(t.NamedTuple):
+    rows_archived: int
+    chunks: int
+    files: t.List[str]
+    pages_vacuumed: int
+
+
+def enable_incremental_vacuum(db: DatabaseManager) -> bool:
+    """
+    Switches the database to auto_vacuum=INCREMENTAL, so the pages freed by deletes can be
+    returned to the file system a few at a time with incremental_vacuum. The mode can only be
+    set before the first table is created, so an existing database is rebuilt once with VACUUM.
+    Returns whether that VACUUM ran.
+    """
+
+    if db.execute("PRAGMA auto_vacuum;").fetchone()[0] == INCREMENTAL:
+        return False
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    if db.execute("PRAGMA auto_vacuum;").fetchone()[0] == INCREMENTAL:
+        return False
+    db.execute("VACUUM;")
+    return True
+
+
+def incremental_vacuum(db: DatabaseManager, pages: int = DEFAULT_VACUUM_PAGES) -> int:
+    """Returns at most pages free pages to the file system and returns how many were."""
+
+    free_pages = db.execute("PRAGMA freelist_count;").fetchone()[0]
+    # The pragma frees one page per step and a cursor only takes the first one, sqlite3_exec runs them all.
+    with db.pool.writer() as conn:
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return free_pages - db.execute("PRAGMA freelist_count;").fetchone()[0]
+
+
+class RetentionPolicy:
+    """ A class that moves the rows of a table older than retain_days into gzipped NDJSON files,
+    one per day of the table name (vitals-2023-01-31.ndjson.gz), and restores them on demand.
+
+    Rows are moved chunk_size at a time: a chunk is appended to its archive files and synced
+    before it is deleted in its own short transaction, so the write lock is never held for
+    long and a crash can at worst archive a chunk twice, which rehydrate ignores. The rollups
+    are paused while rows are moved, so they keep the aggregates of the archived rows."""
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        archive_directory: str,
+        retain_days: int = DEFAULT_RETAIN_DAYS,
+        table_name: str = "vitals",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_pause_seconds: float = 0.0,
+        vacuum_pages: int = DEFAULT_VACUUM_PAGES
+    ):
+        if retain_days < 0 or chunk_size < 1:
+            raise ValueError("retain_days must not be negative and chunk_size must be positive.")
+        self.db = db
+        self.archive_directory = archive_directory
+        self.retain_days = retain_days
+        self.table_name = table_name
+        self.chunk_size = chunk_size
+        self.chunk_pause_seconds = chunk_pause_seconds
+        self.vacuum_pages = vacuum_pages
+
+    def cutoff(self, now: t.Optional[datetime] = None) -> str:
+        """Returns the date before which rows are archived."""
+
+        return ((now or datetime.utcnow()) - timedelta(days=self.retain_days)).isoformat()
+
+    def archive_path(self, day: str) -> str:
+        return os.path.join(self.archive_directory, f"{self.table_name}-{day}{ARCHIVE_SUFFIX}")
+
+    def run(self, now: t.Optional[datetime] = None) -> ArchiveResult:
+        """Archives every row older than the cutoff, then vacuums the pages they freed."""
+
+        os.makedirs(self.archive_directory, exist_ok=True)
+        cutoff = self.cutoff(now)
+        archived = 0
+        chunks = 0
+        files: t.Set[str] = set()
+        after = None
+
+        while True:
+            cursor = self.db.select_record(
+                table_name=self.table_name,
+                order_by="date",
+                until=cutoff,
+                limit=self.chunk_size,
+                after=after,
+                key_column="record_id"
+            )
+            columns = [description[0] for description in cursor.description]
+            rows = [dict(zip(columns, values)) for values in cursor.fetchall()]
+            if not rows:
+                break
+
+            files.update(self._append(rows))
+            with rollups.paused(self.db, self.table_name):
+                self.db.delete_records(
+                    self.table_name, [row["record_id"] for row in rows], batch_size=len(rows)
+                )
+
+            archived += len(rows)
+            chunks += 1
+            after = (rows[-1]["date"], rows[-1]["record_id"])
+            if len(rows) < self.chunk_size:
+                break
+            if self.chunk_pause_seconds:
+                time.sleep(self.chunk_pause_seconds)
+
+        pages = incremental_vacuum(self.db, self.vacuum_pages) if archived else 0
+        return ArchiveResult(archived, chunks, sorted(files), pages)
+
+    def _append(self, rows: t.List[Row]) -> t.List[str]:
+        """Appends rows to the archive files of their days as new gzip members, synced to disk."""
+
+        days: t.Dict[str, t.List[Row]] = {}
+        for row in rows:
+            days.setdefault(str(row["date"])[:10], []).append(row)
+
+        paths = []
+        for day, day_rows in days.items():
+            path = self.archive_path(day)
+            with open(path, "ab") as file:
+                with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                    archive.write("".join(json.dumps(row) + "\n" for row in day_rows).encode())
+                file.flush()
+                os.fsync(file.fileno())
+            paths.append(path)
+        return paths
+
+    def _read(self, path: str) -> t.Dict[int, Row]:
+        """Returns the rows of an archive file by record_id, the last copy winning."""
+
+        with gzip.open(path, "rt") as archive:
+            rows = (json.loads(line) for line in archive)
+            return {row["record_id"]: row for row in rows}
+
+    def rehydrate(self, since: str, until: str) -> int:
+        """
+        Moves the archived rows dated from since (inclusive) to until (exclusive) back into the
+        table, with their original record ids, and removes them from the archive files. They are
+        archived again by the next run if they are still older than the cutoff.
+        Returns the number of restored rows.
+        """
+
+        if not os.path.isdir(self.archive_directory):
+            return 0
+
+        prefix = f"{self.table_name}-"
+        restored = 0
+        for name in sorted(os.listdir(self.archive_directory)):
+            if not (name.startswith(prefix) and name.endswith(ARCHIVE_SUFFIX)):
+                continue
+            day = name[len(prefix):-len(ARCHIVE_SUFFIX)]
+            if not since[:10] <= day <= until[:10]:
+                continue
+
+            path = os.path.join(self.archive_directory, name)
+            rows = self._read(path)
+            wanted = [row for row in rows.values() if _dated_in(row, since, until)]
+            if not wanted:
+                continue
+
+            with rollups.paused(self.db, self.table_name):
+                for row in wanted:
+                    self.db.execute(
+                        f"INSERT OR IGNORE INTO {self.table_name} ({', '.join(row)}) "
+                        f"VALUES ({', '.join('?' * len(row))});",
+                        tuple(row.values())
+                    )
+            restored += len(wanted)
+
+            remaining = [row for row in rows.values() if not _dated_in(row, since, until)]
+            if remaining:
+                with gzip.open(f"{path}.tmp", "wt") as archive:
+                    archive.write("".join(json.dumps(row) + "\n" for row in remaining))
+                os.replace(f"{path}.tmp", path)
+            else:
+                os.remove(path)
+
+        return restored
@@ -0,0 +1,365 @@
+""" A module for the per patient rollups of the vitals table """
+
+import contextlib
+import itertools
+import json
+import math
+import typing as t
+
+from src.database import DatabaseManager, DEFAULT_DELETE_CHUNK_SIZE
+
+ROLLUP_VITALS = ("heart_rate", "systolic", "diastolic", "respiratory_rate", "oxygen_saturation", "temperature")
+
+# The columns the deletes of this module return, to subtract the deleted rows from their buckets.
+DELETED_COLUMNS = ("patient_id", "date") + ROLLUP_VITALS
+
+# Granularity name -> (strftime format of the bucket start, SQLite modifier to the next bucket).
+GRANULARITIES: t.Dict[str, t.Tuple[str, str]] = {
+    "minute": ("%Y-%m-%dT%H:%M:00", "+1 minute"),
+    "hour": ("%Y-%m-%dT%H:00:00", "+1 hour"),
+    "day": ("%Y-%m-%dT00:00:00", "+1 day"),
+}
+
+
+class VitalAggregate(t.NamedTuple):
+    readings: int
+    min: t.Optional[float]
+    max: t.Optional[float]
+    mean: t.Optional[float]
+    stddev: t.Optional[float]
+
+
+class BucketAggregate(t.NamedTuple):
+    bucket: str
+    readings: int
+    vitals: t.Dict[str, VitalAggregate]
+
+
+def rollup_table(table_name: str, granularity: str) -> str:
+    return f"{table_name}_rollup_{granularity}"
+
+
+def pause_table(table_name: str) -> str:
+    return f"{table_name}_rollup_paused"
+
+
+def _unless_paused(table_name: str) -> str:
+    return f"WHEN NOT EXISTS (SELECT 1 FROM {pause_table(table_name)})"
+
+
+def _bucket(granularity: str, date: str) -> str:
+    return f"strftime('{GRANULARITIES[granularity][0]}', {date})"
+
+
+def _next_bucket(granularity: str, bucket: str) -> str:
+    return f"strftime('%Y-%m-%dT%H:%M:%S', {bucket}, '{GRANULARITIES[granularity][1]}')"
+
+
+def _rollup_columns() -> t.Dict[str, str]:
+    columns = {
+        "patient_id": "INTEGER NOT NULL",
+        "bucket": "TEXT NOT NULL",
+        "count": "INTEGER NOT NULL",
+    }
+    for vital in ROLLUP_VITALS:
+        columns[f"{vital}_count"] = "INTEGER NOT NULL"
+        columns[f"{vital}_min"] = "REAL"
+        columns[f"{vital}_max"] = "REAL"
+        columns[f"{vital}_sum"] = "REAL NOT NULL"
+        columns[f"{vital}_sumsq"] = "REAL NOT NULL"
+    columns["PRIMARY KEY"] = "(patient_id, bucket)"
+    return columns
+
+
+def _insert_trigger(table_name: str, granularity: str) -> str:
+    """The trigger adding every new row of table_name to its bucket, one upsert per row."""
+
+    rollup = rollup_table(table_name, granularity)
+    columns = ["patient_id", "bucket", "count"]
+    values = ["NEW.patient_id", _bucket(granularity, "NEW.date"), "1"]
+    updates = ["count = count + 1"]
+    for vital in ROLLUP_VITALS:
+        new = f"NEW.{vital}"
+        columns += [f"{vital}_count", f"{vital}_min", f"{vital}_max", f"{vital}_sum", f"{vital}_sumsq"]
+        values += [
+            f"{new} IS NOT NULL", new, new, f"coalesce({new}, 0)", f"coalesce({new} * {new}, 0)"
+        ]
+        updates += [
+            f"{vital}_count = {vital}_count + excluded.{vital}_count",
+            f"{vital}_min = coalesce(min({vital}_min, excluded.{vital}_min), {vital}_min, excluded.{vital}_min)",
+            f"{vital}_max = coalesce(max({vital}_max, excluded.{vital}_max), {vital}_max, excluded.{vital}_max)",
+            f"{vital}_sum = {vital}_sum + excluded.{vital}_sum",
+            f"{vital}_sumsq = {vital}_sumsq + excluded.{vital}_sumsq",
+        ]
+
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {rollup}_insert AFTER INSERT ON {table_name} "
+        f"{_unless_paused(table_name)} BEGIN "
+        f"INSERT INTO {rollup} ({', '.join(columns)}) VALUES ({', '.join(values)}) "
+        f"ON CONFLICT (patient_id, bucket) DO UPDATE SET {', '.join(updates)}; "
+        f"END;"
+    )
+
+
+def _delete_trigger(table_name: str, granularity: str) -> str:
+    """
+    The trigger removing every deleted row of table_name from its bucket. Counts and sums are
+    decremented, min and max are only recomputed, from the bucket's remaining rows through the
+    (patient_id, date) index, when the deleted value was the extreme.
+    """
+
+    rollup = rollup_table(table_name, granularity)
+    bucket = _bucket(granularity, "OLD.date")
+    in_bucket = (
+        f"FROM {table_name} WHERE patient_id = OLD.patient_id "
+        f"AND date >= {bucket} AND date < {_next_bucket(granularity, bucket)}"
+    )
+    updates = ["count = count - 1"]
+    for vital in ROLLUP_VITALS:
+        old = f"OLD.{vital}"
+        updates += [
+            f"{vital}_count = {vital}_count - ({old} IS NOT NULL)",
+            f"{vital}_min = CASE WHEN {old} <= {vital}_min THEN (SELECT min({vital}) {in_bucket}) ELSE {vital}_min END",
+            f"{vital}_max = CASE WHEN {old} >= {vital}_max THEN (SELECT max({vital}) {in_bucket}) ELSE {vital}_max END",
+            f"{vital}_sum = {vital}_sum - coalesce({old}, 0)",
+            f"{vital}_sumsq = {vital}_sumsq - coalesce({old} * {old}, 0)",
+        ]
+
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {rollup}_delete AFTER DELETE ON {table_name} "
+        f"{_unless_paused(table_name)} BEGIN "
+        f"UPDATE {rollup} SET {', '.join(updates)} "
+        f"WHERE patient_id = OLD.patient_id AND bucket = {bucket}; "
+        f"DELETE FROM {rollup} WHERE patient_id = OLD.patient_id AND bucket = {bucket} AND count <= 0; "
+        f"END;"
+    )
+
+
+def _backfill(table_name: str, granularity: str) -> str:
+    """Rebuilds the rollup of one granularity from the rows of table_name in one GROUP BY."""
+
+    columns = ["patient_id", "bucket", "count"]
+    aggregates = ["patient_id", _bucket(granularity, "date"), "count(*)"]
+    for vital in ROLLUP_VITALS:
+        columns += [f"{vital}_count", f"{vital}_min", f"{vital}_max", f"{vital}_sum", f"{vital}_sumsq"]
+        aggregates += [
+            f"count({vital})", f"min({vital})", f"max({vital})",
+            f"coalesce(sum({vital}), 0)", f"coalesce(sum({vital} * {vital}), 0)"
+        ]
+
+    return (
+        f"INSERT INTO {rollup_table(table_name, granularity)} ({', '.join(columns)}) "
+        f"SELECT {', '.join(aggregates)} FROM {table_name} GROUP BY 1, 2;"
+    )
+
+
+def _subtract(table_name: str, granularity: str) -> str:
+    """
+    The statement removing deleted rows, bound as one JSON array of DELETED_COLUMNS arrays, from
+    their buckets: the rows are grouped per bucket first, so a bucket is updated once per
+    statement instead of once per row as by the delete trigger. Min and max are only recomputed,
+    from the remaining rows of a bucket, when the deleted rows held the extreme but not every value.
+    """
+
+    rollup = rollup_table(table_name, granularity)
+    deleted = ", ".join(
+        f"json_extract(value, '$[{position}]') AS {column}" for position, column in enumerate(DELETED_COLUMNS)
+    )
+    in_bucket = (
+        f"FROM {table_name} WHERE patient_id = r.patient_id "
+        f"AND date >= r.bucket AND date < {_next_bucket(granularity, 'r.bucket')}"
+    )
+    aggregates = ["patient_id", f"{_bucket(granularity, 'date')} AS bucket", "count(*) AS count"]
+    updates = ["count = r.count - d.count"]
+    for vital in ROLLUP_VITALS:
+        aggregates += [
+            f"count({vital}) AS {vital}_count", f"min({vital}) AS {vital}_min", f"max({vital}) AS {vital}_max",
+            f"coalesce(sum({vital}), 0) AS {vital}_sum", f"coalesce(sum({vital} * {vital}), 0) AS {vital}_sumsq"
+        ]
+        updates += [
+            f"{vital}_count = r.{vital}_count - d.{vital}_count",
+            f"{vital}_min = CASE WHEN r.{vital}_count = d.{vital}_count THEN NULL "
+            f"WHEN d.{vital}_min <= r.{vital}_min THEN (SELECT min({vital}) {in_bucket}) ELSE r.{vital}_min END",
+            f"{vital}_max = CASE WHEN r.{vital}_count = d.{vital}_count THEN NULL "
+            f"WHEN d.{vital}_max >= r.{vital}_max THEN (SELECT max({vital}) {in_bucket}) ELSE r.{vital}_max END",
+            f"{vital}_sum = r.{vital}_sum - d.{vital}_sum",
+            f"{vital}_sumsq = r.{vital}_sumsq - d.{vital}_sumsq",
+        ]
+
+    return (
+        f"UPDATE {rollup} AS r SET {', '.join(updates)} "
+        f"FROM (SELECT {', '.join(aggregates)} FROM (SELECT {deleted} FROM json_each(?)) GROUP BY 1, 2) AS d "
+        f"WHERE r.patient_id = d.patient_id AND r.bucket = d.bucket;"
+    )
+
+
+def _subtract_deleted(db: DatabaseManager, table_name: str, rows: t.List[tuple]) -> None:
+    """Removes rows of DELETED_COLUMNS deleted while the rollups were paused from their buckets."""
+
+    if not rows:
+        return
+    values = (json.dumps(rows),)
+    patient_ids = (json.dumps(sorted({row[0] for row in rows})),)
+    for granularity in GRANULARITIES:
+        rollup = rollup_table(table_name, granularity)
+        db.execute(_subtract(table_name, granularity), values)
+        db.execute(
+            f"DELETE FROM {rollup} WHERE patient_id IN (SELECT value FROM json_each(?)) AND count <= 0;",
+            patient_ids
+        )
+
+
+def delete_in_chunks(
+    db: DatabaseManager,
+    table_name: str,
+    criteria: t.Dict[str, t.Union[str, int, float]],
+    chunk_size: int = DEFAULT_DELETE_CHUNK_SIZE
+) -> int:
+    """
+    Deletes the rows matching criteria chunk_size at a time like DatabaseManager.delete_in_chunks,
+    with the delete triggers paused and each chunk subtracted from the rollups in its own
+    transaction by one grouped update per granularity. Returns the number of rows deleted.
+    """
+
+    if not db.table_exists(pause_table(table_name)):
+        return db.delete_in_chunks(table_name, criteria, chunk_size)
+
+    deleted = 0
+    while True:
+        with paused(db, table_name):
+            rows = db.delete_chunk(table_name, criteria, chunk_size, returning=DELETED_COLUMNS)
+            _subtract_deleted(db, table_name, rows)
+        deleted += len(rows)
+        if len(rows) < chunk_size:
+            return deleted
+
+
+def delete_records(
+    db: DatabaseManager,
+    table_name: str,
+    keys: t.Iterable[t.Union[str, int, float]],
+    key_column: str = "record_id",
+    batch_size: int = DEFAULT_DELETE_CHUNK_SIZE
+) -> t.List[tuple]:
+    """
+    Deletes the rows of many keys like DatabaseManager.delete_records, each batch subtracted
+    from the rollups like the chunks of delete_in_chunks. Returns the DELETED_COLUMNS of every
+    deleted row.
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+
+    keys = iter(keys)
+    deleted: t.List[tuple] = []
+    batch = list(itertools.islice(keys, batch_size))
+    while batch:
+        with paused(db, table_name):
+            rows = db.delete_records(table_name, batch, key_column, returning=DELETED_COLUMNS, batch_size=batch_size)
+            _subtract_deleted(db, table_name, rows)
+        deleted.extend(rows)
+        batch = list(itertools.islice(keys, batch_size))
+    return deleted
+
+
+def create_rollups(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """
+    Creates the minute, hour and day rollup tables of table_name and the triggers that keep
+    them up to date on every insert and delete, whichever command or path writes the rows.
+    Rollup tables created for a table that already holds rows are backfilled from it.
+    """
+
+    with db.transaction():
+        db.create_table(table_name=pause_table(table_name), columns={"paused": "INTEGER"})
+        for granularity in GRANULARITIES:
+            rollup = rollup_table(table_name, granularity)
+            existed = db.table_exists(rollup)
+            db.create_table(table_name=rollup, columns=_rollup_columns())
+            db.execute(_insert_trigger(table_name, granularity))
+            db.execute(_delete_trigger(table_name, granularity))
+            if not existed:
+                db.execute(_backfill(table_name, granularity))
+
+
+def drop_triggers(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """Drops the triggers of the rollups of table_name, so create_rollups recreates them."""
+
+    for granularity in GRANULARITIES:
+        rollup = rollup_table(table_name, granularity)
+        db.execute(f"DROP TRIGGER IF EXISTS {rollup}_insert;")
+        db.execute(f"DROP TRIGGER IF EXISTS {rollup}_delete;")
+
+
+@contextlib.contextmanager
+def paused(db: DatabaseManager, table_name: str = "vitals") -> t.Iterator[None]:
+    """
+    Runs a block in one transaction in which inserts and deletes of table_name leave its rollups
+    as they are, for moving rows out to archives and back without changing the aggregates.
+    """
+
+    with db.transaction():
+        if not db.table_exists(pause_table(table_name)):
+            # No rollups to keep.
+            yield
+            return
+        db.execute(f"INSERT INTO {pause_table(table_name)} (paused) VALUES (1);")
+        yield
+        db.execute(f"DELETE FROM {pause_table(table_name)};")
+
+
+def rebuild_rollups(db: DatabaseManager, table_name: str = "vitals") -> None:
+    """
+    Recomputes every rollup of table_name from scratch, for repairs after manual edits.
+    Rows moved out to archives are no longer in the table, so their buckets are lost.
+    """
+
+    with db.transaction():
+        for granularity in GRANULARITIES:
+            db.execute(f"DELETE FROM {rollup_table(table_name, granularity)};")
+            db.execute(_backfill(table_name, granularity))
+
+
+def _vital_aggregate(
+    count: int, minimum: t.Any, maximum: t.Any, total: float, total_squares: float
+) -> VitalAggregate:
+    if not count:
+        return VitalAggregate(0, None, None, None, None)
+    mean = total / count
+    variance = max(0.0, total_squares / count - mean * mean)
+    return VitalAggregate(count, minimum, maximum, mean, math.sqrt(variance))
+
+
+def select_aggregates(
+    db: DatabaseManager,
+    patient_id: int,
+    granularity: str = "hour",
+    since: t.Optional[str] = None,
+    until: t.Optional[str] = None,
+    table_name: str = "vitals"
+) -> t.List[BucketAggregate]:
+    """
+    Returns the aggregates of a patient's vitals per bucket of the granularity, read from the
+    rollup table, so the cost grows with the number of buckets and not with the number of rows.
+    since and until bound the bucket start like select_record bounds dates.
+    """
+
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {tuple(GRANULARITIES)}.")
+
+    rows = db.select_record(
+        table_name=rollup_table(table_name, granularity),
+        criteria={"patient_id": patient_id},
+        order_by="bucket",
+        since=since,
+        until=until,
+        range_column="bucket"
+    ).fetchall()
+
+    aggregates = []
+    for row in rows:
+        vitals = {}
+        for position, vital in enumerate(ROLLUP_VITALS):
+            offset = 3 + 5 * position
+            vitals[vital] = _vital_aggregate(*row[offset:offset + 5])
+        aggregates.append(BucketAggregate(row[1], row[2], vitals))
+    return aggregates
@@ -0,0 +1,153 @@
+""" A module for scoring vitals with the National Early Warning Score 2 (NEWS2) """
+
+import typing as t
+
+from bisect import bisect_left
+
+from src.database import DatabaseManager
+
+if t.TYPE_CHECKING:
+    import numpy as np
+
+# Vital -> (inclusive upper bounds of the bands, score of each band and of values above the last).
+# The SpO2 bands are those of scale 1. The level of consciousness and supplemental oxygen are not
+# recorded, so they score 0 and a total is a NEWS2 score assuming an alert patient on room air.
+NEWS2_BANDS: t.Dict[str, t.Tuple[t.Tuple[float, ...], t.Tuple[int, ...]]] = {
+    "respiratory_rate": ((8, 11, 20, 24), (3, 1, 0, 2, 3)),
+    "oxygen_saturation": ((91, 93, 95), (3, 2, 1, 0)),
+    "systolic": ((90, 100, 110, 219), (3, 2, 1, 0, 3)),
+    "heart_rate": ((40, 50, 90, 110, 130), (3, 1, 0, 1, 2, 3)),
+    "temperature": ((35.0, 36.0, 38.0, 39.0), (3, 1, 0, 1, 2)),
+}
+
+SCORED_VITALS = tuple(NEWS2_BANDS)
+
+# The sub-score of a vital that was not measured, in the arrays of score_arrays.
+MISSING = -1
+
+LOW = "low"
+LOW_MEDIUM = "low-medium"
+MEDIUM = "medium"
+HIGH = "high"
+
+DEFAULT_SCORE_BATCH_SIZE = 100_000
+
+Value = t.Union[str, int, float, None]
+
+
+class RecordScore(t.NamedTuple):
+    """The NEWS2 total, sub-scores and clinical risk of one record, None where nothing was measured."""
+
+    total: t.Optional[int]
+    subscores: t.Dict[str, t.Optional[int]]
+    risk: t.Optional[str]
+
+
+class ArrayScores(t.NamedTuple):
+    """The NEWS2 totals and sub-scores of many records, MISSING where nothing was measured."""
+
+    total: "np.ndarray"
+    subscores: t.Dict[str, "np.ndarray"]
+
+
+def subscore(vital: str, value: t.Optional[float]) -> t.Optional[int]:
+    """Returns the NEWS2 sub-score of one reading of a vital, None when it was not measured."""
+
+    if value is None:
+        return None
+    bounds, scores = NEWS2_BANDS[vital]
+    return scores[bisect_left(bounds, value)]
+
+
+def risk_of(total: int, highest_subscore: int) -> str:
+    """Returns the clinical risk of a total: any single vital scoring 3 raises a low total to low-medium."""
+
+    if total >= 7:
+        return HIGH
+    if total >= 5:
+        return MEDIUM
+    if highest_subscore >= 3:
+        return LOW_MEDIUM
+    return LOW
+
+
+def score_record(record: t.Mapping[str, Value]) -> RecordScore:
+    """Scores one coerced vitals record, in pure Python so that scoring a single insert stays cheap."""
+
+    subscores = {vital: subscore(vital, record.get(vital)) for vital in SCORED_VITALS}  # type: ignore[arg-type]
+    measured = [score for score in subscores.values() if score is not None]
+    if not measured:
+        return RecordScore(None, subscores, None)
+    total = sum(measured)
+    return RecordScore(total, subscores, risk_of(total, max(measured)))
+
+
+def score_arrays(vitals: t.Mapping[str, "np.ndarray"]) -> ArrayScores:
+    """
+    Scores many records at once from one float array per vital, NaN where a vital was not
+    measured, such as the arrays of columnar.vitals_columns. Each band lookup is a single
+    searchsorted over the whole array, so no Python code runs per record.
+    """
+
+    import numpy as np
+
+    subscores = {}
+    shape = np.shape(vitals[SCORED_VITALS[0]])
+    total = np.zeros(shape, dtype=np.int16)
+    measured = np.zeros(shape, dtype=bool)
+    for vital in SCORED_VITALS:
+        values = np.asarray(vitals[vital])
+        bounds, scores = NEWS2_BANDS[vital]
+        missing = np.isnan(values)
+        scored = np.asarray(scores, dtype=np.int8)[np.searchsorted(bounds, values, side="left")]
+        subscores[vital] = np.where(missing, np.int8(MISSING), scored)
+
+        present = np.where(missing, np.int8(0), scored).astype(np.int16)
+        total += present
+        measured |= ~missing
+
+    return ArrayScores(np.where(measured, total, np.int16(MISSING)), subscores)
+
+
+def risk_levels(scores: ArrayScores) -> "np.ndarray":
+    """Returns the risk_of of every record of score_arrays as strings, None where nothing was measured."""
+
+    import numpy as np
+
+    highest = np.max(np.stack(list(scores.subscores.values())), axis=0)
+    # Scalars, which np.select broadcasts like arrays of the shape of the conditions.
+    levels: t.List[t.Any] = [None, HIGH, MEDIUM, LOW_MEDIUM]
+    return np.select(
+        [scores.total == MISSING, scores.total >= 7, scores.total >= 5, highest >= 3],
+        levels,
+        default=LOW
+    )
+
+
+def backfill_scores(
+    db: DatabaseManager,
+    table_name: str = "vitals",
+    batch_size: int = DEFAULT_SCORE_BATCH_SIZE
+) -> int:
+    """
+    Recomputes the news2 column of every row of table_name with score_arrays, reading the
+    scored vitals as typed arrays and writing the totals back in batched updates. Returns the
+    number of rows scored.
+    """
+
+    import numpy as np
+
+    arrays = db.fetch_columns(
+        table_name=table_name,
+        columns={"record_id": "int64", **{vital: "float64" for vital in SCORED_VITALS}}
+    )
+    scores = score_arrays(arrays)
+    totals = scores.total.astype(object)
+    totals[scores.total == MISSING] = None
+
+    return db.update_records(
+        table_name=table_name,
+        columns=("news2",),
+        rows=zip(totals.tolist(), arrays["record_id"].tolist()),
+        batch_size=batch_size
+    )
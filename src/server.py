@@ -0,0 +1,310 @@
+"""
+A module for the ingestion server, through which monitors push batches of vitals records over
+HTTP, on a local TCP port or a Unix socket:
+
+    python -m src.server --port 8765
+    curl --data-binary @readings.ndjson http://127.0.0.1:8765/vitals
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import threading
+import typing as t
+
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import commands, ingest
+from src.database import DatabaseManager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Waiting requests share a commit; a lone request waits at most this long for company.
+DEFAULT_MAX_DELAY_MS = 5
+DEFAULT_MAX_BODY_BYTES = 16 * 1024 * 1024
+# Most of the body of a refused request read before closing its connection, so the client gets the
+# response rather than a reset of a socket closed with unread data.
+MAX_DISCARDED_BYTES = 1024 * 1024
+
+VITALS_PATH = "/vitals"
+HEALTH_PATH = "/health"
+
+Record = ingest.Record
+
+
+class Rejected(t.NamedTuple):
+    """A record of a batch that was not stored, by its position in the batch."""
+
+    position: int
+    error: str
+
+
+class ParsedBatch(t.NamedTuple):
+    records: t.List[Record]
+    rejected: t.List[Rejected]
+
+
+def parse_batch(body: bytes) -> ParsedBatch:
+    """
+    Parses a batch of records, a JSON array of objects or one object per line (NDJSON), and
+    prepares each like AddRecordCommand does. Invalid records are rejected one by one, the
+    others are kept. Runs in the worker processes, so it only depends on its argument.
+    """
+
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError as error:
+        return ParsedBatch([], [Rejected(0, f"The body is not UTF-8: {error}.")])
+
+    items: t.List[t.Any] = []
+    rejected: t.List[Rejected] = []
+    if text.lstrip().startswith("["):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError as error:
+            return ParsedBatch([], [Rejected(0, f"Invalid JSON: {error}.")])
+    else:
+        for position, line in enumerate(line for line in text.splitlines() if line.strip()):
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError as error:
+                items.append(None)
+                rejected.append(Rejected(position, f"Invalid JSON: {error}."))
+
+    failed = {entry.position for entry in rejected}
+    records = []
+    for position, item in enumerate(items):
+        if position in failed:
+            continue
+        if not isinstance(item, dict):
+            rejected.append(Rejected(position, "Every record must be a JSON object."))
+            continue
+        try:
+            records.append(commands.prepare_record(item))
+        except ValueError as error:
+            rejected.append(Rejected(position, str(error)))
+    return ParsedBatch(records, sorted(rejected))
+
+
+def _ready() -> None:
+    """Does nothing, submitted to start the worker processes."""
+
+
+def _ignore_interrupts() -> None:
+    """Leaves Ctrl+C to the server process, which stops the workers once the queued records are written."""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class IngestServer:
+    """ A class that serves POST /vitals: the records of a batch are parsed and validated in a pool
+    of worker processes (in the request thread when workers is 0), then written by the single
+    thread of a SYNC write-behind buffer, so the batches of concurrent requests share one commit.
+    A request is answered once its records are committed, with the records accepted, those
+    rejected and the alerts they raised. GET /health returns the metrics of the buffer."""
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        address: t.Union[t.Tuple[str, int], str] = (DEFAULT_HOST, DEFAULT_PORT),
+        workers: int = DEFAULT_WORKERS,
+        max_rows: int = ingest.DEFAULT_MAX_ROWS,
+        max_delay_ms: float = DEFAULT_MAX_DELAY_MS,
+        max_body_bytes: int = DEFAULT_MAX_BODY_BYTES
+    ):
+        """Listens on a (host, port) address, or on a Unix socket given its path, and starts the workers."""
+
+        if workers < 0:
+            raise ValueError("workers must be 0 or a positive integer.")
+
+        self.max_body_bytes = max_body_bytes
+        self.workers: t.Optional[ProcessPoolExecutor] = None
+        if workers:
+            # Started before any thread of the server, as forking a process with running threads is unsafe.
+            self.workers = ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupts)
+            self.workers.submit(_ready).result()
+
+        self.buffer = ingest.WriteBehindBuffer(
+            db,
+            table_name="vitals",
+            max_rows=max_rows,
+            max_delay_ms=max_delay_ms,
+            durability=ingest.SYNC,
+            max_pending=max(ingest.DEFAULT_MAX_PENDING, max_rows),
+            on_flush=commands.records_written
+        )
+
+        self.unix_socket = address if isinstance(address, str) else None
+        self._httpd: t.Union[_TCPHTTPServer, _UnixHTTPServer]
+        if self.unix_socket is not None:
+            if os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
+            self._httpd = _UnixHTTPServer(self.unix_socket, _Handler)
+        else:
+            self._httpd = _TCPHTTPServer(t.cast(t.Tuple[str, int], address), _Handler)
+        self._httpd.ingest_server = self
+        self._thread: t.Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> t.Union[t.Tuple[str, int], str]:
+        """The address the server listens on, with the actual port when it was given as 0."""
+
+        return self.unix_socket if self.unix_socket is not None else self._httpd.server_address[:2]  # type: ignore
+
+    def ingest(self, body: bytes) -> t.Dict[str, t.Any]:
+        """Parses, validates and stores a batch, and returns the response to it."""
+
+        if self.workers is not None:
+            parsed = self.workers.submit(parse_batch, body).result()
+        else:
+            parsed = parse_batch(body)
+
+        self.buffer.add_many(parsed.records)
+        alerts = commands.alert_engine.process_batch(parsed.records)
+        return {
+            "accepted": len(parsed.records),
+            "rejected": [entry._asdict() for entry in parsed.rejected],
+            "alerts": [alert._asdict() for alert in alerts],
+        }
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def start(self) -> None:
+        """Serves requests on a background thread, until close()."""
+
+        self._thread = threading.Thread(target=self.serve_forever, name="ingest-server", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stops accepting requests, writes the queued records and stops the workers."""
+
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
+        self.buffer.close()
+        if self.workers is not None:
+            self.workers.shutdown()
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+
+
+class _IngestHTTPServer:
+    """The part of the HTTP servers the handler relies on: the IngestServer they serve."""
+
+    ingest_server: IngestServer
+
+
+class _TCPHTTPServer(_IngestHTTPServer, ThreadingHTTPServer):
+    pass
+
+
+class _UnixHTTPServer(_IngestHTTPServer, socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keeps connections open between the batches of a client.
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, status: int, body: t.Dict[str, t.Any]) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _discard(self, length: int) -> None:
+        """Reads and drops the body of a refused request, closing the connection when it is too long to read."""
+
+        remaining = min(length, MAX_DISCARDED_BYTES)
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        if length > MAX_DISCARDED_BYTES or remaining > 0:
+            self.close_connection = True
+
+    def do_POST(self) -> None:
+        server = t.cast(_IngestHTTPServer, self.server).ingest_server
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The end of the body is unknown, so is the start of the next request.
+            self.close_connection = True
+            self._respond(400, {"error": "Content-Length must be a non-negative integer."})
+            return
+        if self.path != VITALS_PATH:
+            self._discard(length)
+            self._respond(404, {"error": f"Unknown path {self.path!r}, post records to {VITALS_PATH}."})
+            return
+        if length > server.max_body_bytes:
+            self._discard(length)
+            self.close_connection = True
+            self._respond(413, {"error": f"Batches are limited to {server.max_body_bytes} bytes."})
+            return
+
+        body = self.rfile.read(length)
+        try:
+            response = server.ingest(body)
+        except Exception as error:
+            self._respond(500, {"error": f"The batch could not be stored: {error}"})
+            return
+        self._respond(200, response)
+
+    def do_GET(self) -> None:
+        server = t.cast(_IngestHTTPServer, self.server).ingest_server
+        if self.path != HEALTH_PATH:
+            self._respond(404, {"error": f"Unknown path {self.path!r}."})
+            return
+        self._respond(200, {"status": "ok", **server.buffer.metrics()._asdict()})
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        # One line per batch would cost more than the batch, errors are in the responses.
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serves POST /vitals to ingest batches of vitals records.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="path of a Unix socket to listen on instead of a TCP port")
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help="processes parsing and validating batches, 0 to do it in the request threads"
+    )
+    parser.add_argument("--max-rows", type=int, default=ingest.DEFAULT_MAX_ROWS, help="rows that trigger a commit")
+    parser.add_argument(
+        "--max-delay-ms", type=float, default=DEFAULT_MAX_DELAY_MS,
+        help="longest a batch waits for others to share its commit"
+    )
+    args = parser.parse_args()
+
+    commands.CreateVitalSignsTableCommand().execute()
+    server = IngestServer(
+        commands.db,
+        address=args.unix_socket or (args.host, args.port),
+        workers=args.workers,
+        max_rows=args.max_rows,
+        max_delay_ms=args.max_delay_ms
+    )
+    print(f"Ingesting vitals on {server.address}, press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+""" A module for streaming vitals records from and to CSV and NDJSON files """
+
+import csv
+import gzip
+import io
+import json
+import os
+import time
+import typing as t
+
+from src.database import DatabaseManager, DEFAULT_BATCH_SIZE
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+# Import progress per file: the byte offset after the last committed row, saved in the
+# transaction of the batch so a resumed import neither skips nor repeats rows.
+CHECKPOINT_TABLE = "import_checkpoints"
+
+CHECKPOINT_COLUMNS = {
+    "path": "TEXT PRIMARY KEY",
+    "position": "INTEGER NOT NULL",
+    "header": "TEXT",
+    "imported": "INTEGER NOT NULL",
+    "skipped": "INTEGER NOT NULL",
+}
+
+MAX_REPORTED_ERRORS = 5
+
+Record = t.Dict[str, t.Any]
+
+
+class TransferResult(t.NamedTuple):
+    rows: int
+    skipped: int
+    errors: t.List[str]
+    seconds: float
+    resumed: bool = False
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class InvalidFileError(ValueError):
+    """Raised for a file whose format is unknown or whose content does not match its format."""
+
+
+def detect_format(path: str) -> str:
+    """Returns CSV or NDJSON from the extension of path, which may end with .gz."""
+
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".csv":
+        return CSV
+    if extension in (".ndjson", ".jsonl"):
+        return NDJSON
+    raise InvalidFileError(f"Unknown file format {extension!r}, use .csv, .ndjson or .jsonl (optionally .gz).")
+
+
+def open_binary(path: str, mode: str = "rb", compressed: t.Optional[bool] = None) -> t.BinaryIO:
+    """Opens path in binary mode, through gzip when compressed or, by default, when it ends with .gz."""
+
+    if compressed if compressed is not None else path.endswith(".gz"):
+        return t.cast(t.BinaryIO, gzip.open(path, mode))
+    return t.cast(t.BinaryIO, open(path, mode))
+
+
+class RecordReader:
+    """ A class that iterates the records of a CSV or NDJSON file one at a time, so memory does
+    not depend on the size of the file. Each record comes with the byte offset just after it,
+    to start a later reader from; a reader started past the header of a CSV file needs the header."""
+
+    def __init__(
+        self,
+        file: t.BinaryIO,
+        file_format: str,
+        offset: int = 0,
+        header: t.Optional[t.List[str]] = None
+    ):
+        self.file = file
+        self.file_format = file_format
+        self.offset = offset
+        self.header = header
+        if offset:
+            file.seek(offset)
+
+    def _lines(self) -> t.Iterator[str]:
+        for line in self.file:
+            self.offset += len(line)
+            yield line.decode("utf-8-sig" if self.offset == len(line) else "utf-8")
+
+    def __iter__(self) -> t.Iterator[t.Tuple[t.Union[Record, InvalidFileError], int]]:
+        """Yields (record, offset after it), or an InvalidFileError in place of a malformed record."""
+
+        if self.file_format == CSV:
+            yield from self._csv_records()
+        else:
+            yield from self._ndjson_records()
+
+    def _csv_records(self) -> t.Iterator[t.Tuple[t.Union[Record, InvalidFileError], int]]:
+        rows = csv.reader(self._lines())
+        if self.header is None:
+            self.header = next(rows, None)
+            if self.header is None:
+                return
+        for row in rows:
+            if not row:
+                continue
+            if len(row) != len(self.header):
+                yield InvalidFileError(f"Expected {len(self.header)} fields, got {len(row)}."), self.offset
+                continue
+            yield dict(zip(self.header, row)), self.offset
+
+    def _ndjson_records(self) -> t.Iterator[t.Tuple[t.Union[Record, InvalidFileError], int]]:
+        for line in self._lines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                yield InvalidFileError(f"Invalid JSON: {error}."), self.offset
+                continue
+            if not isinstance(record, dict):
+                yield InvalidFileError("Every line must hold a JSON object."), self.offset
+                continue
+            yield record, self.offset
+
+
+class RecordWriter:
+    """A class that writes records to a CSV or NDJSON text stream."""
+
+    def __init__(self, file: t.TextIO, file_format: str, columns: t.Sequence[str]):
+        self.file = file
+        self.file_format = file_format
+        self.columns = list(columns)
+        self._csv = None
+        if file_format == CSV:
+            self._csv = csv.writer(file)
+            self._csv.writerow(self.columns)
+
+    def write(self, row: t.Sequence[t.Any]) -> None:
+        if self._csv is not None:
+            self._csv.writerow(["" if value is None else value for value in row])
+        else:
+            self.file.write(json.dumps(dict(zip(self.columns, row))) + "\n")
+
+
+def open_text_writer(path: str, compressed: t.Optional[bool] = None) -> t.TextIO:
+    """Opens path for writing text, through gzip as open_binary does."""
+
+    return io.TextIOWrapper(open_binary(path, "wb", compressed), encoding="utf-8", newline="")
+
+
+def import_records(
+    db: DatabaseManager,
+    path: str,
+    prepare: t.Callable[[Record], Record],
+    table_name: str = "vitals",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    resume: bool = True
+) -> TransferResult:
+    """
+    Streams the records of a CSV or NDJSON file into table_name. Every record goes through
+    prepare, which returns the row to insert (the same columns for every row) or raises
+    ValueError to skip it; skipped records are counted and the first errors reported.
+    Rows are inserted batch_size at a time, each batch in one transaction together with the
+    checkpoint of the file, so with resume an import that failed mid-file carries on after the
+    last committed batch. The checkpoint is removed once the whole file is imported.
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+
+    file_format = detect_format(path)
+    key = os.path.abspath(path)
+    db.create_table(table_name=CHECKPOINT_TABLE, columns=CHECKPOINT_COLUMNS)
+    checkpoint = db.execute(
+        f"SELECT position, header, imported, skipped FROM {CHECKPOINT_TABLE} WHERE path = ?;", (key,)
+    ).fetchone() if resume else None
+    position, header, imported, skipped = 0, None, 0, 0
+    if checkpoint is not None:
+        position, imported, skipped = checkpoint[0], checkpoint[2], checkpoint[3]
+        header = json.loads(checkpoint[1]) if checkpoint[1] is not None else None
+    resumed_rows = imported
+
+    errors: t.List[str] = []
+    start = time.perf_counter()
+
+    with open_binary(path) as file:
+        reader = RecordReader(file, file_format, position, header)
+        batch: t.List[Record] = []
+
+        def commit() -> None:
+            nonlocal imported
+            with db.transaction():
+                if batch:
+                    db.add_records(table_name=table_name, rows=batch, batch_size=len(batch))
+                db.execute(
+                    f"INSERT INTO {CHECKPOINT_TABLE} (path, position, header, imported, skipped) "
+                    f"VALUES (?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET position = excluded.position, "
+                    f"header = excluded.header, imported = excluded.imported, skipped = excluded.skipped;",
+                    (key, position, json.dumps(reader.header), imported + len(batch), skipped)
+                )
+            imported += len(batch)
+            batch.clear()
+
+        for record, end in reader:
+            try:
+                if isinstance(record, InvalidFileError):
+                    raise record
+                batch.append(prepare(record))
+            except ValueError as error:
+                skipped += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"record {imported + len(batch) + skipped}: {error}")
+            position = end
+            if len(batch) >= batch_size:
+                commit()
+        commit()
+
+    db.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE path = ?;", (key,))
+    return TransferResult(
+        imported - resumed_rows, skipped, errors, time.perf_counter() - start, checkpoint is not None
+    )
+
+
+def export_records(
+    db: DatabaseManager,
+    path: str,
+    table_name: str = "vitals",
+    criteria: t.Dict[str, t.Union[str, int, float]] = {},
+    since: t.Optional[str] = None,
+    until: t.Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> TransferResult:
+    """
+    Streams the rows of table_name matching criteria, ordered by date, to a CSV or NDJSON file,
+    reading them in keyset pages so memory does not depend on the size of the table. The file
+    is written next to path and renamed when complete, so a failed export leaves no partial file.
+    """
+
+    file_format = detect_format(path)
+    columns = [description[0] for description in db.execute(f"SELECT * FROM {table_name} LIMIT 0;").description]
+    rows = db.iter_records(
+        table_name=table_name,
+        criteria=criteria,
+        order_by="date",
+        since=since,
+        until=until,
+        batch_size=batch_size,
+        key_column="record_id"
+    )
+
+    start = time.perf_counter()
+    exported = 0
+    partial = f"{path}.partial"
+    try:
+        with open_text_writer(partial, path.endswith(".gz")) as file:
+            writer = RecordWriter(file, file_format, columns)
+            for row in rows:
+                writer.write(row)
+                exported += 1
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return TransferResult(exported, 0, [], time.perf_counter() - start)
@@ -0,0 +1,99 @@
+""" A module for validating and coercing vitals records before they are stored """
+
+import typing as t
+
+from datetime import datetime
+
+Value = t.Union[str, int, float, None]
+
+# Column -> Python type every value of the column is coerced to.
+VITALS_TYPES: t.Dict[str, type] = {
+    "record_id": int,
+    "patient_id": int,
+    "date": str,
+    "heart_rate": int,
+    "systolic": int,
+    "diastolic": int,
+    "respiratory_rate": int,
+    "oxygen_saturation": float,
+    "temperature": float,
+}
+
+REQUIRED_COLUMNS = ("patient_id",)
+
+
+class InvalidRecordError(ValueError):
+    """Raised when a record has a value that cannot be stored in its column."""
+
+
+def parse_blood_pressure(value: str) -> t.Tuple[int, int]:
+    """Splits a "systolic/diastolic" reading such as "120/80" into two integers."""
+
+    parts = str(value).replace(" ", "").split("/")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        raise InvalidRecordError(f"blood_pressure must look like 120/80, got {value!r}.")
+    return int(parts[0]), int(parts[1])
+
+
+def _coerce_int(column: str, value: t.Union[str, int, float]) -> int:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRecordError(f"{column} must be an integer, got {value!r}.") from None
+    if not number.is_integer():
+        raise InvalidRecordError(f"{column} must be an integer, got {value!r}.")
+    return int(number)
+
+
+def _coerce_float(column: str, value: t.Union[str, int, float]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidRecordError(f"{column} must be a number, got {value!r}.") from None
+
+
+def _coerce_date(value: t.Union[str, int, float]) -> str:
+    try:
+        return datetime.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise InvalidRecordError(f"date must be an ISO 8601 date, got {value!r}.") from None
+
+
+def coerce_vitals(
+    data: t.Mapping[str, Value], complete: bool = False
+) -> t.Dict[str, t.Union[str, int, float, None]]:
+    """
+    Returns a copy of a vitals record with every value converted to the type of its column.
+    Empty values become None (NULL), a blood_pressure reading is split into systolic and
+    diastolic, and dates are normalised to ISO 8601. With complete, the columns the record
+    lacks are added as None, so records of a batch share the same columns.
+    Raises InvalidRecordError for unknown columns, missing patient ids and values that do not convert.
+    """
+
+    record: t.Dict[str, t.Union[str, int, float, None]] = {}
+    for column, value in data.items():
+        if column == "blood_pressure":
+            if value is None or not str(value).strip():
+                record["systolic"], record["diastolic"] = None, None
+            else:
+                record["systolic"], record["diastolic"] = parse_blood_pressure(str(value))
+        elif column not in VITALS_TYPES:
+            raise InvalidRecordError(f"Unknown column {column!r}.")
+        elif value is None or (isinstance(value, str) and not value.strip()):
+            record[column] = None
+        elif column == "date":
+            record[column] = _coerce_date(value)
+        elif VITALS_TYPES[column] is int:
+            record[column] = _coerce_int(column, value)
+        else:
+            record[column] = _coerce_float(column, value)
+
+    missing = [column for column in REQUIRED_COLUMNS if record.get(column) is None]
+    if missing:
+        raise InvalidRecordError(f"Missing required values for {', '.join(missing)}.")
+
+    if complete:
+        for column in VITALS_TYPES:
+            if column != "record_id":
+                record.setdefault(column, None)
+    return record
@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+from src import alerts
+
+
+def reading(patient_id, minute, **vitals):
+    return {"patient_id": patient_id, "date": f"2023-01-01T10:{minute:02d}:00", **vitals}
+
+
+class ThresholdRuleTest(TestCase):
+    def setUp(self):
+        self.sink = alerts.InMemorySink()
+        self.engine = alerts.AlertEngine([alerts.ThresholdRule("hr", "heart_rate", low=40, high=130)], self.sink)
+
+    def test_breaches(self):
+        self.engine.process(reading(1, 0, heart_rate=80))
+        self.engine.process(reading(1, 1, heart_rate=131))
+        self.engine.process(reading(1, 2, heart_rate=39))
+        self.engine.process(reading(1, 3, heart_rate=None))
+
+        self.assertEqual([alert.value for alert in self.sink.alerts()], [131, 39])
+        self.assertEqual(self.sink.alerts()[0].message, "heart_rate 131 is above 130.")
+
+    def test_needs_a_bound(self):
+        with self.assertRaises(ValueError):
+            alerts.ThresholdRule("hr", "heart_rate")
+
+
+class RateOfChangeRuleTest(TestCase):
+    def test_change_within_window(self):
+        engine = alerts.AlertEngine(
+            [alerts.RateOfChangeRule("hr_change", "heart_rate", max_change=30, window_seconds=600)]
+        )
+
+        self.assertEqual(engine.process(reading(1, 0, heart_rate=70)), [])
+        self.assertEqual(engine.process(reading(1, 5, heart_rate=95)), [])
+        self.assertEqual(len(engine.process(reading(1, 9, heart_rate=101))), 1)
+        # The reading of minute 0 left the window, minute 5 is compared with instead.
+        self.assertEqual(engine.process(reading(1, 12, heart_rate=110)), [])
+        # Patients are tracked separately.
+        self.assertEqual(engine.process(reading(2, 12, heart_rate=40)), [])
+
+
+class ConsecutiveBreachRuleTest(TestCase):
+    def test_n_of_m(self):
+        low = alerts.ThresholdRule("low_spo2", "oxygen_saturation", low=94)
+        engine = alerts.AlertEngine([alerts.ConsecutiveBreachRule("sustained", low, n=3, m=5)])
+
+        fired = [
+            bool(engine.process(reading(1, minute, oxygen_saturation=value)))
+            for minute, value in enumerate([93, 97, 92, 98, 91, 96, 97, 93, 92])
+        ]
+
+        self.assertEqual(fired, [False, False, False, False, True, False, False, False, True])
+
+    def test_n_must_fit_m(self):
+        low = alerts.ThresholdRule("low_spo2", "oxygen_saturation", low=94)
+        with self.assertRaises(ValueError):
+            alerts.ConsecutiveBreachRule("sustained", low, n=4, m=3)
+
+
+class AlertEngineTest(TestCase):
+    def test_default_rules(self):
+        engine = alerts.AlertEngine()
+
+        raised = engine.process_batch([
+            reading(1, 0, heart_rate=80, respiratory_rate=16, oxygen_saturation=97, systolic=120, temperature=37),
+            reading(1, 1, heart_rate=135, respiratory_rate=30, oxygen_saturation=90, systolic=85, temperature=34),
+        ])
+
+        self.assertEqual(
+            [alert.rule for alert in raised],
+            ["heart_rate", "respiratory_rate", "oxygen_saturation", "systolic", "temperature", "heart_rate_change"]
+        )
+        self.assertEqual(len(engine.sink.alerts(patient_id=1)), 6)
+
+    def test_forget(self):
+        engine = alerts.AlertEngine(
+            [alerts.RateOfChangeRule("hr_change", "heart_rate", max_change=30, window_seconds=600)]
+        )
+        engine.process(reading(1, 0, heart_rate=70))
+        engine.forget(1)
+
+        self.assertEqual(engine.process(reading(1, 1, heart_rate=120)), [])
+
+    def test_sink_keeps_the_latest_alerts(self):
+        sink = alerts.InMemorySink(max_alerts=2)
+        engine = alerts.AlertEngine([alerts.ThresholdRule("hr", "heart_rate", high=100)], sink)
+        for minute in range(3):
+            engine.process(reading(1, minute, heart_rate=120 + minute))
+
+        self.assertEqual([alert.value for alert in sink.alerts()], [121, 122])
+        self.assertEqual(sink.emitted, 3)
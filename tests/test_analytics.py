@@ -0,0 +1,132 @@
+import math
+
+from unittest import TestCase
+
+from src import analytics, rollups
+from src.database import DatabaseManager
+from tests.test_rollups import VITALS_COLUMNS, make_rows
+
+
+def rows_with_spikes(count, seed=7):
+    rows = make_rows(count, seed)
+    for position in range(40, count, 37):
+        rows[position]["heart_rate"] = 250
+        rows[position]["temperature"] = 42.5
+    return rows
+
+
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+
+    def expected(self):
+        """The statistics and anomalies found by replaying the table one reading at a time."""
+
+        states = {}
+        anomalies = []
+        for row in self.db.select_record(table_name="vitals", order_by="record_id").fetchall():
+            record = dict(zip(VITALS_COLUMNS, row))
+            for vital in analytics.ANALYSED_VITALS:
+                value = record[vital]
+                state = states.setdefault((record["patient_id"], vital), [0, 0.0, 0.0, None])
+                if value is None:
+                    continue
+                count, mean, m2, ewma = state
+                if count >= analytics.MIN_READINGS and m2 > 0:
+                    zscore = (value - mean) / math.sqrt(m2 / (count - 1))
+                    if abs(zscore) >= analytics.ZSCORE_THRESHOLD:
+                        anomalies.append((record["record_id"], vital))
+                delta = value - mean
+                mean += delta / (count + 1)
+                m2 += delta * (value - mean)
+                ewma = value if ewma is None else ewma + analytics.EWMA_ALPHA * (value - ewma)
+                states[(record["patient_id"], vital)] = [count + 1, mean, m2, ewma]
+        return states, sorted(anomalies)
+
+    def assert_matches_replay(self):
+        states, anomalies = self.expected()
+        for (patient_id, vital), (count, mean, m2, ewma) in states.items():
+            trend = analytics.select_trends(self.db, patient_id)[vital]
+            self.assertEqual(trend.readings, count)
+            if count:
+                self.assertAlmostEqual(trend.mean, mean)
+                self.assertAlmostEqual(trend.ewma, ewma)
+            if count > 1:
+                self.assertAlmostEqual(trend.stddev, math.sqrt(m2 / (count - 1)))
+        stored = sorted(
+            (anomaly.record_id, anomaly.vital)
+            for patient_id in {key[0] for key in states}
+            for anomaly in analytics.select_anomalies(self.db, patient_id)
+        )
+        self.assertEqual(stored, anomalies)
+        return anomalies
+
+    def test_inserts_update_the_state(self):
+        analytics.create_analytics(self.db)
+        self.db.add_records(table_name="vitals", rows=rows_with_spikes(300), batch_size=50)
+        self.db.add_record(table_name="vitals", data={"patient_id": 4, "date": "2023-01-01T00:00:00"})
+
+        anomalies = self.assert_matches_replay()
+
+        self.assertIn("heart_rate", {vital for _, vital in anomalies})
+        self.assertEqual(analytics.select_trends(self.db, 4)["heart_rate"], analytics.VitalTrend(0, None, None, None))
+
+    def test_backfilled_on_creation(self):
+        self.db.add_records(table_name="vitals", rows=rows_with_spikes(300))
+        analytics.create_analytics(self.db)
+
+        self.assertTrue(self.assert_matches_replay())
+
+    def test_rebuild_matches_the_trigger(self):
+        analytics.create_analytics(self.db)
+        self.db.add_records(table_name="vitals", rows=rows_with_spikes(300))
+        incremental = analytics.select_trends(self.db, 1), analytics.select_anomalies(self.db, 1)
+
+        count = analytics.rebuild_analytics(self.db)
+        rebuilt = analytics.select_trends(self.db, 1), analytics.select_anomalies(self.db, 1)
+
+        self.assertEqual(count, len(self.expected()[1]))
+        self.assertEqual([anomaly[:5] for anomaly in rebuilt[1]], [anomaly[:5] for anomaly in incremental[1]])
+        for anomaly, expected in zip(rebuilt[1], incremental[1]):
+            self.assertAlmostEqual(anomaly.zscore, expected.zscore)
+        for vital, trend in incremental[0].items():
+            for value, expected in zip(rebuilt[0][vital], trend):
+                self.assertAlmostEqual(value, expected)
+
+    def test_anomalies_follow_deletes(self):
+        analytics.create_analytics(self.db)
+        self.db.add_records(table_name="vitals", rows=rows_with_spikes(300))
+        anomaly = analytics.select_anomalies(self.db, 1)[0]
+        before = analytics.select_trends(self.db, 1)
+
+        self.db.delete_record(table_name="vitals", criteria={"record_id": anomaly.record_id})
+
+        self.assertNotIn(anomaly, analytics.select_anomalies(self.db, 1))
+        self.assertEqual(analytics.select_trends(self.db, 1), before)
+        analytics.forget(self.db, 1)
+        self.assertEqual(analytics.select_trends(self.db, 1)["systolic"].readings, 0)
+
+    def test_paused_inserts_are_not_counted(self):
+        rollups.create_rollups(self.db)
+        analytics.create_analytics(self.db)
+        self.db.add_records(table_name="vitals", rows=make_rows(30))
+        before = analytics.select_trends(self.db, 1)
+
+        with rollups.paused(self.db, "vitals"):
+            self.db.add_record(table_name="vitals", data={"patient_id": 1, "date": "2023-01-01T00:00:00", "systolic": 300})
+
+        self.assertEqual(analytics.select_trends(self.db, 1), before)
+
+    def test_select_anomalies_in_range(self):
+        analytics.create_analytics(self.db)
+        self.db.add_records(table_name="vitals", rows=rows_with_spikes(300))
+        anomalies = analytics.select_anomalies(self.db, 1)
+
+        ranged = analytics.select_anomalies(self.db, 1, since=anomalies[0].date, until=anomalies[-1].date)
+
+        self.assertEqual([anomaly.date for anomaly in anomalies], sorted(anomaly.date for anomaly in anomalies))
+        self.assertEqual(ranged, [anomaly for anomaly in anomalies if anomaly.date < anomalies[-1].date])
+
+    def tearDown(self):
+        del self.db
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import tempfile
+import threading
+
+from unittest import IsolatedAsyncioTestCase
+
+from src.async_database import AsyncDatabaseManager
+from src.database import DatabaseManager
+
+
+class AsyncDatabaseManagerTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "test.db"))
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer"}
+        )
+        self.async_db = AsyncDatabaseManager(self.db, reader_threads=2)
+
+    async def test_add_and_select(self):
+        await asyncio.gather(
+            *(self.async_db.add_record(table_name="test_table", data={"key_one": i}) for i in range(100))
+        )
+        await self.async_db.add_records(table_name="test_table", rows=[{"key_one": 100}])
+
+        rows = await self.async_db.select_record(table_name="test_table", order_by="key_one")
+        self.assertEqual([row[1] for row in rows], list(range(101)))
+
+    async def test_delete(self):
+        await self.async_db.add_record(table_name="test_table", data={"key_one": 1})
+        await self.async_db.delete_record(table_name="test_table", criteria={"key_one": 1})
+
+        self.assertEqual(await self.async_db.select_record(table_name="test_table"), [])
+
+    async def test_calls_run_off_the_event_loop(self):
+        loop_thread = threading.current_thread()
+
+        write_thread = await self.async_db.run_write(threading.current_thread)
+        read_thread = await self.async_db.run_read(threading.current_thread)
+
+        self.assertIsNot(write_thread, loop_thread)
+        self.assertIsNot(read_thread, loop_thread)
+        self.assertTrue(write_thread.name.startswith("db-writer"))
+        self.assertTrue(read_thread.name.startswith("db-reader"))
+
+    def tearDown(self):
+        self.async_db.close()
+        del self.async_db
+        del self.db
+        self.directory.cleanup()
@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+from src.cache import QueryCache, TableVersions
+
+
+class TableVersionsTest(TestCase):
+    def test_bump_patient(self):
+        versions = TableVersions()
+        before = versions.patient(1), versions.patient(2), versions.table()
+
+        versions.bump("1")
+
+        self.assertNotEqual(versions.patient(1), before[0])
+        self.assertEqual(versions.patient(2), before[1])
+        self.assertNotEqual(versions.table(), before[2])
+
+    def test_bump_all_patients(self):
+        versions = TableVersions()
+        before = versions.patient(1)
+
+        versions.bump()
+
+        self.assertNotEqual(versions.patient(1), before)
+
+
+class QueryCacheTest(TestCase):
+    def test_get_loads_once_per_version(self):
+        cache = QueryCache()
+        loads = []
+
+        def load():
+            loads.append(1)
+            return len(loads)
+
+        self.assertEqual(cache.get("key", 1, load), 1)
+        self.assertEqual(cache.get("key", 1, load), 1)
+        self.assertEqual(cache.get("key", 2, load), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = QueryCache(max_entries=2)
+        cache.get("one", 0, lambda: 1)
+        cache.get("two", 0, lambda: 2)
+        cache.get("one", 0, lambda: 1)
+        cache.get("three", 0, lambda: 3)
+
+        self.assertEqual(cache.get("two", 0, lambda: "reloaded"), "reloaded")
+        self.assertEqual(cache.get("three", 0, lambda: "reloaded"), 3)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from src import columnar
+from src.database import DatabaseManager
+from tests.test_rollups import VITALS_COLUMNS
+
+
+class VitalsDataFrameTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        self.db.add_records(
+            table_name="vitals",
+            rows=[
+                {"patient_id": 1, "date": "2023-01-01T00:00:02", "heart_rate": 70, "temperature": None},
+                {"patient_id": 2, "date": "2023-01-01T00:00:01", "heart_rate": 90, "temperature": 37.5},
+                {"patient_id": 1, "date": "2023-01-01T00:00:00", "heart_rate": None, "temperature": 36.5},
+            ]
+        )
+
+    def test_vitals_columns(self):
+        arrays = columnar.vitals_columns(self.db, criteria={"patient_id": 1}, columns=("record_id", "heart_rate"))
+
+        self.assertEqual(list(arrays), ["record_id", "heart_rate"])
+        self.assertEqual(arrays["record_id"].tolist(), [3, 1])
+        self.assertEqual(arrays["heart_rate"].dtype.name, "float32")
+
+    def test_vitals_dataframe(self):
+        df = columnar.vitals_dataframe(self.db)
+
+        self.assertEqual(list(df.columns), list(columnar.VITALS_DTYPES))
+        self.assertEqual(str(df["date"].dtype), "datetime64[ms]")
+        self.assertEqual(df["record_id"].tolist(), [3, 2, 1])
+        self.assertEqual(str(df["date"].iloc[0]), "2023-01-01 00:00:00")
+        self.assertEqual(df["temperature"].isna().tolist(), [False, False, True])
+
+    def tearDown(self):
+        del self.db
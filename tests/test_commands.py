@@ -1,7 +1,45 @@
-from unittest import TestCase
-from unittest.mock import patch
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
 
-from src.commands import CreateVitalSignsTableCommand, AddRecordCommand
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import MagicMock, patch
+
+from src.commands import (
+    ArchiveRecordsCommand,
+    CreateVitalSignsTableCommand,
+    AddRecordCommand,
+    BulkAddRecordsCommand,
+    ConfigureProfilingCommand,
+    DeletePatientRecordsCommand,
+    DeleteRecordCommand,
+    DeleteRecordsCommand,
+    ExportRecordsCommand,
+    GetLatestVitalsCommand,
+    GetPatientAggregatesCommand,
+    GetPatientAnomaliesCommand,
+    GetPatientRecordsCommand,
+    GetPatientRecordsInRangeCommand,
+    GetPatientRecordsPageCommand,
+    GetPatientTrendsCommand,
+    GetPatientVitalsDownsampledCommand,
+    GetQueryStatsCommand,
+    GetSlowQueriesCommand,
+    ListRecordsCommand,
+    ImportRecordsCommand,
+    ListRecordsPageCommand,
+    QuitCommand,
+    RebuildAnalyticsCommand,
+    RehydrateRecordsCommand,
+    ResetQueryStatsCommand,
+    bucket_seconds_for,
+    refresh_snapshot,
+)
+from src import alerts, ingest
+from src.database import DatabaseManager
 
 
 class CreateTableCommandTest(TestCase):
@@ -9,7 +47,13 @@ class CreateTableCommandTest(TestCase):
         self.command = CreateVitalSignsTableCommand()
 
     def test_execute(self):
-        with patch("src.commands.DatabaseManager.create_table") as mocked_create_table:
+        with patch("src.commands.DatabaseManager.create_table") as mocked_create_table, \
+                patch("src.commands.DatabaseManager.create_index") as mocked_create_index, \
+                patch("src.commands.rollups.create_rollups") as mocked_create_rollups, \
+                patch("src.commands.latest.create_latest") as mocked_create_latest, \
+                patch("src.commands.analytics.create_analytics") as mocked_create_analytics, \
+                patch("src.commands.migrations.migrate") as mocked_migrate, \
+                patch("src.commands.retention.enable_incremental_vacuum"):
             self.command.execute()
             mocked_create_table.assert_called_with(
                 table_name="vitals",
@@ -18,12 +62,24 @@ class CreateTableCommandTest(TestCase):
                     'patient_id': 'INTEGER NOT NULL',
                     'date': 'TEXT NOT NULL',
                     'heart_rate': 'INTEGER',
-                    'blood_pressure': 'TEXT',
+                    'systolic': 'INTEGER',
+                    'diastolic': 'INTEGER',
                     'respiratory_rate': 'INTEGER',
                     'oxygen_saturation': 'REAL',
-                    'temperature': 'REAL'
+                    'temperature': 'REAL',
+                    'news2': 'INTEGER'
                 }
             )
+            mocked_create_index.assert_any_call(
+                index_name="idx_vitals_patient_date", table_name="vitals", columns=("patient_id", "date")
+            )
+            mocked_create_index.assert_any_call(
+                index_name="idx_vitals_date", table_name="vitals", columns=("date",)
+            )
+            mocked_create_rollups.assert_called_once()
+            mocked_create_latest.assert_called_once()
+            mocked_create_analytics.assert_called_once()
+            mocked_migrate.assert_called_once()
 
 
 class AddRecordCommandTest(TestCase):
@@ -33,17 +89,470 @@ class AddRecordCommandTest(TestCase):
     def test_execute(self):
         with patch("src.commands.DatabaseManager.add_record") as mocked_add_record:
             data = {
-                "patient_id": "mock_patient_id",
-                "heart_rate": "mock_heart_rate",
-                "blood_pressure": "mock_blood_pressure",
-                "respiratory_rate": "mock_respiratory_rate",
-                "oxygen_saturation": "mock_oxygen_saturation",
-                "temperature": "mock_temperature",
+                "patient_id": "7",
+                "heart_rate": "72",
+                "blood_pressure": "120/80",
+                "respiratory_rate": "16",
+                "oxygen_saturation": "97.5",
+                "temperature": "",
+                "date": "2023-05-01T10:00:00",
             }
             result = self.command.execute(data)
             mocked_add_record.assert_called_with(
                 table_name="vitals",
-                data=data
+                data={
+                    "patient_id": 7,
+                    "heart_rate": 72,
+                    "systolic": 120,
+                    "diastolic": 80,
+                    "respiratory_rate": 16,
+                    "oxygen_saturation": 97.5,
+                    "temperature": None,
+                    "date": "2023-05-01T10:00:00",
+                    "news2": 0,
+                }
             )
-            expected_result = f"Vital signs successfully recorded for patient {data['patient_id']}."
+            expected_result = f"Vital signs successfully recorded for patient 7."
             self.assertEqual(result, expected_result)
+
+    def test_execute_scores_record(self):
+        with patch("src.commands.DatabaseManager.add_record") as mocked_add_record:
+            self.command.execute({"patient_id": 7, "heart_rate": 125, "respiratory_rate": 26, "temperature": 38.5})
+
+            self.assertEqual(mocked_add_record.call_args.kwargs["data"]["news2"], 6)
+
+    def test_execute_raises_alerts(self):
+        with patch("src.commands.DatabaseManager.add_record"), \
+                patch("src.commands.alert_engine", alerts.AlertEngine()):
+            self.command.execute({"patient_id": 7, "heart_rate": 150, "date": "2023-05-01T10:00:00"})
+
+        self.assertEqual([alert.rule for alert in self.command.alerts], ["heart_rate"])
+
+    def test_execute_invalid_record(self):
+        with patch("src.commands.DatabaseManager.add_record") as mocked_add_record:
+            with self.assertRaises(ValueError):
+                self.command.execute({"patient_id": "7", "heart_rate": "fast"})
+
+            mocked_add_record.assert_not_called()
+
+    def test_execute_through_buffer(self):
+        buffer = MagicMock(durability=ingest.BOUNDED_LOSS)
+        with patch("src.commands.DatabaseManager.add_record") as mocked_add_record:
+            result = AddRecordCommand(buffer=buffer).execute({"patient_id": 4})
+
+            buffer.add.assert_called_once()
+            self.assertEqual(buffer.add.call_args.args[0]["patient_id"], 4)
+            mocked_add_record.assert_not_called()
+            self.assertEqual(result, "Vital signs queued for patient 4.")
+
+
+class QuitCommandTest(TestCase):
+    def test_execute_flushes_buffers(self):
+        with patch("src.commands.ingest.close_all") as mocked_close_all:
+            with self.assertRaises(SystemExit):
+                QuitCommand().execute()
+
+            mocked_close_all.assert_called_once()
+
+
+class BulkAddRecordsCommandTest(TestCase):
+    def setUp(self):
+        self.command = BulkAddRecordsCommand(batch_size=10)
+
+    def test_execute(self):
+        with patch("src.commands.DatabaseManager.add_records", return_value=2) as mocked_add_records:
+            data = [
+                {"patient_id": 1, "heart_rate": 70},
+                {"patient_id": 2, "heart_rate": 80, "date": "2023-05-01T10:00:00"},
+            ]
+            result = self.command.execute(data)
+
+            kwargs = mocked_add_records.call_args.kwargs
+            self.assertEqual(kwargs["table_name"], "vitals")
+            self.assertEqual(kwargs["batch_size"], 10)
+            rows = list(kwargs["rows"])
+            self.assertTrue(all("date" in row for row in rows))
+            self.assertEqual(rows[1]["date"], "2023-05-01T10:00:00")
+            self.assertEqual([row["news2"] for row in rows], [0, 0])
+            self.assertEqual(result, "2 vital signs records successfully recorded.")
+
+    def test_alerts_follow_the_commit(self):
+        data = [{"patient_id": 1, "heart_rate": 150, "date": f"2023-05-01T10:0{i}:00"} for i in range(3)]
+        with patch("src.commands.DatabaseManager.add_records", side_effect=[2, sqlite3.OperationalError]), \
+                patch("src.commands.alert_engine", alerts.AlertEngine()):
+            command = BulkAddRecordsCommand(batch_size=2)
+            with self.assertRaises(sqlite3.OperationalError):
+                command.execute(data)
+
+        # The third reading was not recorded, so it raised no alert.
+        self.assertEqual([alert.date for alert in command.alerts], ["2023-05-01T10:00:00", "2023-05-01T10:01:00"])
+
+
+class GetPatientRecordsInRangeCommandTest(TestCase):
+    def setUp(self):
+        self.command = GetPatientRecordsInRangeCommand(since="2023-01-01", until="2023-02-01")
+
+    def test_execute(self):
+        with patch("src.commands.DatabaseManager.select_record") as mocked_select_record:
+            mocked_select_record.return_value.fetchall.return_value = [(1, 7, "2023-01-15")]
+            result = self.command.execute(7)
+
+            mocked_select_record.assert_called_once_with(
+                table_name="vitals",
+                criteria={"patient_id": 7},
+                order_by="date",
+                since="2023-01-01",
+                until="2023-02-01"
+            )
+            self.assertEqual(result, [(1, 7, "2023-01-15")])
+
+
+class RecordsPageCommandTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute(
+                [{"patient_id": i % 2, "date": f"2023-01-01T00:00:{i:02d}"} for i in range(5)]
+            )
+
+    def test_list_records_pages(self):
+        with patch("src.commands.db", self.db):
+            first = ListRecordsPageCommand(page_size=2).execute()
+            second = ListRecordsPageCommand(page_size=2, after=first.next_after).execute()
+            third = ListRecordsPageCommand(page_size=2, after=second.next_after).execute()
+
+        self.assertEqual([record[0] for record in first.records], [1, 2])
+        self.assertEqual(first.next_after, ("2023-01-01T00:00:01", 2))
+        self.assertEqual([record[0] for record in second.records], [3, 4])
+        self.assertEqual([record[0] for record in third.records], [5])
+        self.assertIsNone(third.next_after)
+
+    def test_patient_records_pages(self):
+        with patch("src.commands.db", self.db):
+            first = GetPatientRecordsPageCommand(page_size=2).execute(0)
+            second = GetPatientRecordsPageCommand(page_size=2, after=first.next_after).execute(0)
+
+        self.assertEqual([record[0] for record in first.records], [1, 3])
+        self.assertEqual([record[0] for record in second.records], [5])
+        self.assertIsNone(second.next_after)
+
+    def test_patient_records_pages_in_range(self):
+        with patch("src.commands.db", self.db):
+            page = GetPatientRecordsPageCommand(
+                page_size=1, since="2023-01-01T00:00:02", until="2023-01-01T00:00:04"
+            ).execute(0)
+            last = GetPatientRecordsPageCommand(
+                page_size=1, after=page.next_after, since="2023-01-01T00:00:02", until="2023-01-01T00:00:04"
+            ).execute(0)
+
+        self.assertEqual([record[0] for record in page.records], [3])
+        self.assertEqual(last.records, [])
+        self.assertIsNone(last.next_after)
+
+    def tearDown(self):
+        del self.db
+
+
+class AsyncCommandsTest(IsolatedAsyncioTestCase):
+    async def test_add_record_execute_async(self):
+        with patch("src.commands.DatabaseManager.add_record") as mocked_add_record:
+            data = {"patient_id": 3, "heart_rate": 72}
+            result = await AddRecordCommand().execute_async(data)
+
+            mocked_add_record.assert_called_with(table_name="vitals", data={**data, "news2": 0})
+            self.assertEqual(result, "Vital signs successfully recorded for patient 3.")
+
+    async def test_get_patient_records_execute_async(self):
+        with patch("src.commands.DatabaseManager.select_record") as mocked_select_record:
+            mocked_select_record.return_value.fetchall.return_value = [(1, 3)]
+            result = await GetPatientRecordsCommand().execute_async(3)
+
+            mocked_select_record.assert_called_with(table_name="vitals", criteria={"patient_id": 3})
+            self.assertEqual(result, [(1, 3)])
+
+
+class VersionBumpTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute([{"patient_id": 1}, {"patient_id": 2}])
+
+    def test_write_commands_bump_only_their_patient(self):
+        with patch("src.commands.db", self.db), patch("src.commands.versions") as mocked_versions:
+            AddRecordCommand().execute({"patient_id": 1})
+            DeleteRecordCommand().execute(2)
+            DeletePatientRecordsCommand().execute(1)
+            BulkAddRecordsCommand().execute([{"patient_id": 3}, {"patient_id": 3}])
+
+        self.assertEqual(
+            [call.args for call in mocked_versions.bump.call_args_list],
+            [(1,), (2,), (1,), (3,)]
+        )
+
+    def tearDown(self):
+        del self.db
+
+
+class DownsamplingTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute(
+                [
+                    {"patient_id": 1, "date": f"2023-01-01T{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}", "heart_rate": 60 + second % 7}
+                    for second in range(0, 86400, 10)
+                ]
+            )
+
+    def test_bucket_seconds_for(self):
+        self.assertEqual(bucket_seconds_for("2023-01-01T00:00:00", "2023-01-01T00:00:00", 100), 1)
+        self.assertEqual(bucket_seconds_for("2023-01-01T00:00:00", "2023-01-02T00:00:00", 97), 901)
+
+    def test_execute_caps_points(self):
+        with patch("src.commands.db", self.db):
+            rows = GetPatientVitalsDownsampledCommand(target_points=100).execute(1)
+
+        self.assertLessEqual(len(rows), 100)
+        self.assertEqual(sum(row[1] for row in rows), 8640)
+        self.assertEqual((min(row[2] for row in rows), max(row[4] for row in rows)), (60, 66))
+
+    def test_execute_in_range(self):
+        with patch("src.commands.db", self.db):
+            rows = GetPatientVitalsDownsampledCommand(
+                target_points=10, since="2023-01-01T01:00:00", until="2023-01-01T02:00:00"
+            ).execute(1)
+
+        self.assertLessEqual(len(rows), 10)
+        self.assertEqual(sum(row[1] for row in rows), 360)
+
+    def test_execute_unknown_patient(self):
+        with patch("src.commands.db", self.db):
+            self.assertEqual(GetPatientVitalsDownsampledCommand().execute(2), [])
+
+    def tearDown(self):
+        del self.db
+
+
+class GetPatientAggregatesCommandTest(TestCase):
+    def test_execute(self):
+        with patch("src.commands.rollups.select_aggregates", return_value=[]) as mocked_select_aggregates:
+            result = GetPatientAggregatesCommand(granularity="day", since="2023-01-01").execute(5)
+
+            mocked_select_aggregates.assert_called_once()
+            kwargs = mocked_select_aggregates.call_args.kwargs
+            self.assertEqual(
+                (kwargs["patient_id"], kwargs["granularity"], kwargs["since"], kwargs["until"]),
+                (5, "day", "2023-01-01", None)
+            )
+            self.assertEqual(result, [])
+
+
+class ArchiveCommandsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.directory = tempfile.TemporaryDirectory()
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute([
+                {"patient_id": 1, "date": "2020-01-01T10:00:00", "heart_rate": 70},
+                {"patient_id": 1, "heart_rate": 80},
+            ])
+
+    def test_archive_and_rehydrate(self):
+        with patch("src.commands.db", self.db), \
+                patch("src.commands.ARCHIVE_DIRECTORY", self.directory.name):
+            archived = ArchiveRecordsCommand(retain_days=30).execute()
+            remaining = GetPatientRecordsCommand().execute(1)
+            restored = RehydrateRecordsCommand().execute(("2020-01-01", "2020-01-02"))
+            aggregates = GetPatientAggregatesCommand(granularity="day").execute(1)
+            restored_records = GetPatientRecordsCommand().execute(1)
+
+        self.assertTrue(archived.startswith("1 records older than 30 days archived in 1 files"))
+        self.assertEqual([record[3] for record in remaining], [80])
+        self.assertEqual(restored, "1 archived records restored.")
+        self.assertEqual(len(restored_records), 2)
+        self.assertEqual(sum(aggregate.readings for aggregate in aggregates), 2)
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
+
+
+class DeleteCommandsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute([
+                {"patient_id": 1 + i % 2, "date": f"2023-01-01T{i:02d}:30:00", "heart_rate": 60 + i} for i in range(10)
+            ])
+
+    def counts(self, patient_id):
+        records = GetPatientRecordsCommand().execute(patient_id)
+        aggregates = GetPatientAggregatesCommand(granularity="hour").execute(patient_id)
+        return len(records), sum(aggregate.readings for aggregate in aggregates)
+
+    def test_delete_patient_in_chunks(self):
+        with patch("src.commands.db", self.db):
+            result = DeletePatientRecordsCommand(chunk_size=2).execute(1)
+            counts = self.counts(1), self.counts(2)
+
+        self.assertEqual(result, "All records deleted for patient 1.")
+        self.assertEqual(counts, ((0, 0), (5, 5)))
+
+    def test_delete_records(self):
+        with patch("src.commands.db", self.db), patch("src.commands.versions") as mocked_versions:
+            result = DeleteRecordsCommand(batch_size=2).execute([1, 2, 4, 100])
+            counts = self.counts(1), self.counts(2)
+
+        self.assertEqual(result, "3 records deleted.")
+        self.assertEqual(counts, ((4, 4), (3, 3)))
+        self.assertEqual(sorted(call.args for call in mocked_versions.bump.call_args_list), [(1,), (2,)])
+
+    def test_latest_vitals_follow_deletes(self):
+        with patch("src.commands.db", self.db):
+            DeleteRecordCommand().execute(10)
+            after_record = GetLatestVitalsCommand().execute()
+            DeletePatientRecordsCommand(chunk_size=2).execute(1)
+            after_patient = GetLatestVitalsCommand().execute()
+
+        self.assertEqual([(row[1], row[2]) for row in after_record], [(1, "2023-01-01T08:30:00"), (2, "2023-01-01T07:30:00")])
+        self.assertEqual([row[1] for row in after_patient], [2])
+
+    def tearDown(self):
+        del self.db
+
+
+class AnalyticsCommandsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute([
+                {"patient_id": 1, "date": f"2023-01-01T{i:02d}:00:00", "heart_rate": 70 + i % 3} for i in range(12)
+            ])
+
+    def test_added_records_are_flagged(self):
+        with patch("src.commands.db", self.db):
+            AddRecordCommand().execute({"patient_id": 1, "date": "2023-01-01T12:00:00", "heart_rate": 140})
+            anomalies = GetPatientAnomaliesCommand(since="2023-01-01T12:00:00").execute(1)
+            trends = GetPatientTrendsCommand().execute(1)
+            result = RebuildAnalyticsCommand().execute()
+            rebuilt = GetPatientAnomaliesCommand().execute(1)
+
+        self.assertEqual([(anomaly.vital, anomaly.value) for anomaly in anomalies], [("heart_rate", 140)])
+        self.assertGreater(anomalies[0].zscore, 3)
+        self.assertEqual(trends["heart_rate"].readings, 13)
+        self.assertGreater(trends["heart_rate"].ewma, trends["heart_rate"].mean)
+        self.assertEqual(result, "Trends rebuilt, 1 anomalies found.")
+        self.assertEqual(rebuilt[0][:5], anomalies[0][:5])
+
+    def test_deleting_a_patient_forgets_the_trends(self):
+        with patch("src.commands.db", self.db):
+            DeletePatientRecordsCommand().execute(1)
+            trends = GetPatientTrendsCommand().execute(1)
+
+        self.assertEqual(trends["heart_rate"].readings, 0)
+
+    def tearDown(self):
+        del self.db
+
+
+class TransferCommandsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.directory = tempfile.TemporaryDirectory()
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            BulkAddRecordsCommand().execute([
+                {"patient_id": 1, "date": "2023-01-01T10:00:00", "heart_rate": 70, "blood_pressure": "120/80"},
+                {"patient_id": 2, "date": "2023-01-01T11:00:00", "heart_rate": 140},
+            ])
+
+    def test_export_and_import(self):
+        path = os.path.join(self.directory.name, "vitals.csv")
+        with patch("src.commands.db", self.db):
+            exported = ExportRecordsCommand(patient_id=1).execute(path)
+            with open(path, "a") as file:
+                file.write(",3,,not a number,,,,,,,,\n")
+            imported = ImportRecordsCommand().execute(path)
+            records = GetPatientRecordsCommand().execute(1)
+
+        self.assertTrue(exported.startswith(f"1 records exported to {path}"))
+        self.assertTrue(imported.startswith(f"1 records imported from {path}"))
+        self.assertIn("1 invalid records skipped", imported)
+        self.assertEqual([record[1:] for record in records[1:]], [record[1:] for record in records[:1]])
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
+
+
+class DiagnosticsCommandsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+
+    def test_full_scans_are_reported_with_their_command(self):
+        with patch("src.commands.db", self.db):
+            ConfigureProfilingCommand(slow_seconds=None, explain_seconds=0).execute()
+            GetPatientRecordsCommand().execute(1)
+            ListRecordsCommand().execute()
+            ListRecordsCommand(order_by="heart_rate").execute()
+            full_scans = GetQueryStatsCommand(full_scans_only=True).execute()
+            slow_queries = GetSlowQueriesCommand().execute()
+            reset = ResetQueryStatsCommand().execute()
+            remaining = GetQueryStatsCommand().execute()
+
+        self.assertEqual([stat.callers for stat in full_scans], [["ListRecordsCommand.execute"]])
+        self.assertEqual(slow_queries, [])
+        self.assertEqual(reset, "Query statistics cleared.")
+        self.assertEqual(remaining, [])
+
+
+class SnapshotReadsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "vitals.db"))
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+            AddRecordCommand().execute({"patient_id": 1, "date": "2023-01-01T10:00:00"})
+
+    def test_reads_tolerating_staleness_use_the_snapshot(self):
+        with patch("src.commands.db", self.db), patch("src.commands.snapshot_refresh_seconds", None):
+            self.assertEqual(refresh_snapshot(), 1)
+            AddRecordCommand().execute({"patient_id": 1, "date": "2023-01-01T11:00:00"})
+
+            stale = (
+                ListRecordsCommand(max_staleness=60).execute(),
+                ListRecordsPageCommand(max_staleness=60).execute().records,
+                GetPatientRecordsCommand(max_staleness=60).execute(1),
+                GetPatientRecordsInRangeCommand(since="2023-01-01", max_staleness=60).execute(1),
+            )
+            fresh = ListRecordsCommand().execute(), GetPatientRecordsCommand(max_staleness=0).execute(1)
+
+        self.assertEqual([len(records) for records in stale], [1, 1, 1, 1])
+        self.assertEqual([len(records) for records in fresh], [2, 2])
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
+
+
+class LazyImportTest(TestCase):
+    def test_importing_commands_opens_nothing(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run(
+                [sys.executable, "-c", "import json, sys, src.commands; print(json.dumps(sorted(sys.modules)))"],
+                cwd=directory, env={**os.environ, "PYTHONPATH": root}, check=True, capture_output=True, text=True
+            ).stdout
+            created = os.listdir(directory)
+
+        modules = set(json.loads(output))
+        self.assertEqual(created, [])
+        self.assertFalse(modules & {"asyncio", "pandas", "numpy", "streamlit"})
@@ -1,10 +1,14 @@
+import math
+import os
 import sqlite3 
+import tempfile
+import threading
 
 from unittest import TestCase
 from unittest.mock import patch
 from textwrap import dedent
 
-from src.database import DatabaseManager
+from src.database import DatabaseManager, EPOCH_MS, StatementCache, STATEMENT_CACHE_SIZE
 
 class CreateTableTest(TestCase):
     def setUp(self):
@@ -45,6 +49,39 @@ class CreateTableTest(TestCase):
     def tearDown(self):
         del self.db
 
+class CreateIndexTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+
+    def test_create_index(self):
+        with patch("src.database.DatabaseManager._execute") as mock_execute:
+            self.db.create_index(
+                index_name="idx_test", table_name="test_table", columns=("key_one", "key_two")
+            )
+            mock_execute.assert_called_with(
+                "CREATE INDEX IF NOT EXISTS idx_test ON test_table (key_one, key_two);"
+            )
+
+    def test_range_query_uses_index(self):
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer", "date": "text"}
+        )
+        self.db.create_index(
+            index_name="idx_test", table_name="test_table", columns=("key_one", "date")
+        )
+        plan = self.db._execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM test_table WHERE key_one = ? AND date >= ? ORDER BY date;",
+            (1, "2023-01-01")
+        ).fetchall()
+
+        details = " ".join(row[-1] for row in plan)
+        self.assertIn("INDEX idx_test", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+    def tearDown(self):
+        del self.db
+
 class DropTableTest(TestCase):
     def setUp(self):
         self.db = DatabaseManager(":memory:")
@@ -89,6 +126,64 @@ class AddRecordTest(TestCase):
     def tearDown(self):
         del self.db
 
+class AddRecordsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(
+            table_name="test_table",
+            columns={
+                "id": "integer primary key autoincrement",
+                "key_one": "text",
+                "key_two": "integer"
+            }
+        )
+
+    def test_add_records(self):
+        rows = [{"key_one": f"value_{i}", "key_two": i} for i in range(7)]
+
+        inserted = self.db.add_records(table_name="test_table", rows=rows, batch_size=3)
+
+        self.assertEqual(inserted, 7)
+        self.assertEqual(
+            self.db.select_record(table_name="test_table", order_by="id").fetchall(),
+            [(i + 1, f"value_{i}", i) for i in range(7)]
+        )
+
+    def test_add_records_one_transaction_per_batch(self):
+        rows = ({"key_one": "value", "key_two": i} for i in range(5))
+
+        with patch("src.database.DatabaseManager._executemany") as mock_executemany:
+            self.db.add_records(table_name="test_table", rows=rows, batch_size=2)
+
+        self.assertEqual(mock_executemany.call_count, 3)
+
+    def test_add_records_empty(self):
+        self.assertEqual(self.db.add_records(table_name="test_table", rows=[]), 0)
+
+    def test_add_records_mismatched_columns(self):
+        rows = [{"key_one": "value", "key_two": 1}, {"key_one": "value"}]
+
+        with self.assertRaises(ValueError):
+            self.db.add_records(table_name="test_table", rows=rows)
+
+        self.assertEqual(self.db.select_record(table_name="test_table").fetchall(), [])
+
+    def test_update_records(self):
+        self.db.add_records(table_name="test_table", rows=[{"key_one": "value", "key_two": i} for i in range(5)])
+
+        updated = self.db.update_records(
+            table_name="test_table", columns=("key_one",), rows=[("a", 2), ("b", 4)], key_column="id", batch_size=1
+        )
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            [row[1] for row in self.db.select_record(table_name="test_table", order_by="id").fetchall()],
+            ["value", "a", "value", "b", "value"]
+        )
+
+    def tearDown(self):
+        del self.db
+
 class SelectRecordTest(TestCase):
     def setUp(self):
         self.db = DatabaseManager(":memory:")
@@ -133,6 +228,65 @@ class SelectRecordTest(TestCase):
                 ("value_one", 42, 3.14)
             )
 
+    def test_select_record_in_range(self):
+        with patch("src.database.DatabaseManager._execute") as mock_execute:
+            self.db.select_record(
+                table_name="test_table",
+                criteria={"key_one": "value_one"},
+                order_by="date",
+                since="2023-01-01",
+                until="2023-02-01"
+            )
+            mock_execute.assert_called_once_with(
+                "SELECT * FROM test_table WHERE key_one = ? AND date >= ? AND date < ? ORDER BY date;",
+                ("value_one", "2023-01-01", "2023-02-01")
+            )
+
+    def test_select_record_since_only(self):
+        with patch("src.database.DatabaseManager._execute") as mock_execute:
+            self.db.select_record(
+                table_name="test_table",
+                since="2023-01-01",
+                range_column="created"
+            )
+            mock_execute.assert_called_once_with(
+                "SELECT * FROM test_table WHERE created >= ?;",
+                ("2023-01-01",)
+            )
+
+    def test_select_record_first_page(self):
+        with patch("src.database.DatabaseManager._execute") as mock_execute:
+            self.db.select_record(
+                table_name="test_table",
+                order_by="date",
+                limit=10,
+                key_column="id"
+            )
+            mock_execute.assert_called_once_with(
+                "SELECT * FROM test_table ORDER BY date, id LIMIT ?;",
+                (10,)
+            )
+
+    def test_select_record_next_page_desc(self):
+        with patch("src.database.DatabaseManager._execute") as mock_execute:
+            self.db.select_record(
+                table_name="test_table",
+                criteria={"key_one": "value_one"},
+                order_by="date",
+                ordered_desc=True,
+                limit=10,
+                after=("2023-01-01", 5),
+                key_column="id"
+            )
+            mock_execute.assert_called_once_with(
+                "SELECT * FROM test_table WHERE key_one = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?;",
+                ("value_one", "2023-01-01", 5, 10)
+            )
+
+    def test_select_record_after_wrong_keyset(self):
+        with self.assertRaises(ValueError):
+            self.db.select_record(table_name="test_table", order_by="date", after=(5,), key_column="id")
+
     def tearDown(self):
         del self.db
 
@@ -172,3 +326,389 @@ class SelectRecordTest(TestCase):
         def tearDown(self) -> None:
             del self.db
 
+class DeleteInChunksTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "patient_id": "integer", "date": "text"}
+        )
+        self.db.create_index("idx_patient", "test_table", ["patient_id"])
+        self.db.add_records(
+            table_name="test_table",
+            rows=[{"patient_id": i % 3, "date": f"2023-01-01T00:00:{i:02d}"} for i in range(50)]
+        )
+
+    def remaining(self):
+        return [row[0] for row in self.db.select_record(table_name="test_table", order_by="id").fetchall()]
+
+    def test_delete_in_chunks(self):
+        with patch.object(self.db, "transaction", wraps=self.db.transaction) as mocked_transaction:
+            deleted = self.db.delete_in_chunks(table_name="test_table", criteria={"patient_id": 1}, chunk_size=4)
+
+        self.assertEqual(deleted, 17)
+        self.assertEqual(self.remaining(), [id_ for id_ in range(1, 51) if (id_ - 1) % 3 != 1])
+        mocked_transaction.assert_not_called()
+        self.assertIn("idx_patient", " ".join(self.db.explain(
+            self.db.statement_cache.get(("delete_chunk", "test_table", ("patient_id",), ("rowid",)), str)
+        )))
+
+    def test_delete_records(self):
+        deleted = self.db.delete_records(
+            table_name="test_table", keys=[3, 4, 5, 100], key_column="id", returning=("id", "patient_id"), batch_size=2
+        )
+
+        self.assertEqual(sorted(deleted), [(3, 2), (4, 0), (5, 1)])
+        self.assertEqual(len(self.remaining()), 47)
+        self.assertEqual(self.db.delete_records(table_name="test_table", keys=[], key_column="id"), [])
+
+    def test_batch_size_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            self.db.delete_in_chunks(table_name="test_table", criteria={"patient_id": 1}, chunk_size=0)
+        with self.assertRaises(ValueError):
+            self.db.delete_records(table_name="test_table", keys=[1], batch_size=0)
+
+    def tearDown(self):
+        del self.db
+
+
+class IterRecordsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "date": "text"}
+        )
+        # Duplicate dates make sure the id tie-breaker keeps pages from skipping rows.
+        self.db.add_records(
+            table_name="test_table",
+            rows=[{"id": i, "date": f"2023-01-{10 - i // 3:02d}"} for i in range(1, 11)]
+        )
+
+    def test_iter_records_by_key(self):
+        rows = list(self.db.iter_records(table_name="test_table", batch_size=3, key_column="id"))
+        self.assertEqual([row[0] for row in rows], list(range(1, 11)))
+
+    def test_iter_records_ordered(self):
+        expected = self.db.select_record(table_name="test_table", order_by="date, id").fetchall()
+
+        with patch.object(self.db, "select_record", wraps=self.db.select_record) as spy:
+            rows = list(
+                self.db.iter_records(table_name="test_table", order_by="date", batch_size=3, key_column="id")
+            )
+
+        self.assertEqual(rows, expected)
+        self.assertEqual(spy.call_count, 4)
+        for call in spy.call_args_list:
+            self.assertEqual(call.kwargs["limit"], 3)
+
+    def test_iter_records_missing_key_column(self):
+        with self.assertRaises(ValueError):
+            list(self.db.iter_records(table_name="test_table"))
+
+    def tearDown(self):
+        del self.db
+
+class StatementCacheTest(TestCase):
+    def test_get_builds_once(self):
+        cache = StatementCache(maxsize=2)
+        builds = []
+
+        def build():
+            builds.append(1)
+            return "SELECT 1;"
+
+        self.assertEqual(cache.get("key", build), "SELECT 1;")
+        self.assertEqual(cache.get("key", build), "SELECT 1;")
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(cache.info(), (1, 1, 2, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = StatementCache(maxsize=2)
+        cache.get("one", lambda: "1")
+        cache.get("two", lambda: "2")
+        cache.get("one", lambda: "1")
+        cache.get("three", lambda: "3")
+
+        cache.get("one", lambda: "1")
+        self.assertEqual(cache.info().hits, 2)
+        cache.get("two", lambda: "2")
+        self.assertEqual(cache.info().misses, 4)
+        self.assertEqual(cache.info().currsize, 2)
+
+    def test_database_hot_paths_hit_cache(self):
+        db = DatabaseManager(":memory:")
+        db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer"}
+        )
+        self.assertEqual(db.statement_cache.maxsize, STATEMENT_CACHE_SIZE)
+
+        for value in range(10):
+            db.add_record(table_name="test_table", data={"key_one": value})
+            db.select_record(table_name="test_table", criteria={"key_one": value}).fetchall()
+            db.delete_record(table_name="test_table", criteria={"key_one": value})
+
+        self.assertEqual(db.statement_cache.info().misses, 3)
+        self.assertEqual(db.statement_cache.info().hits, 27)
+        del db
+
+class TransactionTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "test.db"))
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer"}
+        )
+
+    def test_transaction_commits(self):
+        with self.db.transaction():
+            self.db.add_record(table_name="test_table", data={"key_one": 1})
+            self.db.add_record(table_name="test_table", data={"key_one": 2})
+
+        self.assertEqual(len(self.db.select_record(table_name="test_table").fetchall()), 2)
+
+    def test_transaction_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.add_record(table_name="test_table", data={"key_one": 1})
+                raise RuntimeError()
+
+        self.assertEqual(self.db.select_record(table_name="test_table").fetchall(), [])
+
+    def test_concurrent_writers_and_readers(self):
+        errors = []
+
+        def write(offset):
+            try:
+                for value in range(50):
+                    self.db.add_record(table_name="test_table", data={"key_one": offset + value})
+                    self.db.select_record(table_name="test_table", criteria={"key_one": value}).fetchall()
+            except sqlite3.Error as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=write, args=(offset * 100,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.db.select_record(table_name="test_table").fetchall()), 200)
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
+
+class SelectBucketsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer", "date": "text", "value": "real"}
+        )
+        self.db.add_records(
+            table_name="test_table",
+            rows=[
+                {"key_one": 1, "date": f"2023-01-01T00:{minute:02d}:30.500000", "value": minute}
+                for minute in range(10)
+            ] + [{"key_one": 2, "date": "2023-01-01T00:00:00", "value": 100}]
+        )
+
+    def test_select_bounds(self):
+        self.assertEqual(
+            self.db.select_bounds(table_name="test_table", criteria={"key_one": 1}),
+            ("2023-01-01T00:00:30.500000", "2023-01-01T00:09:30.500000")
+        )
+        self.assertEqual(self.db.select_bounds(table_name="test_table", criteria={"key_one": 3}), (None, None))
+
+    def test_select_buckets(self):
+        rows = self.db.select_buckets(
+            table_name="test_table",
+            columns=("value",),
+            bucket_seconds=300,
+            criteria={"key_one": 1}
+        ).fetchall()
+
+        self.assertEqual(
+            rows,
+            [("2023-01-01 00:00:00", 5, 0, 2.0, 4), ("2023-01-01 00:05:00", 5, 5, 7.0, 9)]
+        )
+
+    def test_select_buckets_in_range(self):
+        rows = self.db.select_buckets(
+            table_name="test_table",
+            columns=("value",),
+            bucket_seconds=60,
+            criteria={"key_one": 1},
+            since="2023-01-01T00:03",
+            until="2023-01-01T00:05"
+        ).fetchall()
+
+        self.assertEqual([row[1:] for row in rows], [(1, 3, 3.0, 3), (1, 4, 4.0, 4)])
+
+    def tearDown(self):
+        del self.db
+
+class FetchColumnsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer", "date": "text", "value": "real"}
+        )
+        self.db.add_records(
+            table_name="test_table",
+            rows=[
+                {"key_one": i % 2, "date": f"1970-01-01T00:00:{i:02d}.250000", "value": None if i == 3 else i / 2}
+                for i in range(10)
+            ]
+        )
+
+    def test_fetch_columns(self):
+        arrays = self.db.fetch_columns(
+            table_name="test_table",
+            columns={"id": "int32", "date": EPOCH_MS, "value": "float32"},
+            criteria={"key_one": 1},
+            order_by="date",
+            batch_size=2
+        )
+
+        self.assertEqual(arrays["id"].dtype.name, "int32")
+        self.assertEqual(arrays["id"].tolist(), [2, 4, 6, 8, 10])
+        self.assertEqual(arrays["date"].dtype.name, "int64")
+        self.assertEqual(arrays["date"].tolist(), [1250, 3250, 5250, 7250, 9250])
+        self.assertEqual(arrays["value"].dtype.name, "float32")
+        self.assertTrue(math.isnan(arrays["value"][1]))
+        self.assertEqual(arrays["value"][2], 2.5)
+
+    def test_fetch_columns_rows_added_after_count(self):
+        execute = self.db._execute
+
+        def stale_count(statement, values=None):
+            if statement.startswith("SELECT count(*)"):
+                return execute("SELECT 1;")
+            return execute(statement, values)
+
+        with patch.object(self.db, "_execute", side_effect=stale_count):
+            arrays = self.db.fetch_columns(table_name="test_table", columns={"id": "int64"}, batch_size=3)
+
+        self.assertEqual(arrays["id"].tolist(), list(range(1, 11)))
+
+    def tearDown(self):
+        del self.db
+
+
+class PartitionedTableTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "partitions.db"))
+        self.db.create_partitioned_table(
+            table_name="readings",
+            columns={
+                "record_id": "integer primary key autoincrement",
+                "patient_id": "integer not null",
+                "date": "text not null",
+                "value": "real"
+            },
+            indexes={"idx_readings_patient_date": ("patient_id", "date")}
+        )
+        self.rows = [
+            {"patient_id": 1 + i % 2, "date": f"2023-{month:02d}-{day:02d}T10:00:00", "value": month * 100 + day}
+            for month in (1, 2, 3)
+            for i, day in enumerate((5, 15, 25))
+        ]
+        self.db.add_records(table_name="readings", rows=self.rows, batch_size=4)
+
+    def test_rows_are_routed_to_monthly_partitions(self):
+        self.assertEqual(self.db.partition_months("readings"), ["2023-01", "2023-02", "2023-03"])
+        self.assertEqual(
+            self.db.select_record(table_name="readings", order_by="record_id").fetchall(),
+            [(key, row["patient_id"], row["date"], row["value"]) for key, row in enumerate(self.rows, start=1)]
+        )
+        self.assertEqual(
+            self.db.execute("SELECT count(*) FROM readings_p202302;").fetchone()[0], 3
+        )
+        self.assertIsNotNone(self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_readings_patient_date_p202302';"
+        ).fetchone())
+
+    def test_partitions_reject_rows_of_other_months(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.execute(
+                "INSERT INTO readings_p202301 (record_id, patient_id, date) VALUES (100, 1, '2023-02-01');"
+            )
+
+    def test_add_record_continues_the_keys(self):
+        self.db.add_record(table_name="readings", data={"patient_id": 3, "date": "2023-04-01T00:00:00"})
+
+        self.assertEqual(
+            self.db.select_record(table_name="readings", criteria={"patient_id": 3}).fetchall(),
+            [(10, 3, "2023-04-01T00:00:00", None)]
+        )
+
+    def test_rows_need_a_date(self):
+        with self.assertRaises(ValueError):
+            self.db.add_records(table_name="readings", rows=[{"patient_id": 1}])
+
+    def test_range_reads_prune_partitions(self):
+        self.assertEqual(
+            self.db._source("readings", since="2023-02-10", until="2023-03-01"), "readings_p202302 AS readings"
+        )
+        self.assertEqual(self.db._source("readings", since="2022-01-01"), "readings")
+        self.assertNotIn("readings_p202301", self.db._source("readings", since="2023-02-01"))
+
+        rows = self.db.select_record(
+            table_name="readings", criteria={"patient_id": 2}, order_by="date",
+            since="2023-02-10", until="2023-03-20"
+        ).fetchall()
+        self.assertEqual([row[3] for row in rows], [215, 315])
+        self.assertEqual(
+            self.db.select_record(table_name="readings", since="2024-01-01").fetchall(), []
+        )
+
+    def test_keyset_pages_across_partitions(self):
+        rows = list(self.db.iter_records(
+            table_name="readings", order_by="date", since="2023-01-10", batch_size=2, key_column="record_id"
+        ))
+
+        self.assertEqual([row[0] for row in rows], list(range(2, 10)))
+
+    def test_delete_and_update(self):
+        self.db.delete_record(table_name="readings", criteria={"patient_id": 1})
+        self.db.update_records(table_name="readings", columns=("value",), rows=[(0.0, 5)])
+
+        self.assertEqual(
+            self.db.select_record(table_name="readings", order_by="record_id").fetchall(),
+            [(2, 2, "2023-01-15T10:00:00", 115.0), (5, 2, "2023-02-15T10:00:00", 0.0),
+             (8, 2, "2023-03-15T10:00:00", 315.0)]
+        )
+
+    def test_chunked_deletes(self):
+        self.assertEqual(self.db.delete_in_chunks(table_name="readings", criteria={"patient_id": 2}, chunk_size=2), 3)
+        self.assertEqual(self.db.delete_records(table_name="readings", keys=[1, 4, 6]), [(1,), (4,), (6,)])
+
+        self.assertEqual(
+            [row[0] for row in self.db.select_record(table_name="readings", order_by="record_id").fetchall()],
+            [3, 7, 9]
+        )
+
+    def test_drop_partitions_before(self):
+        self.assertEqual(self.db.drop_partitions_before("readings", "2023-02-28"), ["2023-01"])
+
+        self.assertEqual(self.db.partition_months("readings"), ["2023-02", "2023-03"])
+        self.assertFalse(self.db.table_exists("readings_p202301"))
+        self.assertEqual(self.db.select_bounds(table_name="readings"), ("2023-02-05T10:00:00", "2023-03-25T10:00:00"))
+
+    def test_catalog_is_read_by_new_managers(self):
+        db = DatabaseManager(os.path.join(self.directory.name, "partitions.db"))
+
+        self.assertEqual(db.select_record(table_name="readings", since="2023-03-01").fetchall()[0][0], 7)
+        with self.assertRaises(ValueError):
+            db.create_partitioned_table(table_name="readings", columns={"date": "text"})
+        del db
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
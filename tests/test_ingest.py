@@ -0,0 +1,92 @@
+import threading
+
+from unittest import TestCase
+
+from src import ingest
+from src.database import DatabaseManager
+
+
+class WriteBehindBufferTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(
+            table_name="test_table",
+            columns={"id": "integer primary key", "key_one": "integer", "key_two": "text"}
+        )
+
+    def count(self):
+        return self.db.select_record(table_name="test_table").fetchall()
+
+    def test_flushes_when_max_rows_reached(self):
+        buffer = ingest.WriteBehindBuffer(
+            self.db, table_name="test_table", max_rows=10, max_delay_ms=60_000, durability=ingest.BOUNDED_LOSS
+        )
+        for value in range(9):
+            buffer.add({"key_one": value})
+        self.assertEqual(buffer.metrics().queue_depth, 9)
+
+        buffer.add({"key_one": 9})
+        for _ in range(50):
+            if buffer.metrics().flushes:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertEqual(len(self.count()), 10)
+        metrics = buffer.metrics()
+        self.assertEqual((metrics.flushes, metrics.last_rows_per_commit), (1, 10))
+        buffer.close()
+
+    def test_sync_callers_share_a_commit(self):
+        buffer = ingest.WriteBehindBuffer(self.db, table_name="test_table", max_rows=100, max_delay_ms=50)
+        threads = [
+            threading.Thread(target=buffer.add, args=({"key_one": value},)) for value in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.count()), 20)
+        self.assertLess(buffer.metrics().flushes, 20)
+        buffer.close()
+
+    def test_close_flushes_queued_records(self):
+        buffer = ingest.WriteBehindBuffer(
+            self.db, table_name="test_table", max_rows=100, max_delay_ms=60_000, durability=ingest.BOUNDED_LOSS
+        )
+        buffer.add({"key_one": 1})
+        buffer.add({"key_one": 2, "key_two": "different columns"})
+
+        ingest.close_all()
+
+        self.assertEqual(len(self.count()), 2)
+        self.assertEqual(buffer.metrics().flushes, 1)
+        with self.assertRaises(RuntimeError):
+            buffer.add({"key_one": 3})
+
+    def test_sync_add_raises_write_errors(self):
+        buffer = ingest.WriteBehindBuffer(self.db, table_name="missing_table", max_delay_ms=1)
+
+        with self.assertRaises(Exception):
+            buffer.add({"key_one": 1})
+
+        self.assertEqual(buffer.metrics().rows_failed, 1)
+        buffer.close()
+
+    def test_sync_add_many_waits_for_every_batch(self):
+        buffer = ingest.WriteBehindBuffer(
+            self.db, table_name="test_table", max_rows=3, max_delay_ms=20, max_pending=3
+        )
+
+        buffer.add_many({"key_one": value} for value in range(7))
+
+        self.assertEqual(len(self.count()), 7)
+        self.assertEqual(buffer.metrics().flushes, 3)
+        buffer.close()
+
+    def test_invalid_durability(self):
+        with self.assertRaises(ValueError):
+            ingest.WriteBehindBuffer(self.db, durability="eventually")
+
+    def tearDown(self):
+        del self.db
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+from src import latest, rollups
+from src.database import DatabaseManager
+from tests.test_rollups import VITALS_COLUMNS, make_rows
+
+
+class LatestTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        self.db.create_index(index_name="idx_vitals_patient_date", table_name="vitals", columns=("patient_id", "date"))
+
+    def expected(self):
+        """The newest record of every patient, found by reading the whole table."""
+
+        newest = {}
+        for row in self.db.select_record(table_name="vitals").fetchall():
+            if row[1] not in newest or (row[2], row[0]) > (newest[row[1]][2], newest[row[1]][0]):
+                newest[row[1]] = row
+        return [newest[patient_id] for patient_id in sorted(newest)]
+
+    def test_backfilled_on_creation(self):
+        self.db.add_records(table_name="vitals", rows=make_rows(50))
+        latest.create_latest(self.db)
+
+        rows = latest.select_latest(self.db)
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows, self.expected())
+
+    def test_inserts_keep_the_newest_record(self):
+        latest.create_latest(self.db)
+        rows = make_rows(50)
+        # Out of date order, and a tie on the date broken by the record id.
+        rows.append(dict(rows[0], heart_rate=99))
+        self.db.add_records(table_name="vitals", rows=rows, batch_size=7)
+        self.db.add_record(table_name="vitals", data={"patient_id": 1, "date": "2022-12-31T00:00:00"})
+
+        self.assertEqual(latest.select_latest(self.db), self.expected())
+
+    def test_deletes_fall_back_to_the_previous_record(self):
+        latest.create_latest(self.db)
+        self.db.add_records(table_name="vitals", rows=make_rows(50))
+
+        for row in latest.select_latest(self.db)[:2]:
+            self.db.delete_record(table_name="vitals", criteria={"record_id": row[0]})
+        self.assertEqual(latest.select_latest(self.db), self.expected())
+
+        self.db.delete_in_chunks(table_name="vitals", criteria={"patient_id": 2}, chunk_size=4)
+        rows = latest.select_latest(self.db)
+        self.assertEqual([row[1] for row in rows], [1, 3])
+        self.assertEqual(rows, self.expected())
+
+    def test_follows_updates_and_paused_rollup_deletes(self):
+        rollups.create_rollups(self.db)
+        latest.create_latest(self.db)
+        self.db.add_records(table_name="vitals", rows=make_rows(50))
+        newest = latest.select_latest(self.db)[0]
+
+        self.db.update_records(table_name="vitals", columns=("news2",), rows=[(4, newest[0])])
+        self.assertEqual(latest.select_latest(self.db)[0][9], 4)
+        self.db.update_records(table_name="vitals", columns=("date",), rows=[("2022-01-01T00:00:00", newest[0])])
+        self.assertEqual(latest.select_latest(self.db), self.expected())
+
+        rollups.delete_in_chunks(self.db, "vitals", criteria={"patient_id": 1}, chunk_size=3)
+        self.assertEqual(latest.select_latest(self.db), self.expected())
+
+    def test_rebuild(self):
+        latest.create_latest(self.db)
+        self.db.add_records(table_name="vitals", rows=make_rows(20))
+        self.db.execute(f"DELETE FROM {latest.latest_table('vitals')};")
+
+        latest.rebuild_latest(self.db)
+
+        self.assertEqual(latest.select_latest(self.db), self.expected())
+
+    def test_select_reads_one_row_per_patient(self):
+        latest.create_latest(self.db)
+        self.db.add_records(table_name="vitals", rows=make_rows(200))
+        self.db.profiler.reset()
+
+        latest.select_latest(self.db)
+
+        [stats] = self.db.profiler.stats()
+        self.assertEqual(stats.rows, 3)
+        self.assertIn("latest_vitals", stats.shape)
+
+    def tearDown(self):
+        del self.db
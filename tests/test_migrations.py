@@ -0,0 +1,125 @@
+from unittest import TestCase
+
+from src import analytics, migrations, rollups
+from src.database import DatabaseManager
+
+
+class MigrateTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+
+    def create_original_table(self):
+        self.db.create_table(
+            table_name="vitals",
+            columns={
+                'record_id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+                'patient_id': 'INTEGER NOT NULL',
+                'date': 'TEXT NOT NULL',
+                'heart_rate': 'INTEGER',
+                'blood_pressure': 'TEXT',
+                'respiratory_rate': 'INTEGER',
+                'oxygen_saturation': 'REAL',
+                'temperature': 'REAL'
+            }
+        )
+
+    def test_new_database_is_stamped(self):
+        self.assertEqual(migrations.migrate(self.db), migrations.LATEST_VERSION)
+        self.assertEqual(migrations.schema_version(self.db), migrations.LATEST_VERSION)
+
+    def test_blood_pressure_is_split_and_backfilled(self):
+        self.create_original_table()
+        self.db.add_records(
+            table_name="vitals",
+            rows=[
+                {"patient_id": 1, "date": "2023-01-01T00:00:00", "heart_rate": "72", "blood_pressure": "120/80",
+                 "respiratory_rate": 16, "oxygen_saturation": 97.5, "temperature": 36.6},
+                {"patient_id": 1, "date": "2023-01-01T00:01:00", "heart_rate": "fast", "blood_pressure": " 130 / 85",
+                 "respiratory_rate": "slow", "oxygen_saturation": "97", "temperature": None},
+                {"patient_id": 2, "date": "2023-01-01T00:02:00", "heart_rate": 60, "blood_pressure": "high",
+                 "respiratory_rate": 12, "oxygen_saturation": 99, "temperature": 37},
+            ]
+        )
+        # Rollups created before the migration lack the systolic and diastolic columns.
+        self.db.create_table(table_name=rollups.rollup_table("vitals", "hour"), columns={"patient_id": "integer"})
+
+        self.assertEqual(migrations.migrate(self.db), migrations.LATEST_VERSION)
+
+        self.assertEqual(
+            self.db.select_record(table_name="vitals", order_by="record_id").fetchall(),
+            [
+                (1, 1, "2023-01-01T00:00:00", 72, 120, 80, 16, 97.5, 36.6, 0),
+                (2, 1, "2023-01-01T00:01:00", None, 130, 85, None, 97.0, None, 0),
+                (3, 2, "2023-01-01T00:02:00", 60, None, None, 12, 99.0, 37.0, 0),
+            ]
+        )
+        self.assertFalse(self.db.table_exists(rollups.rollup_table("vitals", "hour")))
+        self.assertEqual(migrations.schema_version(self.db), migrations.LATEST_VERSION)
+
+        self.db.add_record(table_name="vitals", data={"patient_id": 3, "date": "2023-01-02T00:00:00"})
+        self.assertEqual(self.db.select_record(table_name="vitals", criteria={"patient_id": 3}).fetchone()[0], 4)
+
+    def test_existing_records_are_scored(self):
+        self.create_original_table()
+        self.db.add_records(
+            table_name="vitals",
+            rows=[
+                {"patient_id": 1, "date": "2023-01-01T00:00:00", "heart_rate": 135, "blood_pressure": "85/50",
+                 "respiratory_rate": 26, "oxygen_saturation": 90, "temperature": 34.5},
+                {"patient_id": 1, "date": "2023-01-01T00:01:00", "heart_rate": 95, "blood_pressure": None,
+                 "respiratory_rate": None, "oxygen_saturation": None, "temperature": None},
+                {"patient_id": 2, "date": "2023-01-01T00:02:00", "heart_rate": None, "blood_pressure": None,
+                 "respiratory_rate": None, "oxygen_saturation": None, "temperature": None},
+            ]
+        )
+
+        migrations.migrate(self.db)
+
+        self.assertEqual(
+            [row[0] for row in self.db.execute("SELECT news2 FROM vitals ORDER BY record_id;").fetchall()],
+            [15, 1, None]
+        )
+
+    def test_rollup_triggers_are_recreated(self):
+        self.create_original_table()
+        migrations.migrate(self.db)
+        rollups.create_rollups(self.db)
+        self.db.execute("PRAGMA user_version = 2;")
+        rollups.drop_triggers(self.db)
+        self.db.execute(
+            "CREATE TRIGGER vitals_rollup_hour_insert AFTER INSERT ON vitals BEGIN SELECT 1; END;"
+        )
+
+        migrations.migrate(self.db)
+
+        triggers = self.db.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger';").fetchall()
+        self.assertEqual(len(triggers), 2 * len(rollups.GRANULARITIES))
+        self.assertTrue(all("WHEN NOT EXISTS" in sql for sql, in triggers))
+
+    def test_anomalies_trigger_is_recreated(self):
+        self.create_original_table()
+        migrations.migrate(self.db)
+        analytics.create_analytics(self.db)
+        self.db.execute("PRAGMA user_version = 3;")
+        analytics.drop_triggers(self.db)
+        self.db.execute(
+            "CREATE TRIGGER vitals_anomalies_delete AFTER DELETE ON vitals BEGIN SELECT 1; END;"
+        )
+
+        migrations.migrate(self.db)
+
+        triggers = self.db.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger';").fetchall()
+        self.assertEqual(len(triggers), 2)
+        self.assertTrue(all("WHEN NOT EXISTS" in sql for sql, in triggers))
+
+    def test_migrate_is_idempotent(self):
+        self.create_original_table()
+        migrations.migrate(self.db)
+        migrations.migrate(self.db)
+
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(vitals);").fetchall()]
+        self.assertIn("systolic", columns)
+        self.assertNotIn("blood_pressure", columns)
+
+    def tearDown(self):
+        del self.db
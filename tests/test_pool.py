@@ -0,0 +1,141 @@
+import os
+import tempfile
+import threading
+
+from unittest import TestCase
+
+from src.pool import ConnectionPool
+
+
+class ConnectionPoolTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.directory.name, "test.db"), isolation_level=None)
+
+    def test_file_database_uses_wal(self):
+        mode = self.pool.writer_connection.execute("PRAGMA journal_mode;").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_reader_per_thread(self):
+        connections = []
+
+        def read():
+            connections.append(self.pool.reader())
+            connections.append(self.pool.reader())
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+
+        self.assertIs(connections[0], connections[1])
+        self.assertIsNot(connections[0], self.pool.reader())
+        self.assertIsNot(self.pool.reader(), self.pool.writer_connection)
+
+    def test_readers_of_finished_threads_are_closed(self):
+        threads = [threading.Thread(target=self.pool.reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        self.pool.reader()
+        self.assertEqual(self.pool.reader_count, 1)
+
+    def test_readers_see_committed_writes(self):
+        with self.pool.writer() as conn:
+            conn.execute("CREATE TABLE test_table (key_one INTEGER);")
+            conn.execute("INSERT INTO test_table VALUES (1);")
+
+        self.assertEqual(self.pool.reader().execute("SELECT * FROM test_table;").fetchall(), [(1,)])
+
+    def test_writer_is_exclusive(self):
+        inside = []
+        overlaps = []
+
+        def write():
+            for _ in range(100):
+                with self.pool.writer():
+                    inside.append(1)
+                    if len(inside) > 1:
+                        overlaps.append(1)
+                    inside.pop()
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(overlaps, [])
+
+    def test_synced_writes_sync_every_commit(self):
+        with self.pool.synced() as connection:
+            self.assertEqual(connection.execute("PRAGMA synchronous;").fetchone()[0], 2)
+            connection.execute("BEGIN")
+            with self.pool.synced():
+                pass
+            connection.execute("COMMIT")
+
+        self.assertEqual(self.pool.writer_connection.execute("PRAGMA synchronous;").fetchone()[0], 1)
+
+    def test_data_version_changes_with_commits_of_any_connection(self):
+        with self.pool.writer() as conn:
+            conn.execute("CREATE TABLE test_table (key_one INTEGER);")
+        version = self.pool.data_version()
+        self.pool.reader().execute("SELECT * FROM test_table;").fetchall()
+        self.assertEqual(self.pool.data_version(), version)
+
+        with self.pool.writer() as conn:
+            conn.execute("INSERT INTO test_table VALUES (1);")
+        own = self.pool.data_version()
+        other = ConnectionPool(self.pool.db_name, isolation_level=None)
+        with other.writer() as conn:
+            conn.execute("INSERT INTO test_table VALUES (2);")
+        other.close()
+
+        self.assertNotEqual(own, version)
+        self.assertNotEqual(self.pool.data_version(), own)
+
+    def test_connect_opens_a_connection_outside_the_pool(self):
+        connection = self.pool.connect()
+
+        self.assertEqual(connection.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+        self.assertEqual(self.pool.reader_count, 0)
+        connection.close()
+
+    def tearDown(self):
+        self.pool.close()
+        self.directory.cleanup()
+
+
+class LazyConnectionPoolTest(TestCase):
+    def test_connects_on_first_use(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.db")
+            pool = ConnectionPool(path, isolation_level=None)
+            self.assertFalse(pool.opened)
+            self.assertFalse(os.path.exists(path))
+
+            pool.reader()
+
+            self.assertTrue(pool.opened)
+            self.assertEqual(pool.writer_connection.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+            pool.close()
+
+    def test_close_before_use(self):
+        pool = ConnectionPool(":memory:")
+        pool.close()
+        self.assertFalse(pool.opened)
+
+
+class InMemoryConnectionPoolTest(TestCase):
+    def test_in_memory_database_has_one_connection(self):
+        pool = ConnectionPool(":memory:")
+        self.assertIs(pool.reader(), pool.writer_connection)
+        self.assertEqual(pool.reader_count, 0)
+        version = pool.data_version()
+        pool.writer_connection.execute("CREATE TABLE test_table (key_one INTEGER);")
+        pool.writer_connection.execute("INSERT INTO test_table VALUES (1);")
+        self.assertNotEqual(pool.data_version(), version)
+        with self.assertRaises(ValueError):
+            pool.connect()
+        pool.close()
@@ -1,7 +1,7 @@
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
-from src.presentation import get_new_records
+from src.presentation import Option, get_new_records
 
 
 class PresentationTest(TestCase):
@@ -19,4 +19,15 @@ class PresentationTest(TestCase):
                     "oxygen_saturation": "mock_oxygen_saturation",
                     "temperature": "mock_temperature",
                 }
-            )
\ No newline at end of file
+            )
+
+class OptionTest(TestCase):
+    def test_choose_reports_invalid_input(self):
+        command = MagicMock()
+        command.execute.side_effect = ValueError("heart_rate must be an integer, got 'fast'.")
+        option = Option(name="Add a record", command=command, prep_call=lambda: {"heart_rate": "fast"})
+
+        with patch("builtins.print") as mocked_print:
+            option.choose()
+
+        mocked_print.assert_called_once_with("Invalid input: heart_rate must be an integer, got 'fast'.")
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from unittest import TestCase
+
+from src import profiling
+from src.database import DatabaseManager
+
+
+class ShapeTest(TestCase):
+    def test_shape_of(self):
+        self.assertEqual(
+            profiling.shape_of("SELECT *\n  FROM vitals WHERE name = 'O''Brien' AND id IN (?, ?,?) LIMIT 100;"),
+            "SELECT * FROM vitals WHERE name = ? AND id IN (?, ...) LIMIT ?;"
+        )
+        self.assertEqual(profiling.shape_of("SELECT * FROM vitals_p202301;"), "SELECT * FROM vitals_p202301;")
+
+    def test_is_full_scan(self):
+        self.assertTrue(profiling.is_full_scan(["SCAN vitals"]))
+        self.assertFalse(profiling.is_full_scan(["SEARCH vitals USING INDEX idx (patient_id=?)"]))
+        self.assertFalse(profiling.is_full_scan(["SCAN vitals USING INDEX idx_vitals_date"]))
+        self.assertFalse(profiling.is_full_scan(["SCAN CONSTANT ROW"]))
+
+
+class QueryProfilerTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "profiling.db"))
+        self.db.create_table(
+            table_name="vitals",
+            columns={"record_id": "INTEGER PRIMARY KEY", "patient_id": "INTEGER", "date": "TEXT"}
+        )
+        self.db.create_index("idx_vitals_date", "vitals", ["date"])
+        self.db.add_records(
+            table_name="vitals",
+            rows=[{"patient_id": i % 3, "date": f"2023-01-0{i + 1}"} for i in range(6)]
+        )
+        self.db.profiler.reset()
+
+    def stats_of(self, shape):
+        return next(stat for stat in self.db.profiler.stats() if stat.shape == shape)
+
+    def test_records_calls_and_rows(self):
+        for patient_id in (0, 1):
+            self.db.select_record(table_name="vitals", criteria={"patient_id": patient_id}).fetchall()
+        rows = list(self.db.select_record(table_name="vitals"))
+        self.db.delete_record(table_name="vitals", criteria={"patient_id": 2})
+
+        selected = self.stats_of("SELECT * FROM vitals WHERE patient_id = ?;")
+        self.assertEqual((selected.calls, selected.rows), (2, 4))
+        self.assertGreater(selected.p99_seconds, 0)
+        self.assertGreaterEqual(selected.p99_seconds, selected.p50_seconds)
+        self.assertEqual(self.stats_of("SELECT * FROM vitals;").rows, len(rows))
+        self.assertEqual(self.stats_of("DELETE FROM vitals WHERE patient_id = ?;").rows, 2)
+        self.assertEqual(selected.callers, ["test_profiling.py:QueryProfilerTest.test_records_calls_and_rows"])
+
+    def test_captures_plans_and_logs_slow_queries(self):
+        self.db.profiler.slow_seconds = 0
+        self.db.profiler.explain_seconds = 0
+        self.db.select_record(table_name="vitals", criteria={"patient_id": 1}).fetchall()
+        self.db.select_record(table_name="vitals", since="2023-01-03").fetchall()
+
+        self.assertTrue(self.stats_of("SELECT * FROM vitals WHERE patient_id = ?;").full_scan)
+        by_date = self.stats_of("SELECT * FROM vitals WHERE date >= ?;")
+        self.assertFalse(by_date.full_scan)
+        self.assertIn("idx_vitals_date", by_date.plan[0])
+
+        slow = self.db.profiler.slow_queries()
+        self.assertEqual([query.shape for query in slow], [by_date.shape, "SELECT * FROM vitals WHERE patient_id = ?;"])
+        self.assertEqual(slow[0].plan, by_date.plan)
+
+    def test_disabled(self):
+        self.db.profiler.enabled = False
+        self.db.select_record(table_name="vitals").fetchall()
+        self.db.add_records(table_name="vitals", rows=[{"patient_id": 1, "date": "2023-02-01"}])
+
+        self.assertEqual(self.db.profiler.stats(), [])
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.database import DatabaseManager
+from src.replica import Replica
+
+
+class ReplicaTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "test.db"))
+        self.db.create_table(table_name="test_table", columns={"key_one": "INTEGER"})
+        self.db.add_records(table_name="test_table", rows=[{"key_one": i} for i in range(100)])
+        # Refreshed by the tests themselves, except in test_copies_are_taken_in_the_background.
+        self.replica = Replica(self.db, refresh_seconds=None)
+
+    def count(self, database):
+        return database.execute("SELECT count(*) FROM test_table;").fetchone()[0]
+
+    def wait_for_generation(self, replica, generation):
+        deadline = time.monotonic() + 5
+        while replica.generation < generation and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(replica.generation, generation)
+
+    def test_reads_are_stale_within_the_bound(self):
+        self.assertIs(self.replica.database(max_staleness=60), self.db)
+        self.replica.refresh()
+        self.db.add_record(table_name="test_table", data={"key_one": 100})
+
+        self.assertEqual(self.count(self.replica.database(max_staleness=60)), 100)
+        self.assertEqual(self.replica.version(max_staleness=60), (1, None))
+        self.assertIs(self.replica.database(max_staleness=0), self.db)
+        self.assertEqual(self.replica.version(max_staleness=0), (1, self.db.pool.data_version()))
+        self.assertEqual(self.replica.stats().refreshes, 1)
+
+    def test_unchanged_database_is_not_copied_again(self):
+        generation = self.replica.refresh()
+
+        self.assertEqual(self.replica.refresh(), generation)
+        self.assertEqual(self.replica.refreshes, 1)
+
+    def test_copies_are_taken_in_the_background(self):
+        replica = Replica(self.db, refresh_seconds=0.01)
+        try:
+            with patch("src.replica.Replica._take_copy", autospec=True, side_effect=Replica._take_copy) as take_copy:
+                # The first read does not wait for a copy.
+                self.assertIs(replica.database(max_staleness=60), self.db)
+                self.wait_for_generation(replica, 1)
+                self.db.add_record(table_name="test_table", data={"key_one": 100})
+                self.wait_for_generation(replica, 2)
+
+            self.assertEqual(self.count(replica.database(max_staleness=60)), 101)
+            self.assertEqual(take_copy.call_count, 2)
+        finally:
+            replica.close()
+
+    def test_reads_do_not_hold_the_wal(self):
+        self.replica.refresh()
+        cursor = self.replica.database().execute("SELECT key_one FROM test_table;")
+        cursor.fetchone()
+
+        # Reading the copy halfway neither blocks the writer nor keeps a checkpoint from resetting the WAL.
+        self.db.add_record(table_name="test_table", data={"key_one": 100})
+        busy, _, _ = self.db.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone()
+
+        self.assertEqual(busy, 0)
+        self.assertEqual(len(cursor.fetchall()), 99)
+
+    def test_replaced_copies_are_deleted(self):
+        self.replica.refresh()
+        first = self.replica.database().pool.db_name
+        self.db.add_record(table_name="test_table", data={"key_one": 100})
+        self.replica.refresh()
+        second = self.replica.database().pool.db_name
+
+        # The replica keeps a single copy, in a file, and the copy it replaced is gone.
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+        self.replica.close()
+        self.assertFalse(os.path.exists(second))
+
+    def test_in_memory_database(self):
+        db = DatabaseManager(":memory:")
+        db.create_table(table_name="test_table", columns={"key_one": "INTEGER"})
+        db.add_record(table_name="test_table", data={"key_one": 1})
+        replica = Replica(db, refresh_seconds=None)
+        replica.refresh()
+
+        self.assertIsNot(replica.database(), db)
+        self.assertEqual(self.count(replica.database()), 1)
+
+    def test_negative_staleness(self):
+        with self.assertRaises(ValueError):
+            self.replica.database(max_staleness=-1)
+        with self.assertRaises(ValueError):
+            Replica(self.db, refresh_seconds=0)
+
+    def tearDown(self):
+        self.replica.close()
+        del self.db
+        self.directory.cleanup()
@@ -0,0 +1,120 @@
+import gzip
+import json
+import os
+import tempfile
+
+from datetime import datetime
+from unittest import TestCase
+
+from src import analytics, retention, rollups
+from src.database import DatabaseManager
+from tests.test_rollups import VITALS_COLUMNS
+
+NOW = datetime(2023, 6, 1)
+
+
+def make_rows(days, per_day):
+    return [
+        {"patient_id": 1 + i % 2, "date": f"2023-05-{day:02d}T{i:02d}:00:00", "heart_rate": 60 + day + i,
+         "temperature": 36.5}
+        for day in days
+        for i in range(per_day)
+    ]
+
+
+class RetentionPolicyTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "vitals.db"))
+        self.db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        self.db.create_index(index_name="idx_vitals_date", table_name="vitals", columns=("date",))
+        rollups.create_rollups(self.db)
+        # 10 rows a day from May 1st to 30th, the policy keeps the last 7 days.
+        self.db.add_records(table_name="vitals", rows=make_rows(range(1, 31), 10))
+        self.archive = os.path.join(self.directory.name, "archive")
+        self.policy = retention.RetentionPolicy(self.db, self.archive, retain_days=7, chunk_size=30)
+
+    def aggregates(self):
+        return [rollups.select_aggregates(self.db, patient_id, "day") for patient_id in (1, 2)]
+
+    def count(self):
+        return self.db.execute("SELECT count(*) FROM vitals;").fetchone()[0]
+
+    def test_run_archives_old_rows_in_chunks(self):
+        before = self.aggregates()
+
+        result = self.policy.run(now=NOW)
+
+        self.assertEqual(result.rows_archived, 240)
+        self.assertEqual(result.chunks, 8)
+        self.assertEqual(len(result.files), 24)
+        self.assertEqual(self.count(), 60)
+        self.assertEqual(
+            self.db.execute("SELECT min(date) FROM vitals;").fetchone()[0], "2023-05-25T00:00:00"
+        )
+        self.assertEqual(self.aggregates(), before)
+        with gzip.open(self.policy.archive_path("2023-05-01"), "rt") as archive:
+            rows = [json.loads(line) for line in archive]
+        self.assertEqual([row["heart_rate"] for row in rows], list(range(61, 71)))
+
+    def test_run_twice_archives_nothing_more(self):
+        self.policy.run(now=NOW)
+
+        self.assertEqual(self.policy.run(now=NOW).rows_archived, 0)
+
+    def test_rehydrate(self):
+        self.policy.run(now=NOW)
+        before = self.aggregates()
+
+        restored = self.policy.rehydrate("2023-05-02T05:00:00", "2023-05-04")
+
+        self.assertEqual(restored, 15)
+        self.assertEqual(self.count(), 75)
+        self.assertEqual(self.aggregates(), before)
+        self.assertFalse(os.path.exists(self.policy.archive_path("2023-05-03")))
+        with gzip.open(self.policy.archive_path("2023-05-02"), "rt") as archive:
+            self.assertEqual(len(archive.readlines()), 5)
+        self.assertEqual(self.policy.rehydrate("2023-05-02T05:00:00", "2023-05-04"), 0)
+
+    def test_anomalies_survive_archive_and_rehydrate(self):
+        analytics.create_analytics(self.db)
+        self.db.add_record(
+            table_name="vitals", data={"patient_id": 1, "date": "2023-05-10T12:30:00", "heart_rate": 300}
+        )
+        anomalies = analytics.select_anomalies(self.db, 1)
+
+        self.policy.run(now=NOW)
+        archived = analytics.select_anomalies(self.db, 1)
+        self.policy.rehydrate("2023-05-01", "2023-06-01")
+
+        self.assertIn("heart_rate", [anomaly.vital for anomaly in anomalies])
+        self.assertEqual(archived, anomalies)
+        self.assertEqual(analytics.select_anomalies(self.db, 1), anomalies)
+
+    def test_rehydrate_ignores_rows_archived_twice(self):
+        self.policy.run(now=NOW)
+        # As left by a crash between archiving a chunk and deleting it.
+        rows = make_rows([1], 10)
+        for record_id, row in enumerate(rows, start=1):
+            row.update(record_id=record_id, date=row["date"])
+        self.policy._append([{column: row.get(column) for column in VITALS_COLUMNS} for row in rows])
+
+        self.assertEqual(self.policy.rehydrate("2023-05-01", "2023-05-02"), 10)
+        self.assertEqual(self.count(), 70)
+
+    def test_incremental_vacuum(self):
+        self.assertTrue(retention.enable_incremental_vacuum(self.db))
+        self.assertFalse(retention.enable_incremental_vacuum(self.db))
+        self.db.add_records(
+            table_name="vitals",
+            rows=[{"patient_id": 3, "date": "2023-04-01T00:00:00", "heart_rate": 70, "temperature": 36.5}] * 5000
+        )
+
+        result = self.policy.run(now=NOW)
+
+        self.assertGreater(result.pages_vacuumed, 0)
+        self.assertEqual(self.db.execute("PRAGMA freelist_count;").fetchone()[0], 0)
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
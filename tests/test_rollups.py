@@ -0,0 +1,128 @@
+import random
+
+from unittest import TestCase
+
+from src import rollups
+from src.database import DatabaseManager
+
+VITALS_COLUMNS = {
+    "record_id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+    "patient_id": "INTEGER NOT NULL",
+    "date": "TEXT NOT NULL",
+    "heart_rate": "INTEGER",
+    "systolic": "INTEGER",
+    "diastolic": "INTEGER",
+    "respiratory_rate": "INTEGER",
+    "oxygen_saturation": "REAL",
+    "temperature": "REAL",
+    "news2": "INTEGER",
+}
+
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "patient_id": rng.randint(1, 3),
+            "date": f"2023-01-01T{rng.randint(0, 2):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+            "heart_rate": rng.choice([None, rng.randint(50, 120)]),
+            "systolic": rng.randint(90, 160),
+            "diastolic": rng.randint(50, 100),
+            "respiratory_rate": rng.randint(10, 25),
+            "oxygen_saturation": rng.uniform(90, 100),
+            "temperature": rng.uniform(35, 39),
+        }
+        for _ in range(count)
+    ]
+
+
+class RollupsTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        self.db.create_index(index_name="idx_vitals_patient_date", table_name="vitals", columns=("patient_id", "date"))
+
+    def rollup_rows(self, granularity):
+        return self.db.select_record(
+            table_name=rollups.rollup_table("vitals", granularity), order_by="patient_id, bucket"
+        ).fetchall()
+
+    def assertRollupsMatchRebuild(self):
+        maintained = {granularity: self.rollup_rows(granularity) for granularity in rollups.GRANULARITIES}
+        rollups.rebuild_rollups(self.db)
+        for granularity in rollups.GRANULARITIES:
+            rebuilt = self.rollup_rows(granularity)
+            self.assertEqual(len(maintained[granularity]), len(rebuilt))
+            for row, expected in zip(maintained[granularity], rebuilt):
+                self.assertEqual(row[:3], expected[:3])
+                for value, expected_value in zip(row[3:], expected[3:]):
+                    if expected_value is None:
+                        self.assertIsNone(value)
+                    else:
+                        self.assertAlmostEqual(value, expected_value, places=6)
+
+    def test_backfill_existing_rows(self):
+        self.db.add_records(table_name="vitals", rows=make_rows(50))
+        rollups.create_rollups(self.db)
+
+        self.assertEqual(sum(row[2] for row in self.rollup_rows("day")), 50)
+        self.assertRollupsMatchRebuild()
+
+    def test_inserts_and_deletes_are_rolled_up(self):
+        rollups.create_rollups(self.db)
+        self.db.add_records(table_name="vitals", rows=make_rows(300))
+        self.db.add_record(table_name="vitals", data=make_rows(1, seed=8)[0])
+        self.assertRollupsMatchRebuild()
+
+        for record_id in range(1, 300, 3):
+            self.db.delete_record(table_name="vitals", criteria={"record_id": record_id})
+        self.db.delete_record(table_name="vitals", criteria={"patient_id": 2})
+        self.assertRollupsMatchRebuild()
+        self.assertEqual(
+            [row for row in self.rollup_rows("hour") if row[0] == 2], []
+        )
+
+    def test_chunked_deletes_are_subtracted_per_chunk(self):
+        rows = make_rows(300)
+        rollups.create_rollups(self.db)
+        self.db.add_records(table_name="vitals", rows=rows)
+
+        deleted = rollups.delete_records(self.db, "vitals", keys=range(1, 300, 3), batch_size=40)
+        self.assertEqual(len(deleted), 100)
+        self.assertEqual(deleted[0][:3], (rows[0]["patient_id"], rows[0]["date"], rows[0]["heart_rate"]))
+        self.assertRollupsMatchRebuild()
+
+        remaining = self.db.execute("SELECT count(*) FROM vitals WHERE patient_id = 2;").fetchone()[0]
+        self.assertEqual(rollups.delete_in_chunks(self.db, "vitals", {"patient_id": 2}, chunk_size=16), remaining)
+        self.assertRollupsMatchRebuild()
+        self.assertEqual([row for row in self.rollup_rows("hour") if row[0] == 2], [])
+        self.assertEqual(self.db.execute(f"SELECT count(*) FROM {rollups.pause_table('vitals')};").fetchone()[0], 0)
+
+    def test_select_aggregates(self):
+        rollups.create_rollups(self.db)
+        self.db.add_records(
+            table_name="vitals",
+            rows=[
+                {"patient_id": 1, "date": "2023-01-01T00:10:00", "heart_rate": 60},
+                {"patient_id": 1, "date": "2023-01-01T00:50:00", "heart_rate": 80},
+                {"patient_id": 1, "date": "2023-01-01T01:10:00", "heart_rate": None},
+                {"patient_id": 2, "date": "2023-01-01T00:10:00", "heart_rate": 100},
+            ]
+        )
+
+        aggregates = rollups.select_aggregates(self.db, patient_id=1, granularity="hour")
+
+        self.assertEqual([aggregate.bucket for aggregate in aggregates], ["2023-01-01T00:00:00", "2023-01-01T01:00:00"])
+        self.assertEqual([aggregate.readings for aggregate in aggregates], [2, 1])
+        self.assertEqual(aggregates[0].vitals["heart_rate"], (2, 60, 80, 70.0, 10.0))
+        self.assertEqual(aggregates[1].vitals["heart_rate"], (0, None, None, None, None))
+
+        since = rollups.select_aggregates(self.db, patient_id=1, granularity="hour", since="2023-01-01T01:00:00")
+        self.assertEqual(len(since), 1)
+
+    def test_select_aggregates_unknown_granularity(self):
+        with self.assertRaises(ValueError):
+            rollups.select_aggregates(self.db, patient_id=1, granularity="week")
+
+    def tearDown(self):
+        del self.db
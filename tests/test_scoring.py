@@ -0,0 +1,91 @@
+import random
+
+from unittest import TestCase
+
+import numpy as np
+
+from src import scoring
+from src.database import DatabaseManager
+from tests.test_rollups import VITALS_COLUMNS, make_rows
+
+
+class SubscoreTest(TestCase):
+    def test_band_edges(self):
+        cases = {
+            "respiratory_rate": [(8, 3), (9, 1), (11, 1), (12, 0), (20, 0), (21, 2), (24, 2), (25, 3)],
+            "oxygen_saturation": [(91, 3), (92, 2), (93, 2), (94, 1), (95, 1), (96, 0)],
+            "systolic": [(90, 3), (91, 2), (100, 2), (101, 1), (110, 1), (111, 0), (219, 0), (220, 3)],
+            "heart_rate": [(40, 3), (41, 1), (50, 1), (51, 0), (90, 0), (91, 1), (110, 1), (111, 2), (130, 2), (131, 3)],
+            "temperature": [(35.0, 3), (35.1, 1), (36.0, 1), (36.1, 0), (38.0, 0), (38.1, 1), (39.0, 1), (39.1, 2)],
+        }
+        for vital, expected in cases.items():
+            for value, score in expected:
+                with self.subTest(vital=vital, value=value):
+                    self.assertEqual(scoring.subscore(vital, value), score)
+
+    def test_missing_value(self):
+        self.assertIsNone(scoring.subscore("heart_rate", None))
+
+
+class ScoreRecordTest(TestCase):
+    def test_score_record(self):
+        score = scoring.score_record(
+            {"patient_id": 1, "heart_rate": 115, "systolic": 95, "respiratory_rate": 22,
+             "oxygen_saturation": 97.0, "temperature": None}
+        )
+
+        self.assertEqual(score.total, 6)
+        self.assertIsNone(score.subscores["temperature"])
+        self.assertEqual(score.risk, scoring.MEDIUM)
+
+    def test_single_red_score(self):
+        score = scoring.score_record({"patient_id": 1, "respiratory_rate": 26})
+
+        self.assertEqual(score.total, 3)
+        self.assertEqual(score.risk, scoring.LOW_MEDIUM)
+
+    def test_nothing_measured(self):
+        self.assertEqual(scoring.score_record({"patient_id": 1}).total, None)
+
+
+class ScoreArraysTest(TestCase):
+    def test_matches_score_record(self):
+        rng = random.Random(3)
+        records = [
+            {vital: rng.choice([None, rng.uniform(20, 240)]) for vital in scoring.SCORED_VITALS}
+            for _ in range(500)
+        ]
+        records.append({vital: None for vital in scoring.SCORED_VITALS})
+        arrays = {
+            vital: np.array([np.nan if r[vital] is None else r[vital] for r in records])
+            for vital in scoring.SCORED_VITALS
+        }
+
+        scores = scoring.score_arrays(arrays)
+        risks = scoring.risk_levels(scores)
+
+        for position, record in enumerate(records):
+            expected = scoring.score_record(record)
+            self.assertEqual(scores.total[position], scoring.MISSING if expected.total is None else expected.total)
+            self.assertEqual(risks[position], expected.risk)
+            for vital, subscore in expected.subscores.items():
+                self.assertEqual(
+                    scores.subscores[vital][position], scoring.MISSING if subscore is None else subscore
+                )
+
+
+class BackfillScoresTest(TestCase):
+    def setUp(self):
+        self.db = DatabaseManager(":memory:")
+        self.db.create_table(table_name="vitals", columns=VITALS_COLUMNS)
+        self.rows = make_rows(200)
+        self.db.add_records(table_name="vitals", rows=self.rows)
+
+    def test_backfill_scores(self):
+        self.assertEqual(scoring.backfill_scores(self.db, batch_size=64), len(self.rows))
+
+        stored = [row[0] for row in self.db.execute("SELECT news2 FROM vitals ORDER BY record_id;").fetchall()]
+        self.assertEqual(stored, [scoring.score_record(row).total for row in self.rows])
+
+    def tearDown(self):
+        del self.db
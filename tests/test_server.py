@@ -0,0 +1,137 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from src import server
+from src.commands import CreateVitalSignsTableCommand
+from src.database import DatabaseManager
+
+
+class ParseBatchTest(TestCase):
+    def test_ndjson(self):
+        body = b'{"patient_id": 1, "heart_rate": "72"}\n\nnot json\n[1]\n{"patient_id": 2, "date": "2023-01-01"}\n'
+
+        parsed = server.parse_batch(body)
+
+        self.assertEqual([record["patient_id"] for record in parsed.records], [1, 2])
+        self.assertEqual(parsed.records[0]["heart_rate"], 72)
+        self.assertIsNotNone(parsed.records[0]["date"])
+        self.assertEqual(parsed.records[1]["news2"], None)
+        self.assertEqual([entry.position for entry in parsed.rejected], [1, 2])
+        self.assertTrue(parsed.rejected[0].error.startswith("Invalid JSON"))
+
+    def test_json_array(self):
+        parsed = server.parse_batch(b'[{"patient_id": 1}, {"patient_id": 2, "pulse": 60}, {"heart_rate": 60}]')
+
+        self.assertEqual(len(parsed.records), 1)
+        self.assertEqual(
+            parsed.rejected,
+            [server.Rejected(1, "Unknown column 'pulse'."), server.Rejected(2, "Missing required values for patient_id.")]
+        )
+
+    def test_invalid_array(self):
+        parsed = server.parse_batch(b'[{"patient_id": 1},')
+
+        self.assertEqual(parsed.records, [])
+        self.assertEqual(len(parsed.rejected), 1)
+
+
+class IngestServerTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "vitals.db"))
+        with patch("src.commands.db", self.db):
+            CreateVitalSignsTableCommand().execute()
+
+    def post(self, connection, body, path=server.VITALS_PATH):
+        connection.request("POST", path, body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_batches_are_committed_before_the_ack(self):
+        ingest_server = server.IngestServer(self.db, address=("127.0.0.1", 0), workers=1, max_delay_ms=1)
+        ingest_server.start()
+        connection = http.client.HTTPConnection(*ingest_server.address)
+        try:
+            status, response = self.post(
+                connection,
+                b'{"patient_id": 1, "date": "2023-01-01T10:00:00", "heart_rate": 150}\n'
+                b'{"patient_id": 1, "date": "2023-01-01T10:15:00", "heart_rate": "fast"}\n'
+            )
+            rows = self.db.select_record(table_name="vitals").fetchall()
+            # The same connection is kept for the next batch.
+            second_status, _ = self.post(connection, b'{"patient_id": 2}')
+            connection.request("GET", server.HEALTH_PATH)
+            health = json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+            ingest_server.close()
+
+        self.assertEqual((status, second_status), (200, 200))
+        self.assertEqual(response["accepted"], 1)
+        self.assertEqual(response["rejected"], [{"position": 1, "error": "heart_rate must be an integer, got 'fast'."}])
+        self.assertTrue(any(alert["vital"] == "heart_rate" for alert in response["alerts"]))
+        self.assertEqual([(row[1], row[3]) for row in rows], [(1, 150)])
+        self.assertEqual(health["rows_committed"], 2)
+
+    def test_unix_socket_and_errors(self):
+        path = os.path.join(self.directory.name, "ingest.sock")
+        ingest_server = server.IngestServer(self.db, address=path, workers=0, max_body_bytes=100)
+        ingest_server.start()
+        try:
+            connection = http.client.HTTPConnection("localhost")
+            connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.sock.connect(path)
+            ok = self.post(connection, b'[{"patient_id": 3}]')
+            not_found = self.post(connection, b"", path="/records")[0]
+            connection.close()
+
+            connection = http.client.HTTPConnection("localhost")
+            connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.sock.connect(path)
+            too_large = self.post(connection, b"x" * 101)[0]
+            connection.close()
+        finally:
+            ingest_server.close()
+
+        self.assertEqual(ok, (200, {"accepted": 1, "rejected": [], "alerts": []}))
+        self.assertEqual(len(self.db.select_record(table_name="vitals").fetchall()), 1)
+        self.assertEqual((not_found, too_large), (404, 413))
+        self.assertFalse(os.path.exists(path))
+
+    def test_refused_bodies_are_read(self):
+        ingest_server = server.IngestServer(self.db, address=("127.0.0.1", 0), workers=0, max_body_bytes=100)
+        ingest_server.start()
+        try:
+            connection = http.client.HTTPConnection(*ingest_server.address)
+            # The body of the 404 is not taken for the next request on the same connection.
+            not_found = self.post(connection, b'{"patient_id": 1}', path="/records")[0]
+            ok = self.post(connection, b'{"patient_id": 1}')[0]
+            connection.close()
+
+            too_large = []
+            for _ in range(20):
+                connection = http.client.HTTPConnection(*ingest_server.address)
+                too_large.append(self.post(connection, b"x" * 10_000)[0])
+                connection.close()
+
+            connection = http.client.HTTPConnection(*ingest_server.address)
+            connection.putrequest("POST", server.VITALS_PATH)
+            connection.putheader("Content-Length", "many")
+            connection.endheaders()
+            bad_length = connection.getresponse().status
+            connection.close()
+        finally:
+            ingest_server.close()
+
+        self.assertEqual((not_found, ok, bad_length), (404, 200, 400))
+        self.assertEqual(set(too_large), {413})
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
@@ -0,0 +1,105 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from unittest import TestCase
+
+from src import transfer
+from src.database import DatabaseManager
+
+
+class DetectFormatTest(TestCase):
+    def test_detect_format(self):
+        self.assertEqual(transfer.detect_format("a/vitals.csv"), transfer.CSV)
+        self.assertEqual(transfer.detect_format("vitals.ndjson.gz"), transfer.NDJSON)
+        self.assertEqual(transfer.detect_format("vitals.JSONL"), transfer.NDJSON)
+        with self.assertRaises(transfer.InvalidFileError):
+            transfer.detect_format("vitals.xlsx")
+
+
+class RecordReaderTest(TestCase):
+    def test_csv_offsets_resume_after_a_record(self):
+        content = 'patient_id,note\n1,"two\nlines"\n2,short\n\n3,x,extra\n'.encode()
+        records = list(transfer.RecordReader(io.BytesIO(content), transfer.CSV))
+
+        self.assertEqual(records[0][0], {"patient_id": "1", "note": "two\nlines"})
+        self.assertIsInstance(records[2][0], transfer.InvalidFileError)
+
+        resumed = transfer.RecordReader(io.BytesIO(content), transfer.CSV, records[0][1], ["patient_id", "note"])
+        self.assertEqual(next(iter(resumed))[0], {"patient_id": "2", "note": "short"})
+
+    def test_ndjson(self):
+        content = b'{"patient_id": 1}\n\nnot json\n[1]\n{"patient_id": 2}\n'
+        records = [record for record, _ in transfer.RecordReader(io.BytesIO(content), transfer.NDJSON)]
+
+        self.assertEqual(records[0], {"patient_id": 1})
+        self.assertIsInstance(records[1], transfer.InvalidFileError)
+        self.assertIsInstance(records[2], transfer.InvalidFileError)
+        self.assertEqual(records[3], {"patient_id": 2})
+
+
+class ImportExportTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, "transfer.db"))
+        self.db.create_table(
+            table_name="vitals",
+            columns={"record_id": "integer primary key", "patient_id": "integer", "date": "text"}
+        )
+        self.path = os.path.join(self.directory.name, "vitals.ndjson")
+        with open(self.path, "w") as file:
+            for i in range(10):
+                file.write(json.dumps({"patient_id": i, "date": f"2023-01-01T00:00:{i:02d}"}) + "\n")
+
+    @staticmethod
+    def prepare(record):
+        if record["patient_id"] == 4:
+            raise ValueError("patient 4 is invalid")
+        return record
+
+    def rows(self):
+        return self.db.select_record(table_name="vitals", order_by="date").fetchall()
+
+    def test_import_skips_invalid_records(self):
+        result = transfer.import_records(self.db, self.path, self.prepare, batch_size=3)
+
+        self.assertEqual((result.rows, result.skipped, result.resumed), (9, 1, False))
+        self.assertEqual(result.errors, ["record 5: patient 4 is invalid"])
+        self.assertEqual([row[1] for row in self.rows()], [0, 1, 2, 3, 5, 6, 7, 8, 9])
+        self.assertEqual(self.db.execute(f"SELECT count(*) FROM {transfer.CHECKPOINT_TABLE};").fetchone()[0], 0)
+
+    def test_import_resumes_after_a_failure(self):
+        def failing(record):
+            if record["patient_id"] == 7:
+                raise RuntimeError("disk full")
+            return self.prepare(record)
+
+        with self.assertRaises(RuntimeError):
+            transfer.import_records(self.db, self.path, failing, batch_size=3)
+        self.assertEqual([row[1] for row in self.rows()], [0, 1, 2, 3, 5, 6])
+
+        result = transfer.import_records(self.db, self.path, self.prepare, batch_size=3)
+
+        self.assertTrue(result.resumed)
+        self.assertEqual(result.rows, 3)
+        self.assertEqual([row[1] for row in self.rows()], [0, 1, 2, 3, 5, 6, 7, 8, 9])
+
+    def test_export_round_trip(self):
+        transfer.import_records(self.db, self.path, self.prepare)
+
+        for name in ("export.csv", "export.ndjson.gz"):
+            path = os.path.join(self.directory.name, name)
+            result = transfer.export_records(self.db, path, since="2023-01-01T00:00:03", batch_size=2)
+
+            self.assertEqual(result.rows, 6)
+            self.assertFalse(os.path.exists(f"{path}.partial"))
+            with transfer.open_binary(path) as file:
+                records = [record for record, _ in transfer.RecordReader(file, transfer.detect_format(path))]
+            self.assertEqual([str(record["patient_id"]) for record in records], ["3", "5", "6", "7", "8", "9"])
+            self.assertEqual(list(records[0]), ["record_id", "patient_id", "date"])
+
+    def tearDown(self):
+        del self.db
+        self.directory.cleanup()
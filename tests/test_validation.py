@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from src.validation import InvalidRecordError, coerce_vitals, parse_blood_pressure
+
+
+class ParseBloodPressureTest(TestCase):
+    def test_parse_blood_pressure(self):
+        self.assertEqual(parse_blood_pressure("120/80"), (120, 80))
+        self.assertEqual(parse_blood_pressure(" 135 / 85 "), (135, 85))
+
+    def test_parse_invalid_blood_pressure(self):
+        for value in ("120", "120/80/60", "high/low", "-120/80"):
+            with self.assertRaises(InvalidRecordError):
+                parse_blood_pressure(value)
+
+
+class CoerceVitalsTest(TestCase):
+    def test_coerce_vitals(self):
+        self.assertEqual(
+            coerce_vitals({
+                "patient_id": "3",
+                "date": "2023-05-01 10:00:00",
+                "heart_rate": 72.0,
+                "blood_pressure": "120/80",
+                "respiratory_rate": " ",
+                "oxygen_saturation": "97",
+                "temperature": 36.6,
+            }),
+            {
+                "patient_id": 3,
+                "date": "2023-05-01T10:00:00",
+                "heart_rate": 72,
+                "systolic": 120,
+                "diastolic": 80,
+                "respiratory_rate": None,
+                "oxygen_saturation": 97.0,
+                "temperature": 36.6,
+            }
+        )
+
+    def test_coerce_vitals_complete(self):
+        record = coerce_vitals({"patient_id": 3}, complete=True)
+        self.assertEqual(record["patient_id"], 3)
+        self.assertIsNone(record["systolic"])
+        self.assertNotIn("record_id", record)
+
+    def test_invalid_values(self):
+        invalid = [
+            {"patient_id": "abc"},
+            {"patient_id": 1, "heart_rate": "72.5"},
+            {"patient_id": 1, "temperature": "warm"},
+            {"patient_id": 1, "date": "yesterday"},
+            {"patient_id": 1, "mood": "good"},
+            {"heart_rate": 72},
+            {"patient_id": ""},
+        ]
+        for data in invalid:
+            with self.assertRaises(InvalidRecordError):
+                coerce_vitals(data)